@@ -1,32 +1,55 @@
 import os
 from dotenv import load_dotenv
-from files.vectorstores import  MongoVectorStore
+from files.vectorstores import  get_vector_store
 from files.deviation_store import DeviationRepository
 from files.redis_repo import DeviationRedisRepository, DeviationUpstashRedisRepository
 from files.helperfunc import import_data
-from files.agents import llm
+from files.agents import get_llm
 import uuid
 from files.helperfunc import process_description
+from files.llm_scheduler import llm_priority
+from files import ingest_queue
 load_dotenv()
+
+LLM_ERROR_PREFIX = "[LLM ERROR]"
+
+
+class AnalysisFailed(RuntimeError):
+    pass
+
+
+def analyse(description):
+    """The 10-answer analysis; an LLM outage (CustomLLM returns "[LLM ERROR] ...") raises instead of yielding no answers."""
+    #! ingest is bulk work, interactive brainstorming / generation calls go first
+    with llm_priority("bulk"):
+        answers = process_description(description, get_llm("analysis"))
+    if not answers or any(LLM_ERROR_PREFIX in a for a in answers):
+        raise AnalysisFailed(f"analysis returned no answers: {' '.join(answers)[:200] or 'empty response'}")
+    return answers
+
 #! add content to redis and vector store
-def add_data(data: dict):
+def new_deviation_id():
+    return f"DEV-{uuid.uuid4()}"
+
+def add_data(data: dict, deviation_id: str = None):
     print("Adding new deviation data...")
-    vector_store = MongoVectorStore()
+    vector_store = get_vector_store()
     print("1")
     dev_store = DeviationRepository(vector_store)
     print("2")
     redis_repo = DeviationUpstashRedisRepository()
     print("3")  
     # questions_list=import_data('../information/sepQues.json') #!reducing time
-    deviation_id = f"DEV-{uuid.uuid4()}"
+    deviation_id = deviation_id or new_deviation_id()
     print("$")
     description= data["Description"]
     print("%"  )
     root_cause= data["Root Cause"]
-    answer=process_description(description,llm)  
-    answers=[answer]
+    answers=[analyse(description)]
     print("4")
-    dev_store.save_answers(deviation_id, answers)
+    dedup_decision = dev_store.save_answers(deviation_id, answers, source_text=description)
+    if dedup_decision["duplicate_of"]:
+        print(f"{deviation_id} {dedup_decision['action']} as near-duplicate of {dedup_decision['duplicate_of']}")
     redis_repo.save_deviation(
         deviation_id=deviation_id,
         data={
@@ -35,3 +58,68 @@ def add_data(data: dict):
         }
     )
     return deviation_id
+
+#! write-behind path (INGEST_QUEUE=local|redis): /adddata only enqueues, the ingest workers run ingest_batch
+def enqueue_data(data: dict):
+    # fail in the request, not in a worker, when the payload can never be ingested
+    for key in ("Description", "Root Cause"):
+        if key not in data:
+            raise KeyError(key)
+    deviation_id = new_deviation_id()
+    ingest_queue.enqueue(deviation_id, data)
+    return deviation_id
+
+def ingest_batch(records):
+    """
+    add_data for a batch of queued records. The LLM analysis runs per record; the answers of the
+    whole batch are embedded and inserted with one save_many. Finished steps are kept on
+    record.state so a retried record does not repeat them. Returns {deviation_id: exception}.
+    """
+    failures = {}
+    analysed = []
+    for record in records:
+        if "answers" not in record.state:
+            try:
+                # only a usable analysis is kept on the record, a failed one is retried
+                record.state["answers"] = [analyse(record.data["Description"])]
+            except Exception as e:
+                failures[record.id] = e
+                continue
+        analysed.append(record)
+
+    pending = [r for r in analysed if not r.state.get("indexed")]
+    if pending:
+        dev_store = DeviationRepository(get_vector_store())
+        outcomes = dev_store.save_many([(r.id, r.state["answers"], r.data["Description"]) for r in pending])
+        for r, outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                failures[r.id] = outcome
+                continue
+            r.state["indexed"] = True
+            if outcome["duplicate_of"]:
+                print(f"{r.id} {outcome['action']} as near-duplicate of {outcome['duplicate_of']}")
+
+    redis_repo = DeviationUpstashRedisRepository()
+    for record in analysed:
+        if record.id in failures:
+            continue
+        try:
+            redis_repo.save_deviation(
+                deviation_id=record.id,
+                data={
+                    "problem_description": record.data["Description"],
+                    "root_cause": record.data["Root Cause"],
+                }
+            )
+        except Exception as e:
+            failures[record.id] = e
+    return failures
+
+def start_ingest_workers():
+    """Start the background ingest workers when the write-behind queue is enabled (None otherwise)."""
+    queue = ingest_queue.get_ingest_queue()
+    if queue is None or ingest_queue.INGEST_WORKERS <= 0:
+        return None
+    worker = ingest_queue.IngestWorker(queue, ingest_batch)
+    worker.start()
+    return worker
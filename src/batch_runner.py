@@ -0,0 +1,183 @@
+### * importing * ###
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Iterator, Tuple, Callable
+from dotenv import load_dotenv
+from files.llm_scheduler import llm_priority
+load_dotenv()
+
+#! offline batch runner: brain / deviation_generation / add_data over many deviations
+#! every finished item is appended to a checkpoint file, a crashed run resumes where it stopped
+#!   python batch_runner.py brain --input deviations/ --output brain_results.jsonl --workers 4
+
+
+def batch_deviation_id(input_path: str, item_id: str) -> str:
+    # the same input item always gets the same deviation id, so an item that was stored
+    # before a crash (but not checkpointed) overwrites itself on resume instead of duplicating
+    return f"DEV-{uuid.uuid5(uuid.NAMESPACE_URL, f'{os.path.abspath(input_path)}#{item_id}')}"
+
+
+def load_task(mode: str, input_path: str) -> Callable[[str, dict], Any]:
+    # imported per mode so a run only pays for what it uses
+    if mode == "brain":
+        from brainstorming import brain
+        return lambda item_id, payload: brain(payload)
+    if mode == "generate":
+        from gmp_dev_generator import deviation_generation
+        return lambda item_id, payload: deviation_generation(payload)
+    if mode == "add":
+        from add_content import add_data
+        return lambda item_id, payload: add_data(payload, deviation_id=batch_deviation_id(input_path, item_id))
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+def iter_items(path: str) -> Iterator[Tuple[str, dict]]:
+    """Yield (item_id, payload) from a directory of .json files or from a .jsonl file."""
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            if not name.endswith(".json"):
+                continue
+            with open(os.path.join(path, name), "r", encoding="utf-8") as f:
+                yield os.path.splitext(name)[0], json.load(f)
+        return
+
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            item_id = str(record.get("id") or f"line-{line_no}")
+            # lines are either {"id": ..., "data": {...}} or the payload itself
+            yield item_id, record.get("data", record)
+
+
+def load_checkpoint(path: str) -> set:
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                done.add(json.loads(line)["id"])
+    return done
+
+
+def append_line(f, record: Dict[str, Any]):
+    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+def run_item(task: Callable[[str, dict], Any], item_id: str, payload: dict) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        # offline work must not starve interactive requests sharing the LLM scheduler
+        with llm_priority("bulk"):
+            result = task(item_id, payload)
+        status, error = "ok", None
+    except Exception as e:
+        result, status, error = None, "error", f"{type(e).__name__}: {e}"
+    return {
+        "id": item_id,
+        "status": status,
+        "result": result,
+        "error": error,
+        "elapsed_s": round(time.perf_counter() - start, 3),
+    }
+
+
+def run_batch(mode: str, input_path: str, output_path: str, checkpoint_path: str, workers: int) -> Dict[str, Any]:
+    task = load_task(mode, input_path)
+    done = load_checkpoint(checkpoint_path)
+    if done:
+        print(f"Resuming: {len(done)} items already completed")
+
+    latencies = []
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    start = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as out, \
+            open(checkpoint_path, "a", encoding="utf-8") as checkpoint, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+
+        def drain(return_when):
+            nonlocal pending
+            finished, pending = wait(pending, return_when=return_when)
+            for future in finished:
+                record = future.result()
+                append_line(out, record)
+                latencies.append(record["elapsed_s"])
+                counts[record["status"]] += 1
+                if record["status"] == "ok":
+                    # failed items are not checkpointed so a rerun retries them
+                    append_line(checkpoint, {"id": record["id"]})
+                print(f"[{record['status']}] {record['id']} ({record['elapsed_s']}s)")
+
+        try:
+            for item_id, payload in iter_items(input_path):
+                if item_id in done:
+                    counts["skipped"] += 1
+                    continue
+                # keep at most 2x workers items in memory, inputs can be large
+                if len(pending) >= workers * 2:
+                    drain(FIRST_COMPLETED)
+                pending.add(pool.submit(run_item, task, item_id, payload))
+            while pending:
+                drain(FIRST_COMPLETED)
+        except KeyboardInterrupt:
+            for future in pending:
+                future.cancel()
+            print("Interrupted, completed items are checkpointed; rerun the same command to resume")
+            raise
+
+    elapsed = time.perf_counter() - start
+    processed = counts["ok"] + counts["error"]
+    summary = {
+        "mode": mode,
+        "processed": processed,
+        "ok": counts["ok"],
+        "failed": counts["error"],
+        "skipped": counts["skipped"],
+        "workers": workers,
+        "wall_time_s": round(elapsed, 2),
+        "items_per_min": round(processed / elapsed * 60, 2) if elapsed > 0 else 0.0,
+        "item_latency_p50_s": round(statistics.median(latencies), 3) if latencies else None,
+        "item_latency_p95_s": round(statistics.quantiles(latencies, n=20)[-1], 3) if len(latencies) >= 2 else None,
+    }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the GMP deviation pipeline over a batch of inputs")
+    parser.add_argument("mode", choices=["brain", "generate", "add"])
+    parser.add_argument("--input", required=True, help="Directory of .json files or a .jsonl file")
+    parser.add_argument("--output", required=True, help="JSONL file results are appended to")
+    parser.add_argument("--checkpoint", default=None, help="Checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("BATCH_WORKERS", 4)))
+    args = parser.parse_args()
+
+    summary = run_batch(
+        mode=args.mode,
+        input_path=args.input,
+        output_path=args.output,
+        checkpoint_path=args.checkpoint or f"{args.output}.checkpoint",
+        workers=max(1, args.workers),
+    )
+
+    print("\nBatch summary")
+    for key, value in summary.items():
+        print(f"  {key:<20}{value}")
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Tokens and latency of crewai kickoff vs the direct single-shot executor.
+
+Both paths share the same CustomLLM (LLM_MODEL / LLM_BASE_URL / LLM_API_KEY),
+token counts come from the usage block the endpoint returns. Run from src:
+
+    python benchmarks/bench_executor.py --agent summarizer --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from files import agents  # noqa: E402
+from files.executor import DirectAgentExecutor  # noqa: E402
+
+SAMPLE_QA = {
+    "What happened?": "During compression of batch B-2291 the tablet press tripped on high "
+                      "punch force and 4,000 tablets were produced out of hardness specification.",
+    "Immediate action?": "Line stopped, affected tablets segregated and labelled on hold, QA notified.",
+    "Was the SOP followed?": "In-process checks were performed every 30 minutes instead of every 15 "
+                             "minutes as required by SOP-PRD-014.",
+}
+
+
+def build_query(agent_name: str) -> str:
+    if agent_name == "summarizer":
+        return f"Summarise the following GMP deviation Q/A pairs for expert review.\nQ/A: {SAMPLE_QA}"
+    return ("Write the root cause brainstorming for this deviation in markdown, "
+            f"strictly as instructed.\nContext: {SAMPLE_QA}")
+
+
+def run_path(name: str, runner, query: str, llm, runs: int):
+    latencies, prompt_tokens, completion_tokens = [], [], []
+    for _ in range(runs):
+        before = llm.usage_snapshot()
+        start = time.perf_counter()
+        output = runner.kickoff(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        after = llm.usage_snapshot()
+        prompt_tokens.append(after["prompt_tokens"] - before["prompt_tokens"])
+        completion_tokens.append(after["completion_tokens"] - before["completion_tokens"])
+        _ = output.raw
+    return {
+        "path": name,
+        "runs": runs,
+        "latency_ms_median": round(statistics.median(latencies), 1),
+        "latency_ms_max": round(max(latencies), 1),
+        "prompt_tokens_mean": round(statistics.mean(prompt_tokens), 1),
+        "completion_tokens_mean": round(statistics.mean(completion_tokens), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare crewai kickoff with the direct executor")
+    parser.add_argument("--agent", choices=["summarizer", "instruction"], default="summarizer")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--query-file", default=None, help="Use the contents of this file as the query")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    if args.query_file:
+        with open(args.query_file, "r", encoding="utf-8") as f:
+            query = f.read()
+    else:
+        query = build_query(args.agent)
+
+    llm = agents.get_llm("summary" if args.agent == "summarizer" else "rca")
+    agent = agents.get_summarizer_agent() if args.agent == "summarizer" else agents.get_instruction_agent()
+    direct = DirectAgentExecutor.from_agent(agent, llm=llm)
+
+    report = [
+        run_path("crewai_kickoff", agent, query, llm, args.runs),
+        run_path("direct", direct, query, llm, args.runs),
+    ]
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{'path':<16}{'median ms':>12}{'max ms':>10}{'prompt tok':>12}{'completion tok':>16}")
+    for row in report:
+        print(f"{row['path']:<16}{row['latency_ms_median']:>12}{row['latency_ms_max']:>10}"
+              f"{row['prompt_tokens_mean']:>12}{row['completion_tokens_mean']:>16}")
+
+
+if __name__ == "__main__":
+    main()
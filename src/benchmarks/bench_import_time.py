@@ -0,0 +1,88 @@
+"""
+Import-time budget for the API module.
+
+Runs `import main` in fresh interpreters (cold module cache) and fails when the
+median wall time exceeds the budget or when any heavy dependency is imported
+eagerly. Run from the src directory:
+
+    python benchmarks/bench_import_time.py --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from files.warmup import HEAVY_MODULES  # noqa: E402
+
+
+def measure_once(module: str):
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SRC_DIR,
+        capture_output=True,
+        text=True,
+        env={**os.environ, "STARTUP_MODE": "lazy", "STARTUP_PREWARM": "0"},
+    )
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+    return elapsed_ms, parse_importtime(proc.stderr)
+
+
+def parse_importtime(stderr: str):
+    # lines look like: "import time:       123 |       4567 |   package.module"
+    imports = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cumulative = int(parts[1].strip())
+        except ValueError:
+            continue
+        imports[parts[2].strip()] = cumulative
+    return imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold import time of the API module")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_MS", 1500)))
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    timings, imports = [], {}
+    for _ in range(args.runs):
+        elapsed_ms, imports = measure_once(args.module)
+        timings.append(elapsed_ms)
+
+    median_ms = statistics.median(timings)
+    eager_heavy = sorted(m for m in HEAVY_MODULES if m in imports)
+
+    print(f"import {args.module}: median {median_ms:.0f} ms over {args.runs} runs "
+          f"(min {min(timings):.0f} ms, max {max(timings):.0f} ms, budget {args.budget_ms:.0f} ms)")
+    print(f"top {args.top} imports by cumulative time:")
+    for name, cumulative in sorted(imports.items(), key=lambda x: x[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name}")
+
+    failed = False
+    if eager_heavy:
+        print(f"FAIL: heavy modules imported at startup: {', '.join(eager_heavy)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: median import time {median_ms:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+        failed = True
+    if not failed:
+        print("OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
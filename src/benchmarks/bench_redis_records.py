@@ -0,0 +1,175 @@
+"""
+Payload bytes and read latency of deviation records, before and after compact
+encoding / the near-cache.
+
+    python benchmarks/bench_redis_records.py --backend memory --rtt-ms 40
+    python benchmarks/bench_redis_records.py --backend local      # redis on localhost:6379
+    python benchmarks/bench_redis_records.py --backend upstash    # UPSTASH_REDIS_URL / _TOKEN
+
+The memory backend is a dict with a simulated round trip, for comparing the
+near-cache without a server.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from files import redis_repo  # noqa: E402
+from files.near_cache import TTLCache  # noqa: E402
+
+WORDS = ("deviation batch tablet press punch force hardness granulation HVAC pressure differential "
+         "line clearance label SOP operator training calibration excursion investigation CAPA").split()
+
+
+class MemoryClient:
+    def __init__(self, rtt_ms: float):
+        self.data = {}
+        self.rtt = rtt_ms / 1000
+
+    def _wait(self):
+        time.sleep(self.rtt)
+
+    def set(self, key, value):
+        self._wait()
+        self.data[key] = value
+
+    def get(self, key):
+        self._wait()
+        value = self.data.get(key)
+        return value if isinstance(value, str) else None
+
+    def delete(self, key):
+        self._wait()
+        self.data.pop(key, None)
+
+    def hgetall(self, key):
+        self._wait()
+        value = self.data.get(key)
+        return dict(value) if isinstance(value, dict) else {}
+
+    def hget(self, key, field):
+        self._wait()
+        value = self.data.get(key)
+        return value.get(field) if isinstance(value, dict) else None
+
+
+class AsyncMemoryClient:
+    """Async facade over a MemoryClient, for the repository's a* methods."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class MemoryRepository(redis_repo._DeviationRecordRepository):
+    def __init__(self, rtt_ms: float):
+        self.client = MemoryClient(rtt_ms)
+        self._init_cache()
+
+    def _hset(self, key, mapping):
+        self.client._wait()
+        self.client.data[key] = dict(mapping)
+
+    def _async_client(self):
+        return AsyncMemoryClient(self.client)
+
+    async def _ahset(self, key, mapping):
+        self._hset(key, mapping)
+
+
+def make_record(rng: random.Random, words: int):
+    return {
+        "problem_description": " ".join(rng.choice(WORDS) for _ in range(words)),
+        "root_cause": " ".join(rng.choice(WORDS) for _ in range(words // 4)),
+    }
+
+
+def build_repo(backend: str, rtt_ms: float):
+    if backend == "local":
+        return redis_repo.DeviationRedisRepository()
+    if backend == "upstash":
+        return redis_repo.DeviationUpstashRedisRepository()
+    return MemoryRepository(rtt_ms)
+
+
+def payload_report(records):
+    legacy = [len(json.dumps(r).encode("utf-8")) for r in records]
+    redis_repo.REDIS_ZSTD = False
+    compact = [len(redis_repo.encode_value(r)) for r in records]
+    report = {
+        "legacy_json_bytes_mean": round(statistics.mean(legacy)),
+        "orjson_bytes_mean": round(statistics.mean(compact)),
+    }
+    try:
+        import zstandard  # noqa: F401
+        redis_repo.REDIS_ZSTD = True
+        zstd = [len(redis_repo.encode_value(r)) for r in records]
+        report["zstd_b64_bytes_mean"] = round(statistics.mean(zstd))
+    except ImportError:
+        report["zstd_b64_bytes_mean"] = "zstandard not installed"
+    finally:
+        redis_repo.REDIS_ZSTD = False
+    return report
+
+
+def read_latency(repo, ids, rounds: int, field=None):
+    timings = []
+    for _ in range(rounds):
+        for deviation_id in ids:
+            start = time.perf_counter()
+            if field:
+                repo.get_field(deviation_id, field)
+            else:
+                repo.get_deviation(deviation_id)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "p50_ms": round(timings[len(timings) // 2], 3),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark deviation record encoding and reads")
+    parser.add_argument("--backend", choices=["memory", "local", "upstash"], default="memory")
+    parser.add_argument("--rtt-ms", type=float, default=40.0, help="Simulated round trip (memory backend)")
+    parser.add_argument("--records", type=int, default=50)
+    parser.add_argument("--words", type=int, default=600, help="Words per problem description")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    records = [make_record(rng, args.words) for _ in range(args.records)]
+    ids = [f"BENCH-{i}" for i in range(args.records)]
+    report = {"payload": payload_report(records), "reads": {}}
+
+    repo = build_repo(args.backend, args.rtt_ms)
+    for layout in ("string", "hash"):
+        repo.layout = layout
+        for deviation_id, record in zip(ids, records):
+            repo.save_deviation(deviation_id, record)
+        repo.near_cache = TTLCache(0)
+        report["reads"][f"{layout}_no_cache"] = read_latency(repo, ids, args.rounds)
+        if layout == "hash":
+            report["reads"]["hash_root_cause_only"] = read_latency(repo, ids, args.rounds, field="root_cause")
+        repo.near_cache = TTLCache(len(ids))
+        read_latency(repo, ids, 1)  # warm up: steady-state hits are what the cache is for
+        report["reads"][f"{layout}_near_cache"] = read_latency(repo, ids, args.rounds)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
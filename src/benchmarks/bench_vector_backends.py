@@ -0,0 +1,150 @@
+"""
+Ingest throughput and query latency of the VectorStore backends at several corpus sizes.
+
+All backends get the same Embedder. By default it is a local hash embedder, so
+the numbers measure the store and not the embeddings API. Use --embedder
+project to go through the configured OpenAI embedder instead.
+
+    python benchmarks/bench_vector_backends.py --backends memory,chroma --sizes 1000,10000,50000
+    python benchmarks/bench_vector_backends.py --backends mongo --sizes 1000   # MONGO_URI / MONGO_DB
+
+Mongo writes into a throw-away collection (bench_vectors_<pid>) and Chroma into
+a temporary directory. Both are removed afterwards.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from files.embedding import Embedder  # noqa: E402
+from files import vectorstores  # noqa: E402
+
+WORDS = ("deviation batch tablet press punch force hardness granulation HVAC pressure differential "
+         "line clearance label SOP operator training calibration excursion investigation CAPA").split()
+
+
+class HashEmbedder(Embedder):
+    """Deterministic pseudo-random vectors, no network."""
+
+    def __init__(self, dimensions: int):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        vectors = []
+        for text in texts:
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            vectors.append([rng.gauss(0, 1) for _ in range(self.dimensions)])
+        return vectors
+
+
+def build_store(backend: str, embedder: Embedder, workdir: str):
+    if backend == "memory":
+        return vectorstores.InMemoryVectorStore(embedder=embedder), None
+    if backend == "chroma":
+        from files.chroma import ChromaDBManager
+
+        path = os.path.join(workdir, "chroma")
+        return ChromaDBManager("bench_vectors", persist_dir=path, embedder=embedder), None
+    if backend == "mongo":
+        store = vectorstores.MongoVectorStore(embedder=embedder, collection_name=f"bench_vectors_{os.getpid()}")
+        return store, store.collection.drop
+    raise ValueError(f"Unknown backend: {backend}")
+
+
+def make_corpus(rng: random.Random, size: int):
+    texts = [" ".join(rng.choice(WORDS) for _ in range(40)) for _ in range(size)]
+    ids = [f"BENCH-{i}_1" for i in range(size)]
+    metas = [{"summary_id": f"BENCH-{i}", "answer": text} for i, text in enumerate(texts)]
+    return texts, metas, ids
+
+
+def bench(backend: str, size: int, embedder: Embedder, batch_size: int, queries: int, top_k: int, seed: int):
+    rng = random.Random(seed)
+    texts, metas, ids = make_corpus(rng, size)
+    # embeddings are computed up front and cached so ingest time is the store's own
+    cache = dict(zip(texts, embedder.embed(texts)))
+
+    class CachedEmbedder(Embedder):
+        def embed(self, batch):
+            missing = [t for t in batch if t not in cache]
+            if missing:
+                cache.update(zip(missing, embedder.embed(missing)))
+            return [cache[t] for t in batch]
+
+    workdir = tempfile.mkdtemp(prefix="bench_vectors_")
+    store, cleanup = build_store(backend, CachedEmbedder(), workdir)
+    try:
+        start = time.perf_counter()
+        for i in range(0, size, batch_size):
+            store.add(texts[i:i + batch_size], metas[i:i + batch_size], ids[i:i + batch_size])
+        ingest_s = time.perf_counter() - start
+
+        query_texts = [" ".join(rng.choice(WORDS) for _ in range(40)) for _ in range(queries)]
+        CachedEmbedder().embed(query_texts)
+        store.query(query_texts[0], top_k)  # first query pays for lazy setup
+        latencies = []
+        for text in query_texts:
+            start = time.perf_counter()
+            store.query(text, top_k)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        if cleanup is not None:
+            cleanup()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "backend": backend,
+        "corpus": size,
+        "ingest_docs_per_s": round(size / ingest_s, 1) if ingest_s > 0 else None,
+        "ingest_s": round(ingest_s, 3),
+        "query_ms_p50": round(statistics.median(latencies), 2),
+        "query_ms_p95": round(statistics.quantiles(latencies, n=20)[-1], 2) if len(latencies) >= 2 else None,
+        "query_ms_max": round(max(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare VectorStore backends")
+    parser.add_argument("--backends", default="memory,chroma,mongo")
+    parser.add_argument("--sizes", default="1000,10000")
+    parser.add_argument("--embedder", choices=["hash", "project"], default="hash")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Hash embedder dimensions")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    embedder = HashEmbedder(args.dimensions) if args.embedder == "hash" else vectorstores.default_embedder()
+    results = []
+    for backend in [b.strip() for b in args.backends.split(",") if b.strip()]:
+        for size in [int(s) for s in args.sizes.split(",") if s.strip()]:
+            try:
+                results.append(bench(backend, size, embedder, args.batch_size, args.queries, args.top_k, args.seed))
+            except ImportError as e:
+                print(f"skipping {backend}: {e}", file=sys.stderr)
+                break
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    header = f"{'backend':<8}{'corpus':>9}{'ingest docs/s':>15}{'query p50 ms':>14}{'query p95 ms':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(f"{r['backend']:<8}{r['corpus']:>9}{r['ingest_docs_per_s']:>15}"
+              f"{r['query_ms_p50']:>14}{str(r['query_ms_p95']):>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,540 @@
+"""
+Concurrency load test for main.app against local stand-ins.
+
+The app is served by uvicorn in-process. LLM and embedding calls go to a fake
+OpenAI-compatible server with configurable latency. Mongo and Upstash are
+replaced by the in-memory vector backend and an in-memory Redis unless
+--vector-backend / --redis say otherwise.
+Requests are then driven by a closed loop of N workers, N rising per level.
+
+    python benchmarks/load_test.py --levels 1,2,4,8,16 --duration 20
+    python benchmarks/load_test.py --mix brainstorming=6,adddata=3,gmpgeneration=1 \\
+        --llm-latency-ms 800 --output load_report.json --baseline previous_report.json
+
+The report is JSON. It holds throughput, latency percentiles and error rate per
+level and per endpoint, plus the saturation point: the last level before
+throughput stops growing, errors exceed --max-error-rate or p95 exceeds --p95-slo-ms.
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import math
+import os
+import platform
+import random
+import secrets
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+ENDPOINTS = ("brainstorming", "adddata", "gmpgeneration")
+
+WORDS = ("deviation batch tablet press punch force hardness granulation HVAC pressure differential "
+         "line clearance label SOP operator training calibration excursion investigation CAPA").split()
+
+
+def log(message: str):
+    # app code prints to stdout, which is silenced during the run
+    print(message, file=sys.stderr, flush=True)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+### * fake OpenAI-compatible server * ###
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = {}
+
+    def log_message(self, *args):
+        pass
+
+    def _sleep(self, mean_ms: float, jitter_ms: float):
+        delay = max(0.0, random.gauss(mean_ms, jitter_ms)) if jitter_ms else mean_ms
+        time.sleep(delay / 1000)
+
+    def _reply(self, body: dict):
+        raw = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        try:
+            self.wfile.write(raw)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout, deadline, cancelled request)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.endswith("/chat/completions"):
+            self._chat(request)
+        elif self.path.endswith("/embeddings"):
+            self._embeddings(request)
+        else:
+            self.send_error(404)
+
+    def _chat(self, request: dict):
+        cfg = self.config
+        self._sleep(cfg["llm_latency_ms"], cfg["llm_jitter_ms"])
+        prompt_chars = sum(len(str(m.get("content", ""))) for m in request.get("messages", []))
+        rng = random.Random(prompt_chars)
+        content = " ".join(rng.choice(WORDS) for _ in range(cfg["completion_words"]))
+        prompt_tokens = prompt_chars // 4
+        completion_tokens = len(content) // 4
+        self._reply({
+            "id": "chatcmpl-load-test",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+    def _embeddings(self, request: dict):
+        cfg = self.config
+        self._sleep(cfg["embed_latency_ms"], 0)
+        inputs = request.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dims = request.get("dimensions") or cfg["embedding_dim"]
+        data = []
+        for i, text in enumerate(inputs):
+            # deterministic per text so repeated queries score the same documents
+            rng = random.Random(hashlib.sha256(str(text).encode("utf-8")).digest())
+            data.append({"object": "embedding", "index": i, "embedding": [rng.uniform(-1, 1) for _ in range(dims)]})
+        self._reply({
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "fake"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+
+def start_fake_openai(config: dict) -> ThreadingHTTPServer:
+    FakeOpenAIHandler.config = config
+    server = ThreadingHTTPServer(("127.0.0.1", free_port()), FakeOpenAIHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+### * in-memory stand-in for Upstash * ###
+
+def memory_repository():
+    from files.redis_repo import _DeviationRecordRepository
+
+    class MemoryClient:
+        def __init__(self):
+            self.data = {}
+
+        def set(self, key, value):
+            self.data[key] = value
+
+        def get(self, key):
+            value = self.data.get(key)
+            return value if isinstance(value, str) else None
+
+        def delete(self, key):
+            self.data.pop(key, None)
+
+        def hgetall(self, key):
+            value = self.data.get(key)
+            return dict(value) if isinstance(value, dict) else {}
+
+        def hget(self, key, field):
+            value = self.data.get(key)
+            return value.get(field) if isinstance(value, dict) else None
+
+    class AsyncMemoryClient:
+        """Async facade over a MemoryClient, for the repository's a* methods."""
+
+        def __init__(self, client):
+            self.client = client
+
+        def __getattr__(self, name):
+            method = getattr(self.client, name)
+
+            async def call(*args, **kwargs):
+                return method(*args, **kwargs)
+            return call
+
+    shared_client = MemoryClient()
+
+    class MemoryRepository(_DeviationRecordRepository):
+        def __init__(self, *args, **kwargs):
+            self.client = shared_client
+            self._init_cache()
+
+        def _hset(self, key, mapping):
+            self.client.data[key] = dict(mapping)
+
+        def _async_client(self):
+            return AsyncMemoryClient(shared_client)
+
+        async def _ahset(self, key, mapping):
+            self._hset(key, mapping)
+
+    return MemoryRepository
+
+
+def install_redis(redis: str):
+    """Point brainstorming / add_content at the selected Redis stand-in."""
+    import brainstorming
+    import add_content
+
+    if redis == "memory":
+        repository = memory_repository()
+    elif redis == "local":
+        from files.redis_repo import DeviationRedisRepository as repository
+    else:
+        return
+    for module in (brainstorming, add_content):
+        module.DeviationUpstashRedisRepository = repository
+
+
+def seed_corpus(size: int, seed: int):
+    """Write `size` deviations straight into the (patched) stores, without LLM calls."""
+    import add_content
+    from files.deviation_store import DeviationRepository
+    from files.vectorstores import get_vector_store
+
+    if size <= 0:
+        return
+    rng = random.Random(seed)
+    dev_store = DeviationRepository(get_vector_store())
+    redis_repo = add_content.DeviationUpstashRedisRepository()
+    for i in range(size):
+        deviation_id = f"DEV-seed-{i}"
+        description = " ".join(rng.choice(WORDS) for _ in range(60))
+        dev_store.save_answers(deviation_id, [" ".join(rng.choice(WORDS) for _ in range(40))])
+        redis_repo.save_deviation(deviation_id, {
+            "problem_description": description,
+            "root_cause": " ".join(rng.choice(WORDS) for _ in range(15)),
+        })
+
+
+### * payloads * ###
+
+def default_payloads():
+    from files.helperfunc import load_active_prompts
+
+    # /gmpgeneration needs every section the active prompt sheet refers to
+    sections = []
+    for section, _, _ in load_active_prompts("prompts/Prompts Output 1 1.xlsx"):
+        if section not in sections:
+            sections.append(section)
+    description = ("During compression of batch B-2291 the tablet press tripped on high punch force and "
+                   "4,000 tablets were produced out of hardness specification. Line stopped, tablets "
+                   "segregated on hold, QA notified. In-process checks were done every 30 minutes "
+                   "instead of every 15 minutes as required by SOP-PRD-014.")
+    return {
+        "brainstorming": {"Problem Description and Immediate Action": description},
+        "adddata": {"Description": description, "Root Cause": "Punch wear not detected, PM overdue."},
+        "gmpgeneration": {section: {"Q": f"What is known about {section}?", "A": description}
+                          for section in sections},
+    }
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint in mix: {name}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("Mix has no positive weight")
+    return mix
+
+
+### * driver * ###
+
+def percentile(values, pct: float):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return round(ordered[rank], 1)
+
+
+def summarize(samples, elapsed: float) -> dict:
+    latencies = [s["latency_ms"] for s in samples]
+    errors = sum(1 for s in samples if not s["ok"])
+    ok = len(samples) - errors
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4) if samples else 0.0,
+        "throughput_rps": round(ok / elapsed, 3) if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies), 1) if latencies else None,
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 1) if latencies else None,
+        },
+    }
+
+
+def run_level(base_url: str, concurrency: int, duration: float, mix: dict, payloads: dict,
+              timeout: float, seed: int) -> dict:
+    import requests
+
+    names = list(mix)
+    weights = [mix[n] for n in names]
+    samples = []
+    samples_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker(worker_id: int):
+        rng = random.Random(seed * 1000 + worker_id)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(names, weights)[0]
+            start = time.perf_counter()
+            try:
+                response = session.post(f"{base_url}/{endpoint}", json={"data": payloads[endpoint]}, timeout=timeout)
+                ok, status = response.status_code == 200, response.status_code
+            except requests.RequestException as e:
+                ok, status = False, type(e).__name__
+            sample = {"endpoint": endpoint, "ok": ok, "status": status,
+                      "latency_ms": (time.perf_counter() - start) * 1000}
+            with samples_lock:
+                samples.append(sample)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # in-flight requests finish after the deadline, count their time as well
+    elapsed = time.perf_counter() - start
+
+    result = {"concurrency": concurrency, "duration_s": round(elapsed, 2), **summarize(samples, elapsed)}
+    result["endpoints"] = {
+        name: summarize([s for s in samples if s["endpoint"] == name], elapsed)
+        for name in names if any(s["endpoint"] == name for s in samples)
+    }
+    statuses = {}
+    for s in samples:
+        if not s["ok"]:
+            statuses[str(s["status"])] = statuses.get(str(s["status"]), 0) + 1
+    result["error_statuses"] = statuses
+    return result
+
+
+def find_saturation(levels, min_gain: float, max_error_rate: float, p95_slo_ms) -> dict:
+    """Last level that still scaled; `reason` says what gave out at the next one."""
+    best = None
+    for level in levels:
+        reason = None
+        if level["error_rate"] > max_error_rate:
+            reason = "error_rate"
+        elif p95_slo_ms and (level["latency_ms"]["p95"] or 0) > p95_slo_ms:
+            reason = "p95_slo"
+        elif best is not None and level["throughput_rps"] < best["throughput_rps"] * (1 + min_gain):
+            reason = "throughput_plateau"
+        if reason:
+            return {
+                "concurrency": best["concurrency"] if best else None,
+                "throughput_rps": best["throughput_rps"] if best else None,
+                "p95_ms": best["latency_ms"]["p95"] if best else None,
+                "reason": reason,
+                "at_concurrency": level["concurrency"],
+            }
+        best = level
+    return {
+        "concurrency": best["concurrency"] if best else None,
+        "throughput_rps": best["throughput_rps"] if best else None,
+        "p95_ms": best["latency_ms"]["p95"] if best else None,
+        "reason": "not_reached",
+        "at_concurrency": None,
+    }
+
+
+def compare_with_baseline(report: dict, baseline_path: str) -> dict:
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {level["concurrency"]: level for level in baseline.get("levels", [])}
+    deltas = []
+    for level in report["levels"]:
+        old = previous.get(level["concurrency"])
+        if old is None:
+            continue
+        deltas.append({
+            "concurrency": level["concurrency"],
+            "throughput_rps": [old["throughput_rps"], level["throughput_rps"]],
+            "p95_ms": [old["latency_ms"]["p95"], level["latency_ms"]["p95"]],
+            "error_rate": [old["error_rate"], level["error_rate"]],
+        })
+    return {
+        "baseline": baseline_path,
+        "baseline_commit": baseline.get("meta", {}).get("git_commit"),
+        "saturation_concurrency": [
+            baseline.get("saturation", {}).get("concurrency"), report["saturation"]["concurrency"]
+        ],
+        "levels": deltas,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SRC_DIR,
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def start_app(port: int):
+    import uvicorn
+    from main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn exited during startup")
+        time.sleep(0.05)
+    return server, thread
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the FastAPI app at rising concurrency")
+    parser.add_argument("--levels", default="1,2,4,8,16,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20, help="Seconds per level")
+    parser.add_argument("--mix", default="brainstorming=6,adddata=3,gmpgeneration=1",
+                        help="endpoint=weight pairs")
+    parser.add_argument("--payloads", default=None,
+                        help="JSON file with a payload per endpoint (default: built-in samples)")
+    parser.add_argument("--llm-latency-ms", type=float, default=500)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100)
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--completion-words", type=int, default=200)
+    parser.add_argument("--embedding-dim", type=int, default=256)
+    parser.add_argument("--vector-backend", choices=["memory", "mongo", "chroma"], default="memory",
+                        help="VECTOR_BACKEND for the run (mongo: MONGO_URI, e.g. a local mongod)")
+    parser.add_argument("--redis", choices=["memory", "local", "upstash"], default="memory",
+                        help="local: redis on localhost:6379, upstash: UPSTASH_REDIS_URL / _TOKEN")
+    parser.add_argument("--corpus", type=int, default=500, help="Deviations seeded before the run")
+    parser.add_argument("--section-cache", default="off", help="GMP_SECTION_CACHE for the run")
+    parser.add_argument("--timeout", type=float, default=300, help="Per-request timeout in seconds")
+    parser.add_argument("--min-gain", type=float, default=0.05,
+                        help="Throughput gain below which a level counts as a plateau")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    parser.add_argument("--p95-slo-ms", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="load_report.json")
+    parser.add_argument("--baseline", default=None, help="Earlier report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's stdout")
+    args = parser.parse_args()
+
+    levels = sorted({int(x) for x in args.levels.split(",") if x.strip()})
+    mix = parse_mix(args.mix)
+    os.chdir(SRC_DIR)  # prompt sheets are read relative to src
+
+    fake = start_fake_openai({
+        "llm_latency_ms": args.llm_latency_ms,
+        "llm_jitter_ms": args.llm_jitter_ms,
+        "embed_latency_ms": args.embed_latency_ms,
+        "completion_words": args.completion_words,
+        "embedding_dim": args.embedding_dim,
+    })
+    fake_url = f"http://127.0.0.1:{fake.server_address[1]}/v1"
+    # must be set before the app modules read their configuration
+    os.environ.update({
+        "LLM_BASE_URL": fake_url,
+        "LLM_API_KEY": "load-test",
+        "LLM_MODEL": os.environ.get("LLM_MODEL", "load-test-model"),
+        "OPENAI_BASE_URL": fake_url,
+        "OPENAI_API_KEY": "load-test",
+        "GMP_SECTION_CACHE": args.section_cache,
+        "VECTOR_BACKEND": args.vector_backend,
+    })
+    for task in ("summary", "analysis", "section", "rca", "capa"):
+        # a .env with per-task routes must not send load-test traffic to real endpoints
+        os.environ[f"LLM_ROUTE_{task.upper()}_BASE_URL"] = fake_url
+        os.environ[f"LLM_ROUTE_{task.upper()}_API_KEY"] = "load-test"
+    os.environ.setdefault("EMBEDDING_DIMENSIONS", str(args.embedding_dim))
+    # /metrics is admin-only
+    os.environ.setdefault("ADMIN_TOKEN", secrets.token_hex(16))
+
+    with contextlib.ExitStack() as stack:
+        if not args.verbose:
+            stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+
+        install_redis(args.redis)
+        log(f"Seeding {args.corpus} deviations ...")
+        seed_corpus(args.corpus, args.seed)
+        payloads = default_payloads()
+        if args.payloads:
+            with open(args.payloads, "r", encoding="utf-8") as f:
+                payloads.update(json.load(f))
+
+        port = free_port()
+        server, thread = start_app(port)
+        base_url = f"http://127.0.0.1:{port}"
+
+        results = []
+        try:
+            for concurrency in levels:
+                log(f"Concurrency {concurrency} for {args.duration:.0f}s ...")
+                level = run_level(base_url, concurrency, args.duration, mix, payloads, args.timeout, args.seed)
+                results.append(level)
+                log(f"  {level['throughput_rps']} req/s, p50 {level['latency_ms']['p50']} ms, "
+                    f"p95 {level['latency_ms']['p95']} ms, errors {level['error_rate']:.2%}")
+            import requests
+            app_metrics = requests.get(
+                f"{base_url}/metrics", headers={"x-admin-token": os.environ["ADMIN_TOKEN"]}, timeout=10
+            ).json()
+        finally:
+            server.should_exit = True
+            thread.join(timeout=10)
+            fake.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "verbose")},
+        },
+        "levels": results,
+        "saturation": find_saturation(results, args.min_gain, args.max_error_rate, args.p95_slo_ms),
+        "app_metrics": app_metrics,
+    }
+    if args.baseline:
+        report["comparison"] = compare_with_baseline(report, args.baseline)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+
+    saturation = report["saturation"]
+    log(f"\nSaturation: concurrency {saturation['concurrency']} "
+        f"({saturation['throughput_rps']} req/s, p95 {saturation['p95_ms']} ms), reason: {saturation['reason']}")
+    log(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
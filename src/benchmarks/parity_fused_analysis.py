@@ -0,0 +1,155 @@
+"""
+Quality parity of the fused brain analysis (BRAIN_FUSED_ANALYSIS=1) against the two-call path.
+
+Both paths run on every input: summary_qa followed by process_description, then
+fused_analysis. For each input the script compares:
+  - the answers parsed (the fused path must yield all 10),
+  - embedding similarity of the summaries and of each answer pair,
+  - the overlap of the deviations retrieved with either answer set,
+  - latency and tokens.
+
+    python benchmarks/parity_fused_analysis.py --input deviations/ --output parity.json
+    python benchmarks/parity_fused_analysis.py --input brain_inputs.jsonl --limit 20 --top-k 5
+
+Inputs use the batch_runner layout (a directory of .json files or a .jsonl file)
+and carry "Problem Description and Immediate Action". The exit status is 1 when
+the averages fall below --min-answer-similarity or --min-retrieval-overlap.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from batch_runner import iter_items  # noqa: E402
+from files.agents import get_llm  # noqa: E402
+from files.brainstorminghelper import summary_qa, fused_analysis  # noqa: E402
+from files.helperfunc import process_description  # noqa: E402
+from files.vectorstores import get_vector_store, default_embedder, cosine_similarity  # noqa: E402
+from files.deviation_store import DeviationSimilarityService  # noqa: E402
+
+DESCRIPTION_KEY = "Problem Description and Immediate Action"
+
+
+def usage(llms):
+    # the two paths use the summary and analysis routes, which may be different models
+    snapshots = [llm.usage_snapshot() for llm in llms]
+    return {key: sum(s[key] for s in snapshots) for key in ("calls", "total_tokens")}
+
+
+def timed(llms, fn, *args):
+    before = usage(llms)
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    after = usage(llms)
+    return result, {
+        "latency_ms": round(elapsed_ms, 1),
+        "llm_calls": after["calls"] - before["calls"],
+        "total_tokens": after["total_tokens"] - before["total_tokens"],
+    }
+
+
+def two_call(description):
+    summary = summary_qa(description)
+    return summary, process_description(summary, get_llm("analysis"))
+
+
+def retrieved_ids(service, answers, top_k):
+    ids = set()
+    for result in service.find_similar([answers], top_k=top_k):
+        for hit in result["matches"]:
+            ids.add(hit.get("metadata", {}).get("summary_id") or hit.get("id"))
+    return ids
+
+
+def compare(item_id, description, embedder, service, top_k):
+    llms = [get_llm("summary"), get_llm("analysis")]
+    (base_summary, base_answers), base_cost = timed(llms, two_call, description)
+    (fused_summary, fused_answers), fused_cost = timed(llms, fused_analysis, description)
+
+    texts = [base_summary, fused_summary or " "]
+    pairs = list(zip(base_answers, fused_answers))
+    for base, fused in pairs:
+        texts += [base, fused]
+    vectors = embedder.embed(texts)
+    summary_similarity = float(cosine_similarity(vectors[0], vectors[1]))
+    answer_similarity = [
+        float(cosine_similarity(vectors[2 + 2 * i], vectors[3 + 2 * i])) for i in range(len(pairs))
+    ]
+
+    base_ids = retrieved_ids(service, base_answers, top_k)
+    fused_ids = retrieved_ids(service, fused_answers, top_k) if fused_answers else set()
+    union = base_ids | fused_ids
+    return {
+        "id": item_id,
+        "two_call": {**base_cost, "answers": len(base_answers)},
+        "fused": {**fused_cost, "answers": len(fused_answers), "summary_parsed": bool(fused_summary)},
+        "summary_similarity": round(summary_similarity, 4),
+        "answer_similarity": [round(s, 4) for s in answer_similarity],
+        "answer_similarity_mean": round(statistics.mean(answer_similarity), 4) if answer_similarity else 0.0,
+        "retrieval_overlap": round(len(base_ids & fused_ids) / len(union), 4) if union else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare fused and two-call brain analysis")
+    parser.add_argument("--input", required=True, help="Directory of .json files or a .jsonl file")
+    parser.add_argument("--output", default="fused_parity.json")
+    parser.add_argument("--limit", type=int, default=0, help="Stop after N inputs (0 = all)")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--min-answer-similarity", type=float, default=0.85)
+    parser.add_argument("--min-retrieval-overlap", type=float, default=0.6)
+    args = parser.parse_args()
+
+    embedder = default_embedder()
+    service = DeviationSimilarityService(get_vector_store())
+    items = []
+    for n, (item_id, payload) in enumerate(iter_items(args.input), 1):
+        if args.limit and n > args.limit:
+            break
+        result = compare(item_id, payload[DESCRIPTION_KEY], embedder, service, args.top_k)
+        items.append(result)
+        print(f"{item_id}: answers {result['fused']['answers']}/10, "
+              f"answer sim {result['answer_similarity_mean']}, summary sim {result['summary_similarity']}, "
+              f"retrieval overlap {result['retrieval_overlap']}, "
+              f"{result['two_call']['latency_ms']} -> {result['fused']['latency_ms']} ms")
+
+    if not items:
+        print("No inputs")
+        sys.exit(1)
+
+    def mean(path):
+        return round(statistics.mean(path(i) for i in items), 4)
+
+    summary = {
+        "inputs": len(items),
+        "fused_complete_rate": mean(lambda i: 1.0 if i["fused"]["answers"] == 10 else 0.0),
+        "answer_similarity_mean": mean(lambda i: i["answer_similarity_mean"]),
+        "summary_similarity_mean": mean(lambda i: i["summary_similarity"]),
+        "retrieval_overlap_mean": mean(lambda i: i["retrieval_overlap"]),
+        "latency_ms_mean": {"two_call": mean(lambda i: i["two_call"]["latency_ms"]),
+                            "fused": mean(lambda i: i["fused"]["latency_ms"])},
+        "tokens_mean": {"two_call": mean(lambda i: i["two_call"]["total_tokens"]),
+                        "fused": mean(lambda i: i["fused"]["total_tokens"])},
+    }
+    summary["passed"] = (
+        summary["answer_similarity_mean"] >= args.min_answer_similarity
+        and summary["retrieval_overlap_mean"] >= args.min_retrieval_overlap
+    )
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"summary": summary, "items": items}, f, indent=2)
+
+    print("\nParity summary")
+    for key, value in summary.items():
+        print(f"  {key:<26}{value}")
+    sys.exit(0 if summary["passed"] else 1)
+
+
+if __name__ == "__main__":
+    main()
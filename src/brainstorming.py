@@ -3,47 +3,68 @@
 import os
 import json
 from files.helperfunc import import_data, load_active_prompts, processing_content,process_description
-from files.agents import llm, summarizerAgent, instructionAnsweringAgent
-from files.brainstorminghelper import summary_qa
-from files.vectorstores import  MongoVectorStore
+from files.agents import get_llm, get_instruction_executor
+from files.brainstorminghelper import summary_qa, fused_analysis
+from files.vectorstores import  get_vector_store
 from files.deviation_store import DeviationSimilarityService
 from files.redis_repo import DeviationRedisRepository, DeviationUpstashRedisRepository
+from files.context_budget import ContextAssembler, default_budget
+from files.metrics import metrics
+from files.cancellation import check_cancelled
 from dotenv import load_dotenv
 #! brainstorming function
 load_dotenv()
-def brain(input_data: dict):
-    summary=summary_qa(input_data['Problem Description and Immediate Action']) 
+#! 1: summary and the 10 analysis answers come from one LLM call instead of two serial ones
+BRAIN_FUSED_ANALYSIS = os.getenv("BRAIN_FUSED_ANALYSIS", "0") == "1"
+def analyse_description(description):
+    """(summary, analysis answers) for a problem description, fused or two-call."""
+    if BRAIN_FUSED_ANALYSIS:
+        summary, answer = fused_analysis(description)
+        if summary and len(answer) == 10:
+            metrics.inc("brain_fused_analysis")
+            return summary, answer
+        #! an unparseable response falls back to the two-call path rather than retrieving on partial answers
+        metrics.inc("brain_fused_fallback")
+    summary=summary_qa(description)
+    return summary, process_description(summary,get_llm("analysis"))
+def brain(input_data: dict, with_report: bool = False):
+    summary, answer = analyse_description(input_data['Problem Description and Immediate Action'])
     prompts=load_active_prompts("prompts/Prompts Output 2 1.xlsx") 
-    answer=process_description(summary,llm)
     answers=[answer]
-    vector_store = MongoVectorStore()
+    vector_store = get_vector_store()
     similarity_service = DeviationSimilarityService(vector_store)
     similar_results = similarity_service.find_similar(
                                                     answers=answers
                                                 )           
-    similar_ids = set()
+    similar_scores = {}
     for result in similar_results:
         hit = result["matches"]
         for sid in hit:
             i=sid.get("metadata", {}).get("summary_id")
             print(i)
-            similar_ids.add(i)
-    similarfile = list(similar_ids)
+            #! best similarity per deviation, used to rank the context
+            similar_scores[i] = max(similar_scores.get(i, float("-inf")), float(sid.get("score") or 0.0))
     redis_repo =  DeviationUpstashRedisRepository()
-    rootcause_content = "Previous similar root causes for brainstorming:\n"
-    for deviation_id in similarfile:
+    retrieved = []
+    for deviation_id, score in similar_scores.items():
         data = redis_repo.get_deviation(deviation_id)
 
         if not data:
             continue
-        
-        text = f"""Problem description: {data['problem_description']}\n"
-                Root cause: {data['root_cause']}\n
-                ########################\n"""
-
-        
-        
-        rootcause_content += text        
+
+        retrieved.append({
+            "id": deviation_id,
+            "score": score,
+            "problem_description": data['problem_description'],
+            "root_cause": data['root_cause'],
+        })
+    #! retrieved context is bounded by a token budget instead of growing with top-k
+    llm = get_llm("rca")
+    assembler = ContextAssembler(default_budget(llm.get_context_window_size()), model=llm.model)
+    rootcause_content, context_report = assembler.assemble(retrieved)
+    metrics.observe("rca_context_tokens", context_report["tokens_used"])
+    print(f"Retrieved context: {context_report['tokens_used']}/{context_report['budget']} tokens, "
+          f"{len(context_report['included'])} of {context_report['considered']} deviations")
     results = {}
 
     QUESTION_KEYS = {
@@ -52,8 +73,17 @@ def brain(input_data: dict):
         "Recommend Corrective Action Effectiveness Check": "capa_effectiveness",
         "Recommend Preventive Action Effectiveness Check": "pa_effectiveness"
     }
+    #! LLM route per question (files/routing.py)
+    QUESTION_ROUTES = {
+        "root_cause": "rca",
+        "capa": "capa",
+        "capa_effectiveness": "capa",
+        "pa_effectiveness": "capa"
+    }
 
     for prompte in prompts:
+        #! a cancelled request (client gone, deadline passed) stops before the next LLM call
+        check_cancelled()
         _, question, prompt = prompte
 
         question_key = QUESTION_KEYS.get(question, question)
@@ -99,10 +129,12 @@ def brain(input_data: dict):
         ## Answer:
         """
 
-        output = instructionAnsweringAgent.kickoff(query)
+        output = get_instruction_executor(QUESTION_ROUTES.get(question_key, "rca")).kickoff(query)
 
         results[question_key] = output.raw
 
+    if with_report:
+        return results, {"retrieval_context": context_report}
     return results
 
 
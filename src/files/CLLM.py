@@ -1,6 +1,23 @@
 from crewai import BaseLLM
 from typing import Any, Dict, List, Optional, Union
+import os
+import time
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from files.llm_scheduler import get_scheduler, estimate_tokens
+from files.metrics import metrics
+from files.cancellation import current_token, RequestCancelled, CANCEL_POLL_S
+
+#! calls made under a cancel token run here, so the caller can stop waiting on a cancelled request
+_http_pool = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_HTTP_THREADS", 32)), thread_name_prefix="llm-http")
+
+
+def _wasted_on_completion(future):
+    # an abandoned call still finishes on the provider side, its tokens are wasted work
+    if future.cancelled() or future.exception() is not None:
+        return
+    metrics.inc("llm_wasted_tokens", int((future.result().get("usage") or {}).get("total_tokens") or 0))
 
 
 class CustomLLM(BaseLLM):
@@ -10,12 +27,93 @@ class CustomLLM(BaseLLM):
         base_url: str,
         api_key: Optional[str] = None,
         temperature: float = 0.7,
-        timeout: int = 60
+        timeout: int = 60,
+        max_tokens: Optional[int] = None,
+        route: Optional[str] = None
     ):
         super().__init__(model=model, temperature=temperature)
         self.base_url = base_url.rstrip("/")
         self.api_key = api_key
         self.timeout = timeout
+        self.max_tokens = max_tokens
+        self.route = route or "default"
+        self._usage_lock = threading.Lock()
+        self._usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+
+    def chat(self, messages: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Send one chat-completions request and return the decoded response body."""
+        payload = {
+            "model": self.model,
+            "messages": messages,
+            "temperature": self.temperature,
+        }
+        if self.max_tokens:
+            payload["max_tokens"] = self.max_tokens
+
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+
+        token = current_token()
+        if token is not None and token.cancelled:
+            metrics.inc("llm_cancelled_before_start")
+            raise RequestCancelled(token.reason)
+
+        def request(timeout: float) -> Dict[str, Any]:
+            start = time.perf_counter()
+            try:
+                response = requests.post(
+                    f"{self.base_url}/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    timeout=timeout
+                )
+                response.raise_for_status()
+                return response.json()
+            except requests.exceptions.Timeout:
+                # the read timeout was capped at the request deadline: that is a cancellation, not a provider error
+                if token is not None and token.cancelled:
+                    raise RequestCancelled(token.reason)
+                metrics.inc(f"llm_route_errors.{self.route}")
+                raise
+            except requests.exceptions.RequestException:
+                metrics.inc(f"llm_route_errors.{self.route}")
+                raise
+            finally:
+                # per-route endpoint latency, queueing in the scheduler is not included
+                metrics.observe(f"llm_route_ms.{self.route}", (time.perf_counter() - start) * 1000)
+
+        def post() -> Dict[str, Any]:
+            if token is None:
+                return request(self.timeout)
+            token.check()
+            remaining = token.remaining()
+            # the read timeout never outlives the request deadline
+            timeout = self.timeout if remaining is None else max(0.1, min(self.timeout, remaining))
+            future = _http_pool.submit(request, timeout)
+            while True:
+                try:
+                    return future.result(timeout=CANCEL_POLL_S)
+                except FutureTimeout:
+                    if token.cancelled:
+                        metrics.inc("llm_calls_abandoned")
+                        future.add_done_callback(_wasted_on_completion)
+                        raise RequestCancelled(token.reason, pending=future)
+
+        scheduler = get_scheduler()
+        if scheduler is None:
+            data = post()
+        else:
+            # shared admission control: priority classes, rpm/tpm buckets, in-flight cap
+            data = scheduler.run(
+                post,
+                estimated_tokens=estimate_tokens(messages),
+                usage_of=lambda d: (d.get("usage") or {}).get("total_tokens")
+            )
+        self._record_usage(data.get("usage") or {})
+        if token is not None:
+            token.record_llm_call(int((data.get("usage") or {}).get("total_tokens") or 0))
+        return data
 
     def call(
         self,
@@ -32,32 +130,26 @@ class CustomLLM(BaseLLM):
         else:
             chat_messages = messages
 
-        payload = {
-            "model": self.model,
-            "messages": chat_messages,
-            "temperature": self.temperature,
-        }
-
-        headers = {"Content-Type": "application/json"}
-        if self.api_key:
-            headers["Authorization"] = f"Bearer {self.api_key}"
-
         try:
-            response = requests.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
-            response.raise_for_status()
-            data = response.json()
+            data = self.chat(chat_messages)
             return data["choices"][0]["message"]["content"]
 
         except requests.exceptions.RequestException as e:
             return f"[LLM ERROR] {str(e)}"
 
+    def _record_usage(self, usage: Dict[str, Any]):
+        with self._usage_lock:
+            self._usage["calls"] += 1
+            for key in ("prompt_tokens", "completion_tokens", "total_tokens"):
+                self._usage[key] += int(usage.get(key) or 0)
+
+    def usage_snapshot(self) -> Dict[str, int]:
+        """Cumulative token usage reported by the endpoint since this client was built."""
+        with self._usage_lock:
+            return dict(self._usage)
+
     def supports_function_calling(self) -> bool:
         return False
 
     def get_context_window_size(self) -> int:
-        return 8192
+        return int(os.getenv("LLM_CONTEXT_WINDOW", 8192))
@@ -0,0 +1,14 @@
+import os
+import hmac
+from typing import Mapping
+
+#! token for the admin endpoints (/metrics, profiles, ingest dead letters), sent in X-Admin-Token
+#! while it is unset those endpoints refuse every request; PROFILE_ADMIN_TOKEN is read as a fallback
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or os.getenv("PROFILE_ADMIN_TOKEN")
+ADMIN_TOKEN_HEADER = "x-admin-token"
+
+
+def admin_authorized(headers: Mapping[str, str]) -> bool:
+    token = headers.get(ADMIN_TOKEN_HEADER, "")
+    # constant-time comparison, the token must not leak through response timing
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
@@ -1,28 +1,24 @@
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from crewai import Agent
-from files.CLLM import CustomLLM
-from crewai import LLM
 load_dotenv()
 
 #! currently using deepseekllm, later can switch to gpu deployed private llm
+#! llm and agents are built lazily on first use so that importing this module stays cheap
+#! (crewai alone takes seconds to import on a cold container)
+
+#! single-shot tasks can skip the crewai agent loop: "crewai" (default) or "direct"
+#! AGENT_EXECUTOR sets the default, SUMMARIZER_EXECUTOR / INSTRUCTION_EXECUTOR override per agent
+AGENT_EXECUTOR = os.getenv("AGENT_EXECUTOR", "crewai").lower()
 
-llm = CustomLLM(
-    model=os.getenv("LLM_MODEL"),
-    base_url=os.getenv("LLM_BASE_URL"),
-    api_key=os.getenv("LLM_API_KEY"),
-    temperature=float(os.getenv("LLM_TEMPERATURE", 0.7))
-)
 #! summarizwe agent for generating summary
-summarizerAgent = Agent(
-    role="Pharma Compliance Summarizer",
-    goal="""
+SUMMARIZER_ROLE = "Pharma Compliance Summarizer"
+SUMMARIZER_GOAL = """
             Transform raw GMP-related content into a clear, concise, and professional 
             executive-level summary suitable for expert review, brainstorming, and 
             subsequent regulatory report generation.
         """
-    ,
-    backstory="""
+SUMMARIZER_BACKSTORY = """
                 You are a senior pharmaceutical quality and compliance expert with extensive 
                 experience in GMP deviation management, investigations, CAPA development, 
                 change control, audit responses, and SOP documentation. 
@@ -30,18 +26,15 @@ summarizerAgent = Agent(
                 at synthesizing complex, unstructured quality data into coherent narratives 
                 while preserving compliance intent, technical accuracy, and regulatory tone.
             """
-    ,
-    llm=llm
-)
+
 #! instruction base answering agent for brainstorming(RCA) report
-instructionAnsweringAgent = Agent(
-    role="Instruction-Based Answer Writing Agent",
-    goal="""
+INSTRUCTION_ROLE = "Instruction-Based Answer Writing Agent"
+INSTRUCTION_GOAL = """
             Write precise and complete answers by strictly following user-provided instructions.
             Generate responses that exactly match the specified format, tone, length, and content 
             requirements given in each instruction.
-        """,
-    backstory="""
+        """
+INSTRUCTION_BACKSTORY = """
                 You are a specialized writing agent designed to follow instructions with absolute precision.
                 Your primary function is to receive explicit user instructions and produce answers that 
                 perfectly align with those directives.
@@ -63,6 +56,94 @@ instructionAnsweringAgent = Agent(
                 You write what you're told to write, in the way you're told to write it.
                 
                 Your core principle: **Follow the instruction precisely, deliver the answer accurately.**
-            """,
-    llm=llm
-)
+            """
+
+
+@lru_cache(maxsize=None)
+def _build_llm(task):
+    from files.CLLM import CustomLLM
+    from files.routing import route_config
+
+    config = route_config(task)
+    return CustomLLM(
+        model=config["model"],
+        base_url=config["base_url"],
+        api_key=config["api_key"],
+        temperature=config["temperature"],
+        timeout=config["timeout"],
+        max_tokens=config["max_tokens"],
+        route=task
+    )
+
+
+def get_llm(task=None):
+    """LLM for a pipeline task (see files/routing.py); no task is the default LLM_* model."""
+    return _build_llm(task)
+
+
+@lru_cache(maxsize=None)
+def get_summarizer_agent():
+    from crewai import Agent
+
+    return Agent(
+        role=SUMMARIZER_ROLE,
+        goal=SUMMARIZER_GOAL,
+        backstory=SUMMARIZER_BACKSTORY,
+        llm=get_llm("summary")
+    )
+
+
+@lru_cache(maxsize=None)
+def get_instruction_agent(task="rca"):
+    from crewai import Agent
+
+    return Agent(
+        role=INSTRUCTION_ROLE,
+        goal=INSTRUCTION_GOAL,
+        backstory=INSTRUCTION_BACKSTORY,
+        llm=get_llm(task)
+    )
+
+
+def _executor_kind(agent_env: str) -> str:
+    return os.getenv(agent_env, AGENT_EXECUTOR).lower()
+
+
+@lru_cache(maxsize=None)
+def _direct_executor(role: str, goal: str, backstory: str, task: str):
+    from files.executor import DirectAgentExecutor
+
+    return DirectAgentExecutor(role, goal, backstory, get_llm(task))
+
+
+def get_summarizer_executor():
+    """Summarizer used for single-shot kickoffs, crewai Agent or DirectAgentExecutor per config."""
+    if _executor_kind("SUMMARIZER_EXECUTOR") == "direct":
+        return _direct_executor(SUMMARIZER_ROLE, SUMMARIZER_GOAL, SUMMARIZER_BACKSTORY, "summary")
+    return get_summarizer_agent()
+
+
+def get_direct_summarizer(task="summary"):
+    """Summarizer persona as a single-shot call; for prompts whose output is parsed, not rewrapped by crewai."""
+    return _direct_executor(SUMMARIZER_ROLE, SUMMARIZER_GOAL, SUMMARIZER_BACKSTORY, task)
+
+
+def get_instruction_executor(task="rca"):
+    """Instruction answering agent used for single-shot kickoffs, per config; `task` picks the LLM route."""
+    if _executor_kind("INSTRUCTION_EXECUTOR") == "direct":
+        return _direct_executor(INSTRUCTION_ROLE, INSTRUCTION_GOAL, INSTRUCTION_BACKSTORY, task)
+    return get_instruction_agent(task)
+
+
+_LAZY_ATTRS = {
+    "llm": get_llm,
+    "summarizerAgent": get_summarizer_agent,
+    "instructionAnsweringAgent": get_instruction_agent,
+}
+
+
+def __getattr__(name):
+    # keeps `from files.agents import llm` working for older callers
+    if name in _LAZY_ATTRS:
+        return _LAZY_ATTRS[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,4 +1,5 @@
-from files.agents import summarizerAgent
+from files.agents import get_summarizer_executor, get_direct_summarizer
+from files.helperfunc import ANALYSIS_QUESTIONS, parse_analysis_response
 #! executive-level GMP deviation summary from QA
 def summary_qa(input_data) -> str:
     query = f"""Take a set of raw Q/A pairs from a GMP deviation report section and generate 
@@ -11,5 +12,33 @@ def summary_qa(input_data) -> str:
     Here are the Q/A pairs:
     Q/A: {input_data}
     """
-    result = summarizerAgent.kickoff(query)
+    result = get_summarizer_executor().kickoff(query)
     return result.raw
+
+
+#! summary + the 10 analysis answers in one round trip (brain with BRAIN_FUSED_ANALYSIS=1)
+def fused_analysis(input_data):
+    """Returns (summary, answers); either may be empty when the response could not be parsed."""
+    query = f"""Take a set of raw Q/A pairs from a GMP deviation report section and produce two things.
+
+    A. An executive-level summary. The summary must:
+    1. Retain compliance and regulatory language.
+    2. Be concise but comprehensive enough for expert brainstorming.
+    3. Highlight critical details (root causes, corrective actions, CAPA links, SOP references).
+    4. Use an executive-level narrative style suitable for pharma experts.
+    5. Avoid repetition or copying raw Q/A text directly.
+
+    B. Answers to the following 10 questions about the deviation, strictly from a GMP and regulatory
+    perspective (FDA 21 CFR 210/211, EU GMP, ICH Q9). Do not repeat the questions. Be clear, factual,
+    and inspection-ready.
+
+{ANALYSIS_QUESTIONS}
+    Return only a JSON object, no other text:
+    {{"summary": "<summary>", "answers": ["<answer 1>", "<answer 2>", ..., "<answer 10>"]}}
+
+    Here are the Q/A pairs:
+    Q/A: {input_data}
+    """
+    result = get_direct_summarizer("analysis").kickoff(query)
+    summary, answers = parse_analysis_response(result.raw)
+    return summary or "", answers
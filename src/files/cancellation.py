@@ -0,0 +1,148 @@
+import os
+import time
+import asyncio
+import threading
+import contextvars
+import anyio.to_thread
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Any, Callable, Mapping, Optional
+
+from files.metrics import metrics
+
+#! request-scoped deadline + cancellation for long pipelines (brain, deviation_generation)
+#! the token travels in a contextvar; CustomLLM, the LLM scheduler queue and the pipeline loops check it,
+#! so a disconnected client or an expired deadline stops the remaining LLM calls
+#! REQUEST_DEADLINE_S: default deadline per request (0 = none); X-Request-Deadline (seconds) may shorten it
+REQUEST_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", 0))
+DEADLINE_HEADER = "x-request-deadline"
+DISCONNECT_POLL_S = float(os.getenv("DISCONNECT_POLL_S", 0.5))
+CANCEL_POLL_S = 0.25  # how often blocked waits (scheduler queue, in-flight HTTP) look at the token
+
+CLIENT_DISCONNECTED = "client disconnected"
+DEADLINE_EXCEEDED = "deadline exceeded"
+
+
+class RequestCancelled(Exception):
+    def __init__(self, reason: str, pending: Optional[Future] = None):
+        super().__init__(reason)
+        self.reason = reason
+        # the call the caller stopped waiting for; it still runs (and uses provider capacity) until done
+        self.pending = pending
+
+
+class CancelToken:
+    def __init__(self, timeout: Optional[float] = None):
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.reason: Optional[str] = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        # LLM work done on behalf of this request, reported as wasted if it ends up cancelled
+        self.llm_calls = 0
+        self.llm_tokens = 0
+
+    def cancel(self, reason: str = CLIENT_DISCONNECTED):
+        with self._lock:
+            if not self._event.is_set():
+                self.reason = reason
+                self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(DEADLINE_EXCEEDED)
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline (None without one)."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise RequestCancelled(self.reason)
+
+    def record_llm_call(self, tokens: int):
+        with self._lock:
+            self.llm_calls += 1
+            self.llm_tokens += tokens
+
+
+_token: contextvars.ContextVar[Optional[CancelToken]] = contextvars.ContextVar("cancel_token", default=None)
+
+
+@contextmanager
+def cancel_scope(token: CancelToken):
+    reset = _token.set(token)
+    try:
+        yield token
+    finally:
+        _token.reset(reset)
+
+
+def current_token() -> Optional[CancelToken]:
+    return _token.get()
+
+
+def check_cancelled():
+    """Checkpoint for pipeline loops; raises RequestCancelled once the request is cancelled."""
+    token = _token.get()
+    if token is not None:
+        token.check()
+
+
+def _slug(reason: str) -> str:
+    return reason.replace(" ", "_")
+
+
+def deadline_from_headers(headers: Mapping[str, str]) -> Optional[float]:
+    """Request deadline in seconds: the configured default, shortened by the X-Request-Deadline header."""
+    deadline = REQUEST_DEADLINE_S or None
+    raw = headers.get(DEADLINE_HEADER)
+    if raw:
+        try:
+            requested = float(raw)
+        except ValueError:
+            requested = 0
+        if requested > 0:
+            deadline = min(deadline, requested) if deadline else requested
+    return deadline
+
+
+async def run_cancellable(request, fn: Callable[..., Any], *args, timeout: Optional[float] = None, **kwargs) -> Any:
+    """
+    Run a blocking pipeline in a worker thread under a fresh CancelToken.
+
+    Polls `request.is_disconnected()` while waiting. On disconnect or deadline the
+    token is cancelled and RequestCancelled is raised right away; the worker stops at
+    its next checkpoint and its LLM usage is counted as wasted.
+    """
+    token = CancelToken(timeout)
+
+    def run():
+        try:
+            with cancel_scope(token):
+                return fn(*args, **kwargs)
+        finally:
+            if token.cancelled:
+                metrics.inc("llm_wasted_calls", token.llm_calls)
+                metrics.inc("llm_wasted_tokens", token.llm_tokens)
+
+    # Starlette's threadpool (anyio, 40 threads by default), the pool the sync handlers used;
+    # asyncio's default executor is only min(32, cpus + 4) threads
+    task = asyncio.ensure_future(anyio.to_thread.run_sync(run))
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_S)
+            if done:
+                return task.result()
+            if not token.cancelled and await request.is_disconnected():
+                token.cancel(CLIENT_DISCONNECTED)
+            if token.cancelled:
+                # nobody reads the result any more; the exception is retrieved to keep asyncio quiet
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())
+                raise RequestCancelled(token.reason)
+    except RequestCancelled as e:
+        metrics.inc(f"requests_cancelled.{_slug(e.reason)}")
+        raise
@@ -2,30 +2,112 @@ import os
 import hashlib
 from typing import List, Dict, Any, Optional
 import chromadb
+from files.vectorstores import VectorStore
+from files.lexical import as_text
+from files.embedding import Embedder
 
 
-class ChromaDBManager:
+class ChromaDBManager(VectorStore):
     """
     A single-class interface for managing ChromaDB storage, search,
     and deviation similarity analysis without logging or printing.
+
+    With an `embedder` the collection holds the project's embeddings (cosine space)
+    and the manager is a regular VectorStore backend; without one it keeps using
+    Chroma's default embedding function, as existing collections were built with it.
     """
 
-    def __init__(self, collection_name: str = "pharma_collection", persist_dir: str = "./chromadb_data"):
+    def __init__(
+        self,
+        collection_name: str = "pharma_collection",
+        persist_dir: str = "./chromadb_data",
+        embedder: Optional[Embedder] = None,
+    ):
         self.persist_directory = os.path.abspath(persist_dir)
         os.makedirs(self.persist_directory, exist_ok=True)
         self.client = chromadb.PersistentClient(path=self.persist_directory)
         self.collection_name = collection_name
+        self.embedder = embedder
         self.collection = self._get_or_create_collection(collection_name)
 
     # ----------------------------
     # Internal helper methods
     # ----------------------------
     def _get_or_create_collection(self, name: str):
+        if self.embedder is not None:
+            return self.client.get_or_create_collection(
+                name,
+                embedding_function=None,
+                metadata={"hnsw:space": "cosine"}
+            )
         try:
             return self.client.get_collection(name)
         except Exception:
             return self.client.create_collection(name)
 
+    def _query_input(self, texts: List[str]) -> Dict[str, Any]:
+        if self.embedder is not None:
+            return {"query_embeddings": self.embedder.embed(texts)}
+        return {"query_texts": texts}
+
+    # ----------------------------
+    # VectorStore contract
+    # ----------------------------
+    @staticmethod
+    def _metadata(meta: Dict[str, Any]) -> Dict[str, Any]:
+        # Chroma metadata values must be scalars, the answer list is stored as one text
+        return {
+            k: as_text(v) if isinstance(v, (list, tuple)) else v
+            for k, v in meta.items() if v is not None
+        }
+
+    def add(self, texts: List[Any], metadatas: List[Dict], ids: List[str]):
+        if not texts:
+            return
+        # documents must be strings, a deviation's answers arrive as the list of 10 answers
+        documents = [as_text(t) for t in texts]
+        kwargs = {}
+        if self.embedder is not None:
+            kwargs["embeddings"] = self.embedder.embed(documents)
+        # upsert: adding an id again (a retried ingest) replaces it instead of being dropped
+        self.collection.upsert(
+            documents=documents,
+            metadatas=[self._metadata(meta) for meta in metadatas],
+            ids=ids,
+            **kwargs
+        )
+
+    def query(self, text: Any, top_k: int = 5):
+        return self._query(self._query_input([as_text(text)]), top_k)
+
+    def query_vector(self, text: str, query_vector: list, top_k: int = 5):
+        if self.embedder is None:
+            # the collection's own embedding function produced its vectors, not ours
+            return self.query(text, top_k)
+        return self._query({"query_embeddings": [list(query_vector)]}, top_k)
+
+    def _query(self, query_input: Dict[str, Any], top_k: int):
+        n_results = min(top_k, self.collection.count())
+        if n_results <= 0:
+            return []
+        results = self.collection.query(
+            n_results=n_results,
+            include=["documents", "metadatas", "distances"],
+            **query_input
+        )
+        return [
+            {
+                "id": doc_id,
+                "text": document,
+                "metadata": metadata or {},
+                # cosine distance -> the same similarity score the Mongo backend returns
+                "score": 1.0 - distance
+            }
+            for doc_id, document, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
     # ----------------------------
     # Store answers + metadata
     # ----------------------------
@@ -57,10 +139,14 @@ class ChromaDBManager:
             })
             ids_list.append(doc_id)
 
+        kwargs = {}
+        if self.embedder is not None:
+            kwargs["embeddings"] = self.embedder.embed(document_texts)
         self.collection.add(
             documents=document_texts,
             metadatas=metadata_list,
-            ids=ids_list
+            ids=ids_list,
+            **kwargs
         )
 
         return {
@@ -81,8 +167,8 @@ class ChromaDBManager:
         Search for similar answers in ChromaDB and return results.
         """
         results = self.collection.query(
-            query_texts=[query_text],
-            n_results=n_results
+            n_results=n_results,
+            **self._query_input([query_text])
         )
         return results
 
@@ -111,8 +197,8 @@ class ChromaDBManager:
         all_results = []
         for i, (que, answer) in enumerate(zip(question_list, answers), 1):
             results = self.collection.query(
-                query_texts=[answer],
-                n_results=num_results
+                n_results=num_results,
+                **self._query_input([answer])
             )
             for j in range(len(results["ids"][0])):
                 all_results.append({
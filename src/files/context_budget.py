@@ -0,0 +1,117 @@
+import os
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple, Optional
+
+from files.dedup import shingles
+
+#! token-budgeted assembly of retrieved root causes for the RCA prompt
+#! RCA_CONTEXT_TOKEN_BUDGET=0 (default) uses RCA_CONTEXT_WINDOW_SHARE of the model context window
+RCA_CONTEXT_TOKEN_BUDGET = int(os.getenv("RCA_CONTEXT_TOKEN_BUDGET", 0))
+RCA_CONTEXT_WINDOW_SHARE = float(os.getenv("RCA_CONTEXT_WINDOW_SHARE", 0.25))
+RCA_CONTEXT_OVERLAP = float(os.getenv("RCA_CONTEXT_OVERLAP", 0.8))  # shingle jaccard treated as same text
+RCA_CONTEXT_MIN_TRUNCATED = 64  # do not bother adding a truncated entry smaller than this
+
+CONTEXT_HEADER = "Previous similar root causes for brainstorming:\n"
+SEPARATOR = "########################\n"
+
+
+@lru_cache(maxsize=None)
+def _encoding(model: Optional[str]):
+    try:
+        import tiktoken
+    except ImportError:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model or "")
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        # tiktoken missing: ~4 characters per token
+        return max(1, len(text) // 4) if text else 0
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: Optional[str] = None) -> str:
+    if max_tokens <= 0:
+        return ""
+    encoding = _encoding(model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return encoding.decode(tokens[:max_tokens])
+
+
+def default_budget(context_window: int) -> int:
+    return RCA_CONTEXT_TOKEN_BUDGET or int(context_window * RCA_CONTEXT_WINDOW_SHARE)
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+class ContextAssembler:
+    """Ranks retrieved deviations by similarity, drops overlapping text and fills a token budget."""
+
+    def __init__(self, budget: int, model: Optional[str] = None):
+        self.budget = budget
+        self.model = model
+
+    @staticmethod
+    def format_entry(problem_description: str, root_cause: str) -> str:
+        return f"Problem description: {problem_description}\nRoot cause: {root_cause}\n{SEPARATOR}"
+
+    def assemble(self, items: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+        """`items` carry id, score, problem_description and root_cause; returns (context, report)."""
+        report = {
+            "budget": self.budget,
+            "tokens_used": 0,
+            "considered": len(items),
+            "included": [],
+            "truncated": [],
+            "deduplicated": [],
+            "dropped": [],
+        }
+        context = CONTEXT_HEADER
+        used = count_tokens(CONTEXT_HEADER, self.model)
+        seen_shingles: List[set] = []
+
+        for item in sorted(items, key=lambda x: x.get("score") or 0.0, reverse=True):
+            item_shingles = shingles(f"{item['problem_description']} {item['root_cause']}")
+            if any(_jaccard(item_shingles, s) >= RCA_CONTEXT_OVERLAP for s in seen_shingles):
+                report["deduplicated"].append(item["id"])
+                continue
+
+            entry = self.format_entry(item["problem_description"], item["root_cause"])
+            tokens = count_tokens(entry, self.model)
+            remaining = self.budget - used
+            if tokens > remaining:
+                if remaining < RCA_CONTEXT_MIN_TRUNCATED:
+                    report["dropped"].append(item["id"])
+                    continue
+                # the root cause is what the RCA prompt needs, the description is cut first
+                root_cause_entry = self.format_entry("", item["root_cause"])
+                description_room = remaining - count_tokens(root_cause_entry, self.model)
+                if description_room > 0:
+                    description = truncate_to_tokens(item["problem_description"], description_room, self.model)
+                    entry = self.format_entry(description + " ...", item["root_cause"])
+                else:
+                    entry = truncate_to_tokens(root_cause_entry, remaining - 1, self.model) + "\n"
+                tokens = count_tokens(entry, self.model)
+                if tokens > remaining:
+                    entry = truncate_to_tokens(entry, remaining, self.model)
+                    tokens = count_tokens(entry, self.model)
+                report["truncated"].append(item["id"])
+
+            context += entry
+            used += tokens
+            seen_shingles.append(item_shingles)
+            report["included"].append(item["id"])
+
+        report["tokens_used"] = used
+        return context, report
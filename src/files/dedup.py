@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import base64
+import struct
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+#! ingest-time near-duplicate detection (MinHash + LSH bands)
+#! DEDUP_POLICY: "off" (default), "flag" (store, but mark duplicate_of / cluster_id)
+#!               or "merge" (do not store a new vector, record it on the canonical deviation;
+#!               Mongo only, other vector backends fall back to flag)
+#! with flag/merge, similarity results are collapsed to one hit per duplicate cluster
+#! deviations ingested before dedup was enabled carry no signature, sign them once with
+#!   python -m files.dedup --backfill
+DEDUP_POLICY = os.getenv("DEDUP_POLICY", "off").lower()
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.8))
+DEDUP_NUM_PERM = 64
+DEDUP_BANDS = 16  # 16 bands x 4 rows: candidate pairs start around jaccard 0.5
+DEDUP_SHINGLE = 3
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _permutations(n: int) -> List[Tuple[int, int]]:
+    # fixed seeds so signatures stored in Mongo stay comparable across processes
+    perms = []
+    for i in range(n):
+        digest = hashlib.sha256(f"minhash-{i}".encode()).digest()
+        a, b = struct.unpack("<QQ", digest[:16])
+        perms.append((a % _MERSENNE or 1, b % _MERSENNE))
+    return perms
+
+
+_PERMS = _permutations(DEDUP_NUM_PERM)
+
+
+def shingles(text: str, size: int = DEDUP_SHINGLE) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def minhash(text: str) -> Optional[List[int]]:
+    """MinHash signature, None for text without any word (nothing to compare, never a duplicate)."""
+    hashes = [
+        struct.unpack("<Q", hashlib.blake2b(s.encode(), digest_size=8).digest())[0]
+        for s in shingles(text)
+    ]
+    if not hashes:
+        return None
+    return [min(((a * h + b) % _MERSENNE) & _MAX_HASH for h in hashes) for a, b in _PERMS]
+
+
+def encode_signature(signature: List[int]) -> str:
+    return base64.b64encode(struct.pack(f"<{len(signature)}I", *signature)).decode("ascii")
+
+
+def decode_signature(value: str) -> List[int]:
+    raw = base64.b64decode(value)
+    return list(struct.unpack(f"<{len(raw) // 4}I", raw))
+
+
+def estimate_similarity(a: List[int], b: List[int]) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class NearDuplicateIndex:
+    """LSH band index over MinHash signatures; maps every deviation to its duplicate cluster."""
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, bands: int = DEDUP_BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = DEDUP_NUM_PERM // bands
+        self._buckets: Dict[Tuple[int, tuple], set] = {}
+        self._signatures: Dict[str, List[int]] = {}
+        self._clusters: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.watermark = None
+        self._last_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _bands(self, signature: List[int]):
+        for band in range(self.bands):
+            yield band, tuple(signature[band * self.rows:(band + 1) * self.rows])
+
+    def add(self, doc_id: str, signature: List[int], cluster_id: Optional[str] = None):
+        with self._lock:
+            if doc_id in self._signatures:
+                return
+            self._signatures[doc_id] = signature
+            self._clusters[doc_id] = cluster_id or doc_id
+            for key in self._bands(signature):
+                self._buckets.setdefault(key, set()).add(doc_id)
+
+    def find(self, signature: List[int], exclude: Optional[str] = None) -> Optional[Tuple[str, float]]:
+        """
+        Best existing deviation at or above the threshold, as (doc_id, estimated jaccard).
+        `exclude` is the deviation being saved, so a retried ingest does not match itself.
+        """
+        with self._lock:
+            candidates = set()
+            for key in self._bands(signature):
+                candidates |= self._buckets.get(key, set())
+            candidates.discard(exclude)
+            best = None
+            for doc_id in candidates:
+                similarity = estimate_similarity(signature, self._signatures[doc_id])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (doc_id, similarity)
+        return best
+
+    def cluster_of(self, doc_id: str) -> str:
+        return self._clusters.get(doc_id, doc_id)
+
+    def sync(self, collection, min_interval: float = 5.0, overlap_seconds: float = 60.0) -> int:
+        """Load signatures stored with deviations ingested (or backfilled, signed_at) since the last sync."""
+        now = time.monotonic()
+        if now - self._last_sync < min_interval:
+            return 0
+        self._last_sync = now
+
+        query: Dict[str, Any] = {"metadata.minhash": {"$exists": True}}
+        if self.watermark is not None:
+            # backfilled signatures sit on old documents: their ingested_at predates the watermark
+            since = {"$gte": self.watermark - timedelta(seconds=overlap_seconds)}
+            query["$or"] = [{"ingested_at": since}, {"signed_at": since}]
+        projection = {"metadata.summary_id": 1, "metadata.minhash": 1, "metadata.cluster_id": 1,
+                      "ingested_at": 1, "signed_at": 1}
+        added = 0
+        for doc in collection.find(query, projection=projection):
+            meta = doc["metadata"]
+            if meta["summary_id"] not in self._signatures:
+                self.add(meta["summary_id"], decode_signature(meta["minhash"]), meta.get("cluster_id"))
+                added += 1
+            for changed_at in (doc.get("ingested_at"), doc.get("signed_at")):
+                if changed_at is not None and (self.watermark is None or changed_at > self.watermark):
+                    self.watermark = changed_at
+        return added
+
+
+def backfill_signatures(collection, index: NearDuplicateIndex,
+                        description_of: Optional[Callable[[str], Optional[str]]] = None) -> Dict[str, int]:
+    """
+    Sign deviations stored without metadata.minhash, oldest first, and cluster them against
+    everything signed before them, so duplicates already in the corpus are found too.
+    Like ingest, the signature is taken from the raw description (`description_of(summary_id)`)
+    when available, else from the stored answers. Existing documents are only annotated
+    (cluster_id / duplicate_of); nothing is merged or removed.
+    """
+    from files.lexical import as_text
+
+    collection.create_index("signed_at", sparse=True)
+    index.sync(collection, min_interval=0)
+    counts = {"signed": 0, "duplicates": 0, "skipped": 0}
+
+    def sign(summary_id: str, answers: List[Any]):
+        description = description_of(summary_id) if description_of else None
+        signature = minhash(description if description else as_text(answers))
+        if signature is None:
+            counts["skipped"] += 1
+            return
+        match = index.find(signature, exclude=summary_id)
+        # signed_at moves the documents past the sync watermark of the running API workers
+        update = {"metadata.minhash": encode_signature(signature), "metadata.cluster_id": summary_id,
+                  "signed_at": datetime.now(timezone.utc)}
+        cluster_id = None
+        if match is not None:
+            cluster_id = index.cluster_of(match[0])
+            update.update({
+                "metadata.cluster_id": cluster_id,
+                "metadata.duplicate_of": cluster_id,
+                "metadata.duplicate_similarity": round(match[1], 3),
+            })
+            counts["duplicates"] += 1
+        collection.update_many({"metadata.summary_id": summary_id}, {"$set": update})
+        index.add(summary_id, signature, cluster_id)
+        counts["signed"] += 1
+
+    # the answer documents of one deviation share ingested_at and sort next to each other
+    cursor = collection.find(
+        {"metadata.minhash": {"$exists": False}},
+        projection={"text": 1, "metadata.summary_id": 1},
+    ).sort([("ingested_at", 1), ("_id", 1)])
+    current, answers = None, []
+    for doc in cursor:
+        summary_id = doc["metadata"]["summary_id"]
+        if summary_id != current:
+            if current is not None:
+                sign(current, answers)
+            current, answers = summary_id, []
+        answers.append(doc["text"])
+    if current is not None:
+        sign(current, answers)
+    return counts
+
+
+def collapse_duplicates(hits: List[Dict[str, Any]], top_k: int) -> List[Dict[str, Any]]:
+    """Keep the best hit of every duplicate cluster, counting the collapsed copies."""
+    best: Dict[str, Dict[str, Any]] = {}
+    order = []
+    for hit in hits:
+        meta = hit.get("metadata", {})
+        cluster = meta.get("cluster_id") or meta.get("summary_id") or hit.get("id")
+        if cluster in best:
+            best[cluster]["collapsed_duplicates"] += 1
+            continue
+        best[cluster] = {**hit, "collapsed_duplicates": 0}
+        order.append(cluster)
+    return [best[c] for c in order][:top_k]
+
+
+_indexes: Dict[str, NearDuplicateIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_near_duplicate_index(name: str) -> NearDuplicateIndex:
+    with _indexes_lock:
+        if name not in _indexes:
+            _indexes[name] = NearDuplicateIndex()
+        return _indexes[name]
+
+
+def main():
+    import argparse
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    load_dotenv()
+    from files.vectorstores import MONGO_URI, MONGO_DB, MONGO_COLLECTION, MongoVectorStore
+    from files.redis_repo import DeviationUpstashRedisRepository
+
+    parser = argparse.ArgumentParser(description="Near-duplicate signatures for the deviation collection")
+    parser.add_argument("--backfill", action="store_true", help="Sign and cluster deviations stored without a signature")
+    parser.add_argument("--no-redis", action="store_true", help="Sign from the stored answers only")
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        return
+
+    collection = MongoClient(MONGO_URI)[MONGO_DB][MONGO_COLLECTION]
+    description_of = None
+    if not args.no_redis:
+        redis_repo = DeviationUpstashRedisRepository()
+
+        def description_of(summary_id):
+            try:
+                return redis_repo.get_field(summary_id, "problem_description")
+            except Exception:
+                return None
+
+    # the API workers load the new signatures on their next sync (signed_at is past their watermark)
+    counts = backfill_signatures(collection, get_near_duplicate_index(MongoVectorStore.__name__), description_of)
+    print(f"Signed {counts['signed']} deviations, {counts['duplicates']} near-duplicates, "
+          f"{counts['skipped']} without text")
+
+
+if __name__ == "__main__":
+    main()
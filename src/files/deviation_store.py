@@ -1,31 +1,178 @@
-from files.vectorstores import VectorStore
+import asyncio
+from files.vectorstores import VectorStore, MongoVectorStore
+from files.lexical import as_text
+from files import dedup
+from files.similarity_cache import get_similarity_cache, bump_corpus_generation
 class DeviationRepository:
-    def __init__(self, vector_store: VectorStore):
+    def __init__(self, vector_store: VectorStore, duplicates: dedup.NearDuplicateIndex | None = None):
         self.store = vector_store
+        self.duplicates = duplicates
+        if self.duplicates is None and dedup.DEDUP_POLICY != "off":
+            self.duplicates = dedup.get_near_duplicate_index(type(vector_store).__name__)
+
+    def _mongo_collection(self):
+        # signatures written by other workers (and merge bookkeeping) are only shared through Mongo;
+        # in-process backends see every signature through the index itself
+        return self.store.collection if isinstance(self.store, MongoVectorStore) else None
+
+    def _check_duplicate(self, summary_id, answers, source_text):
+        #! signature of the raw description when we have it, the LLM analysis is noisier
+        signature = dedup.minhash(source_text if source_text else as_text(answers))
+        decision = {"action": "added", "duplicate_of": None, "similarity": None}
+        if signature is None:
+            # empty / punctuation-only text: nothing to compare, stored unsigned
+            return None, decision
+        collection = self._mongo_collection()
+        if collection is not None:
+            self.duplicates.sync(collection)
+        match = self.duplicates.find(signature, exclude=summary_id)
+        if match is not None:
+            # merging records the duplicate on the canonical documents in Mongo (metadata.duplicates),
+            # other backends have nowhere to keep it, so the deviation is stored and flagged instead
+            merge = dedup.DEDUP_POLICY == "merge" and collection is not None
+            decision.update(
+                action="merged" if merge else "flagged",
+                duplicate_of=self.duplicates.cluster_of(match[0]),
+                similarity=round(match[1], 3),
+            )
+        return signature, decision
+
+    def save_answers(self, summary_id, answers, source_text=None):
+        decision = {"action": "added", "duplicate_of": None, "similarity": None}
+        signature = None
+        if self.duplicates is not None:
+            signature, decision = self._check_duplicate(summary_id, answers, source_text)
+            if decision["action"] == "merged":
+                # no new vector: the deviation is recorded on its canonical cluster instead
+                self._mongo_collection().update_many(
+                    {"metadata.summary_id": decision["duplicate_of"]},
+                    {"$addToSet": {"metadata.duplicates": summary_id}}
+                )
+                bump_corpus_generation()
+                return decision
 
-    def save_answers(self, summary_id, answers):
         texts, metas, ids = [], [], []
 
         for i, a in enumerate(answers, 1):
             ids.append(f"{summary_id}_{i}")
             texts.append(a)
-            metas.append({
+            meta = {
                 "summary_id": summary_id,
                 "answer":a
-            })
+            }
+            if signature is not None:
+                meta["minhash"] = dedup.encode_signature(signature)
+                meta["cluster_id"] = decision["duplicate_of"] or summary_id
+                if decision["duplicate_of"]:
+                    meta["duplicate_of"] = decision["duplicate_of"]
+                    meta["duplicate_similarity"] = decision["similarity"]
+            metas.append(meta)
 
         self.store.add(texts, metas, ids)
+        #! cached similarity results predate this deviation
+        bump_corpus_generation()
+        if signature is not None:
+            self.duplicates.add(summary_id, signature, decision["duplicate_of"])
+        return decision
+
+    def save_many(self, items):
+        """
+        Save several deviations, items are (summary_id, answers, source_text).
+        Returns one outcome per item: its dedup decision, or the exception that stopped it.
+        Without dedup every answer goes through one store.add (one embedding call, one bulk insert);
+        with dedup each deviation is matched in order so duplicates inside the batch are caught too.
+        Saving an id again is harmless (store ids are deterministic), so failed items can be retried.
+        """
+        if self.duplicates is not None:
+            outcomes = []
+            for summary_id, answers, source_text in items:
+                try:
+                    outcomes.append(self.save_answers(summary_id, answers, source_text))
+                except Exception as e:
+                    outcomes.append(e)
+            return outcomes
+        texts, metas, ids = [], [], []
+        for summary_id, answers, _ in items:
+            for i, a in enumerate(answers, 1):
+                ids.append(f"{summary_id}_{i}")
+                texts.append(a)
+                metas.append({"summary_id": summary_id, "answer": a})
+        if texts:
+            try:
+                self.store.add(texts, metas, ids)
+            except Exception as e:
+                return [e for _ in items]
+            bump_corpus_generation()
+        return [{"action": "added", "duplicate_of": None, "similarity": None} for _ in items]
+
+    async def asave_answers(self, summary_id, answers, source_text=None):
+        if self.duplicates is not None:
+            # signature matching (and the merge update) stay on the sync path, off the event loop
+            return await asyncio.to_thread(self.save_answers, summary_id, answers, source_text)
+        texts = list(answers)
+        ids = [f"{summary_id}_{i}" for i in range(1, len(texts) + 1)]
+        metas = [{"summary_id": summary_id, "answer": a} for a in texts]
+        await self.store.aadd(texts, metas, ids)
+        await asyncio.to_thread(bump_corpus_generation)
+        return {"action": "added", "duplicate_of": None, "similarity": None}
 
 class DeviationSimilarityService:
     def __init__(self, vector_store: VectorStore):
         self.store = vector_store
+        self.cache = get_similarity_cache()
+
+    def _cache_filters(self):
+        # results of different backends / embedding versions / retrieval modes never share entries
+        from files import vectorstores
+
+        return {
+            "store": type(self.store).__name__,
+            "collection": getattr(self.store, "collection_name", None),
+            "version": getattr(self.store, "version", None),
+            "retrieval": vectorstores.RETRIEVAL_MODE,
+        }
+
+    def _query(self, text, top_k):
+        embedder = getattr(self.store, "embedder", None)
+        if self.cache is None or embedder is None:
+            return self.store.query(text, top_k)
+        # generation is read before searching, so an ingest racing this query leaves the entry stale
+        generation = self.cache.generation.current()
+        vector = self.cache.embed(embedder, text)
+        key = self.cache.key(vector, top_k, self._cache_filters())
+        hits = self.cache.get(key, generation)
+        if hits is None:
+            hits = self.store.query_vector(text, vector, top_k)
+            self.cache.set(key, generation, hits)
+        return hits
 
     def find_similar(self, answers, top_k=3):
+        collapse = dedup.DEDUP_POLICY != "off"
         results = []
         for a in  answers:
-            hits = self.store.query(a, top_k)
+            if collapse:
+                # over-fetch so that collapsing duplicate clusters still leaves top_k distinct cases
+                hits = dedup.collapse_duplicates(self._query(a, top_k * 3), top_k)
+            else:
+                hits = self._query(a, top_k)
             results.append({
                 "answer": a,
                 "matches": hits
             })
         return results
+
+    async def afind_similar(self, answers, top_k=3):
+        collapse = dedup.DEDUP_POLICY != "off"
+        depth = top_k * 3 if collapse else top_k
+        # all answers are queried concurrently
+        if self.cache is None:
+            all_hits = await asyncio.gather(*(self.store.aquery(a, depth) for a in answers))
+        else:
+            all_hits = await asyncio.gather(*(asyncio.to_thread(self._query, a, depth) for a in answers))
+        return [
+            {
+                "answer": a,
+                "matches": dedup.collapse_duplicates(hits, top_k) if collapse else hits
+            }
+            for a, hits in zip(answers, all_hits)
+        ]
@@ -1,8 +1,8 @@
 
 import os
+import asyncio
 from abc import ABC, abstractmethod
 from typing import List
-from openai import OpenAI
 
 
 class Embedder(ABC):
@@ -10,17 +10,30 @@ class Embedder(ABC):
     def embed(self, texts: List[str]) -> List[list]:
         pass
 
+    async def aembed(self, texts: List[str]) -> List[list]:
+        # default for embedders without a native async client
+        return await asyncio.to_thread(self.embed, texts)
+
 
 class SentenceTransformerEmbedder(Embedder):
     def __init__(
         self,
         model: str = "text-embedding-3-small",
-        api_key: str | None = None
+        api_key: str | None = None,
+        dimensions: int | None = None
     ):
+        from openai import OpenAI
+
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
         self.client = OpenAI(
-            api_key=api_key or os.getenv("OPENAI_API_KEY")
+            api_key=self.api_key
         )
+        self.async_client = None
         self.model = model
+        self.dimensions = dimensions
+
+    def _request_kwargs(self) -> dict:
+        return {"dimensions": self.dimensions} if self.dimensions else {}
 
     def embed(self, texts: List[str]) -> List[list]:
         if not texts:
@@ -28,8 +41,24 @@ class SentenceTransformerEmbedder(Embedder):
 
         response = self.client.embeddings.create(
             model=self.model,
-            input=texts
+            input=texts,
+            **self._request_kwargs()
         )
 
         # Keep same return shape as SentenceTransformer
         return [item.embedding for item in response.data]
+
+    async def aembed(self, texts: List[str]) -> List[list]:
+        if not texts:
+            return []
+        if self.async_client is None:
+            from openai import AsyncOpenAI
+
+            self.async_client = AsyncOpenAI(api_key=self.api_key)
+
+        response = await self.async_client.embeddings.create(
+            model=self.model,
+            input=texts,
+            **self._request_kwargs()
+        )
+        return [item.embedding for item in response.data]
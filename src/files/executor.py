@@ -0,0 +1,53 @@
+from typing import Any, Dict, List, Optional
+import requests
+
+#! minimal single-shot executor: one chat-completions request per kickoff,
+#! no crewai agent loop, tool scaffolding or event bus around it
+
+
+def _compact(text: str) -> str:
+    # agent definitions are indented triple-quoted strings, the indentation is just wasted tokens
+    return "\n".join(line.strip() for line in text.strip().splitlines())
+
+
+class DirectOutput:
+    """Result of a direct kickoff, shaped like crewai's output where callers need it (`.raw`)."""
+
+    def __init__(self, raw: str, agent_role: str, usage_metrics: Optional[Dict[str, Any]] = None):
+        self.raw = raw
+        self.agent_role = agent_role
+        self.usage_metrics = usage_metrics or {}
+
+    def __str__(self) -> str:
+        return self.raw
+
+
+class DirectAgentExecutor:
+    def __init__(self, role: str, goal: str, backstory: str, llm):
+        self.role = _compact(role)
+        self.goal = _compact(goal)
+        self.backstory = _compact(backstory)
+        self.llm = llm
+
+    @classmethod
+    def from_agent(cls, agent, llm=None) -> "DirectAgentExecutor":
+        return cls(agent.role, agent.goal, agent.backstory, llm or agent.llm)
+
+    def system_prompt(self) -> str:
+        return f"You are {self.role}. {self.backstory}\nYour personal goal is: {self.goal}"
+
+    def build_messages(self, query: str) -> List[Dict[str, str]]:
+        return [
+            {"role": "system", "content": self.system_prompt()},
+            {"role": "user", "content": query},
+        ]
+
+    def kickoff(self, query: str) -> DirectOutput:
+        try:
+            data = self.llm.chat(self.build_messages(query))
+            content = data["choices"][0]["message"]["content"]
+            usage = data.get("usage") or {}
+        except requests.exceptions.RequestException as e:
+            # same failure contract as CustomLLM.call
+            content, usage = f"[LLM ERROR] {str(e)}", {}
+        return DirectOutput(raw=content, agent_role=self.role, usage_metrics=usage)
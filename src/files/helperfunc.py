@@ -1,6 +1,6 @@
+import re
 import json
-from typing import Dict, List, Any
-import pandas as pd
+from typing import Dict, List, Any, Optional, Tuple
 import sys
 
 
@@ -28,7 +28,8 @@ def load_active_prompts(filepath: str) -> List[List[str]]:
         list: A 2D list containing [section, subsection, prompt] for active rows.
     '''
     try:
-        # Step 1: Read the Excel file
+        # Step 1: Read the Excel file (pandas is imported here to keep app startup light)
+        import pandas as pd
         df = pd.read_excel(filepath, engine='openpyxl')
 
         # Step 2: Filter rows where 'isactive is True
@@ -86,21 +87,8 @@ def processing_content(questions_list: List[Dict[str, Any]], summary: str, llm)
         return ans
     except Exception as e:
         raise
-def process_description(summary:str,llm) -> List[str]:
-    prompt=f"""You are an expert pharmaceutical GMP deviation analyst with strong knowledge of FDA 21 CFR 210/211, EU GMP, ICH Q9, and quality systems.
-
-You are given the following deviation summary:
-{summary}
-
-Answer the following 10 questions strictly from a GMP and regulatory perspective. 
-Use the format exactly as shown:
-# Ans1
-# Ans2
-...
-# Ans10
-Do not repeat the questions. Be clear, factual, and inspection-ready.
-
-1. What Went Wrong – In 3–4 sentences, explain what fundamentally went wrong in this deviation, focusing on the type of failure (process, system, equipment, or human) rather than specific minor details.
+#! the 10 analysis questions, shared by process_description and the fused brain analysis
+ANALYSIS_QUESTIONS = """1. What Went Wrong – In 3–4 sentences, explain what fundamentally went wrong in this deviation, focusing on the type of failure (process, system, equipment, or human) rather than specific minor details.
 
 2. What Failed or Was Bypassed – Describe which control, system, procedure, or barrier was intended to prevent this deviation and explain clearly why it failed or was bypassed.
 
@@ -120,8 +108,84 @@ Do not repeat the questions. Be clear, factual, and inspection-ready.
 
 10. Technical Keywords and Search Terms – Provide a comma-separated list of relevant technical terms, equipment types, problem types, and GMP terminology that best describe this deviation.
 """
+
+
+def process_description(summary:str,llm) -> List[str]:
+    prompt=f"""You are an expert pharmaceutical GMP deviation analyst with strong knowledge of FDA 21 CFR 210/211, EU GMP, ICH Q9, and quality systems.
+
+You are given the following deviation summary:
+{summary}
+
+Answer the following 10 questions strictly from a GMP and regulatory perspective. 
+Use the format exactly as shown:
+# Ans1
+# Ans2
+...
+# Ans10
+Do not repeat the questions. Be clear, factual, and inspection-ready.
+
+{ANALYSIS_QUESTIONS}"""
     response=llm.call(prompt)
     response=response if isinstance(response, str) else str(response)
     answers=response.split('#')[1:]
     return answers
 
+
+_ANSWER_MARKER = re.compile(r"^[ \t]*#{1,6}[ \t]*(?:Ans(?:wer)?|A)[ \t]*(\d{1,2})\b[ \t:.)-]*", re.IGNORECASE | re.MULTILINE)
+_SUMMARY_MARKER = re.compile(r"^[ \t]*#{1,6}[ \t]*(?:Executive[ \t]+)?Summary\b[ \t:]*", re.IGNORECASE | re.MULTILINE)
+
+
+def format_answer(index: int, text: str) -> str:
+    # same shape as process_description's split('#') pieces, so stored and queried answers embed alike
+    return f" Ans{index}\n{text.strip()}\n"
+
+
+def _json_object(response: str) -> Optional[dict]:
+    text = re.sub(r"^```(?:json)?\s*|\s*```$", "", response.strip(), flags=re.IGNORECASE)
+    # decode from the first "{" that starts a valid object, whatever follows it is ignored
+    decoder = json.JSONDecoder()
+    start = text.find("{")
+    while start != -1:
+        try:
+            data, _ = decoder.raw_decode(text, start)
+        except ValueError:
+            start = text.find("{", start + 1)
+            continue
+        if isinstance(data, dict):
+            return data
+        start = text.find("{", start + 1)
+    return None
+
+
+def parse_analysis_response(response: str, expected: int = 10) -> Tuple[Optional[str], List[str]]:
+    """
+    Parse a summary + numbered answers response.
+
+    Accepts a JSON object ({"summary": ..., "answers": [...]}, optionally fenced) and
+    falls back to "# Summary" / "# AnsN" markdown headers. Returns (summary or None,
+    answers in format_answer shape); answers that could not be found are left out.
+    """
+    data = _json_object(response)
+    if data is not None and isinstance(data.get("answers"), list):
+        answers = []
+        for i, item in enumerate(data["answers"][:expected], 1):
+            if isinstance(item, dict):
+                item = item.get("answer") or item.get("text") or ""
+            if str(item).strip():
+                answers.append(format_answer(i, str(item)))
+        summary = data.get("summary")
+        return (str(summary).strip() if summary else None), answers
+
+    markers = sorted(
+        [(m.start(), m.end(), int(m.group(1))) for m in _ANSWER_MARKER.finditer(response)]
+        + [(m.start(), m.end(), 0) for m in _SUMMARY_MARKER.finditer(response)]
+    )
+    sections: Dict[int, str] = {}
+    for (start, end, index), following in zip(markers, markers[1:] + [(len(response), 0, None)]):
+        body = response[end:following[0]].strip()
+        # first occurrence wins, a model repeating a header does not overwrite the answer
+        if body and index not in sections and index <= expected:
+            sections[index] = body
+    answers = [format_answer(i, sections[i]) for i in range(1, expected + 1) if i in sections]
+    return sections.get(0), answers
+
@@ -0,0 +1,339 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+from files.metrics import metrics
+
+#! write-behind ingestion for /adddata: the request only enqueues the deviation and returns its DEV id,
+#! background workers drain the queue in batches (LLM analysis per record, one embedding call and one
+#! bulk insert per batch), retry failures with backoff and park records that keep failing in a dead-letter list
+#! INGEST_QUEUE: "off" (default, /adddata ingests inline), "local" (sqlite file, one host) or
+#! "redis" (Redis stream + consumer group, shared by every API worker)
+INGEST_QUEUE = os.getenv("INGEST_QUEUE", "off").lower()
+INGEST_QUEUE_PATH = os.getenv("INGEST_QUEUE_PATH", "ingest_queue.db")
+INGEST_REDIS_URL = os.getenv("INGEST_REDIS_URL", "redis://localhost:6379/0")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 1))
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 16))
+INGEST_POLL_S = float(os.getenv("INGEST_POLL_S", 1.0))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 5))
+INGEST_RETRY_BACKOFF_S = float(os.getenv("INGEST_RETRY_BACKOFF_S", 5))
+#! a claimed record not acked within this time (worker crashed) is handed out again
+INGEST_VISIBILITY_S = float(os.getenv("INGEST_VISIBILITY_S", 600))
+
+STREAM_KEY = "ingest:stream"
+RETRY_KEY = "ingest:retry"
+DEAD_LETTER_KEY = "ingest:dead_letter"
+CONSUMER_GROUP = "ingest-workers"
+
+
+class IngestRecord:
+    """One queued deviation. `state` keeps pipeline progress (answers, indexed) across retries."""
+
+    def __init__(self, deviation_id: str, data: Dict[str, Any], enqueued_at: float,
+                 attempts: int = 0, state: Optional[Dict[str, Any]] = None, receipt: Any = None):
+        self.id = deviation_id
+        self.data = data
+        self.enqueued_at = enqueued_at
+        self.attempts = attempts
+        self.state = state or {}
+        self.receipt = receipt  # backend handle used by ack / retry
+
+    def to_json(self) -> str:
+        return json.dumps({
+            "id": self.id,
+            "data": self.data,
+            "enqueued_at": self.enqueued_at,
+            "attempts": self.attempts,
+            "state": self.state,
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, raw, receipt: Any = None) -> "IngestRecord":
+        value = json.loads(raw)
+        return cls(value["id"], value["data"], value["enqueued_at"], value.get("attempts", 0),
+                   value.get("state"), receipt)
+
+
+def retry_delay(attempts: int) -> float:
+    return INGEST_RETRY_BACKOFF_S * (2 ** max(0, attempts - 1))
+
+
+class SqliteIngestQueue:
+    """Durable on-disk queue; a connection per call so API and worker threads can share it."""
+
+    def __init__(self, path: str = INGEST_QUEUE_PATH):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingest_queue ("
+                " id TEXT PRIMARY KEY, record TEXT NOT NULL, status TEXT NOT NULL,"
+                " enqueued_at REAL NOT NULL, available_at REAL NOT NULL, claimed_at REAL, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ingest_queue_ready ON ingest_queue (status, available_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, record: IngestRecord):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO ingest_queue (id, record, status, enqueued_at, available_at) VALUES (?, ?, 'pending', ?, ?)",
+                (record.id, record.to_json(), record.enqueued_at, record.enqueued_at),
+            )
+
+    def claim(self, limit: int) -> List[IngestRecord]:
+        now = time.time()
+        with self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same row
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(
+                    "SELECT id, record FROM ingest_queue"
+                    " WHERE (status = 'pending' AND available_at <= ?) OR (status = 'processing' AND claimed_at <= ?)"
+                    " ORDER BY enqueued_at LIMIT ?",
+                    (now, now - INGEST_VISIBILITY_S, limit),
+                ).fetchall()
+                conn.executemany(
+                    "UPDATE ingest_queue SET status = 'processing', claimed_at = ? WHERE id = ?",
+                    [(now, row[0]) for row in rows],
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return [IngestRecord.from_json(raw, receipt=deviation_id) for deviation_id, raw in rows]
+
+    def ack(self, records: List[IngestRecord]):
+        with self._connect() as conn:
+            conn.executemany("DELETE FROM ingest_queue WHERE id = ?", [(r.id,) for r in records])
+
+    def retry(self, record: IngestRecord, error: str, delay: float):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest_queue SET record = ?, status = 'pending', available_at = ?, claimed_at = NULL, error = ?"
+                " WHERE id = ?",
+                (record.to_json(), time.time() + delay, error, record.id),
+            )
+
+    def dead_letter(self, record: IngestRecord, error: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE ingest_queue SET record = ?, status = 'dead', claimed_at = NULL, error = ? WHERE id = ?",
+                (record.to_json(), error, record.id),
+            )
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT record, error FROM ingest_queue WHERE status = 'dead' ORDER BY enqueued_at DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        return [{**json.loads(raw), "error": error} for raw, error in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM ingest_queue GROUP BY status").fetchall())
+            oldest = conn.execute(
+                "SELECT MIN(enqueued_at) FROM ingest_queue WHERE status IN ('pending', 'processing')"
+            ).fetchone()[0]
+        return {
+            "pending": counts.get("pending", 0),
+            "processing": counts.get("processing", 0),
+            "dead": counts.get("dead", 0),
+            "oldest_age_s": round(time.time() - oldest, 1) if oldest else 0.0,
+        }
+
+
+class RedisStreamIngestQueue:
+    """
+    Redis stream read through a consumer group. Retries wait in a sorted set scored by
+    due time and are moved back onto the stream when due; dead letters are a list.
+    """
+
+    def __init__(self, url: str = INGEST_REDIS_URL):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        try:
+            self.client.xgroup_create(STREAM_KEY, CONSUMER_GROUP, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    def enqueue(self, record: IngestRecord):
+        self.client.xadd(STREAM_KEY, {"record": record.to_json()})
+
+    def _release_due_retries(self):
+        for raw in self.client.zrangebyscore(RETRY_KEY, "-inf", time.time(), start=0, num=100):
+            # ZREM decides which worker moves a record, so it is re-queued exactly once
+            if self.client.zrem(RETRY_KEY, raw):
+                self.client.xadd(STREAM_KEY, {"record": raw})
+
+    def claim(self, limit: int) -> List[IngestRecord]:
+        self._release_due_retries()
+        # messages claimed by a crashed consumer and never acked
+        _, messages, *_ = self.client.xautoclaim(
+            STREAM_KEY, CONSUMER_GROUP, self.consumer, min_idle_time=int(INGEST_VISIBILITY_S * 1000), count=limit
+        )
+        if not messages:
+            response = self.client.xreadgroup(
+                CONSUMER_GROUP, self.consumer, {STREAM_KEY: ">"}, count=limit, block=int(INGEST_POLL_S * 1000)
+            )
+            messages = response[0][1] if response else []
+        return [
+            IngestRecord.from_json(fields["record"], receipt=message_id)
+            for message_id, fields in messages if fields
+        ]
+
+    def _remove(self, records: List[IngestRecord]):
+        ids = [r.receipt for r in records]
+        if ids:
+            pipe = self.client.pipeline()
+            pipe.xack(STREAM_KEY, CONSUMER_GROUP, *ids)
+            pipe.xdel(STREAM_KEY, *ids)
+            pipe.execute()
+
+    def ack(self, records: List[IngestRecord]):
+        self._remove(records)
+
+    def retry(self, record: IngestRecord, error: str, delay: float):
+        self.client.zadd(RETRY_KEY, {record.to_json(): time.time() + delay})
+        self._remove([record])
+
+    def dead_letter(self, record: IngestRecord, error: str):
+        self.client.lpush(DEAD_LETTER_KEY, json.dumps({**json.loads(record.to_json()), "error": error}))
+        self._remove([record])
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        return [json.loads(raw) for raw in self.client.lrange(DEAD_LETTER_KEY, 0, limit - 1)]
+
+    def stats(self) -> Dict[str, Any]:
+        oldest = self.client.xrange(STREAM_KEY, count=1)
+        # stream ids start with the enqueue time in ms
+        oldest_ms = int(oldest[0][0].split("-")[0]) if oldest else None
+        pending = self.client.xpending(STREAM_KEY, CONSUMER_GROUP)
+        return {
+            "pending": self.client.xlen(STREAM_KEY) - pending["pending"] + self.client.zcard(RETRY_KEY),
+            "processing": pending["pending"],
+            "dead": self.client.llen(DEAD_LETTER_KEY),
+            "oldest_age_s": round(time.time() - oldest_ms / 1000, 1) if oldest_ms else 0.0,
+        }
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_ingest_queue():
+    """The process-wide queue, or None when INGEST_QUEUE is off."""
+    global _queue
+    if INGEST_QUEUE == "off":
+        return None
+    with _queue_lock:
+        if _queue is None:
+            if INGEST_QUEUE == "local":
+                _queue = SqliteIngestQueue()
+            elif INGEST_QUEUE == "redis":
+                _queue = RedisStreamIngestQueue()
+            else:
+                raise ValueError(f"Unknown INGEST_QUEUE: {INGEST_QUEUE} (expected off, local or redis)")
+        return _queue
+
+
+def enqueue(deviation_id: str, data: Dict[str, Any]):
+    get_ingest_queue().enqueue(IngestRecord(deviation_id, data, time.time()))
+    metrics.inc("ingest_enqueued")
+
+
+class IngestWorker:
+    """
+    Drains the queue in batches through `process_batch(records) -> {deviation_id: exception}`.
+    Failed records are retried with exponential backoff, after INGEST_MAX_ATTEMPTS they are dead-lettered.
+    """
+
+    def __init__(self, queue, process_batch: Callable[[List[IngestRecord]], Dict[str, Exception]],
+                 batch_size: int = INGEST_BATCH_SIZE):
+        self.queue = queue
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def run_once(self) -> int:
+        """Process one batch; returns the number of records claimed."""
+        records = self.queue.claim(self.batch_size)
+        if not records:
+            return 0
+        metrics.observe("ingest_batch_size", len(records))
+        try:
+            failures = self.process_batch(records)
+        except Exception as e:
+            failures = {r.id: e for r in records}
+
+        done = [r for r in records if r.id not in failures]
+        self.queue.ack(done)
+        now = time.time()
+        for record in done:
+            # enqueue -> stored in the vector store and Redis
+            metrics.observe("ingest_lag_ms", (now - record.enqueued_at) * 1000)
+        metrics.inc("ingest_processed", len(done))
+
+        for record in records:
+            error = failures.get(record.id)
+            if error is None:
+                continue
+            record.attempts += 1
+            message = f"{type(error).__name__}: {error}"
+            if record.attempts >= INGEST_MAX_ATTEMPTS:
+                print(f"Ingest of {record.id} failed {record.attempts} times, dead-lettered: {message}")
+                self.queue.dead_letter(record, message)
+                metrics.inc("ingest_dead_lettered")
+            else:
+                self.queue.retry(record, message, retry_delay(record.attempts))
+                metrics.inc("ingest_retries")
+        return len(records)
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                # queue backend unavailable; keep the worker alive and try again
+                print(f"Ingest worker error: {e}")
+                metrics.inc("ingest_worker_errors")
+                claimed = 0
+            if not claimed:
+                self._stop.wait(INGEST_POLL_S)
+
+    def start(self, workers: int = INGEST_WORKERS):
+        for n in range(workers):
+            thread = threading.Thread(target=self._loop, name=f"ingest-worker-{n}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 30):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+def queue_stats() -> Dict[str, Any]:
+    queue = get_ingest_queue()
+    if queue is None:
+        return {"mode": "off"}
+    stats = queue.stats()
+    metrics.set_gauge("ingest_queue_depth", stats["pending"] + stats["processing"])
+    return {"mode": INGEST_QUEUE, **stats, "lag_ms": metrics.summary("ingest_lag_ms")}
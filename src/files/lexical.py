@@ -0,0 +1,194 @@
+import re
+import math
+import time
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from typing import List, Dict, Any, Iterable, Optional, Tuple
+
+#! BM25 inverted index over the deviation analysis answers
+#! answer #10 (technical keywords) is indexed with extra weight and as phrases,
+#! so exact equipment / failure terms ("HVAC", "tablet press") always match
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/][a-z0-9]+)*")
+KEYWORD_LABEL_RE = re.compile(r"^\s*(?:ans(?:wer)?\s*10|10)\s*[:.)\-–]*\s*", re.IGNORECASE)
+KEYWORD_WEIGHT = 3
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in", "is", "it", "of",
+    "on", "or", "that", "the", "this", "to", "was", "were", "which", "with",
+}
+
+
+def as_text(value: Any) -> str:
+    # stored answers are either one string or the list of 10 answers
+    if isinstance(value, (list, tuple)):
+        return "\n".join(str(v) for v in value)
+    return str(value)
+
+
+def tokenize(text: str) -> List[str]:
+    """Unigrams plus adjacent bigrams ("tablet press" -> "tablet_press") for phrase matches."""
+    words = [w for w in TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def extract_keywords(value: Any) -> List[str]:
+    """Keyword phrases from answer #10 of process_description (comma-separated list)."""
+    if isinstance(value, (list, tuple)):
+        if len(value) < 10:
+            return []
+        value = value[9]
+    else:
+        # a single string carries the keywords on its last line
+        value = str(value).strip().splitlines()[-1] if str(value).strip() else ""
+    value = KEYWORD_LABEL_RE.sub("", str(value))
+    return [k.strip() for k in value.split(",") if k.strip()]
+
+
+class LexicalIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        self._doc_len: Dict[str, float] = {}
+        self._total_len = 0.0
+        self._lock = threading.RLock()
+        # used by sync() when the index is fed straight from Mongo
+        self.watermark = None
+        self._last_sync = 0.0
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._doc_len
+
+    def add(self, doc_id: str, text: Any, keywords: Optional[Iterable[str]] = None):
+        if keywords is None:
+            keywords = extract_keywords(text)
+        terms: Dict[str, float] = defaultdict(float)
+        for term in tokenize(as_text(text)):
+            terms[term] += 1
+        for keyword in keywords:
+            for term in tokenize(keyword):
+                terms[term] += KEYWORD_WEIGHT
+
+        with self._lock:
+            if doc_id in self._doc_len:
+                return
+            for term, tf in terms.items():
+                self._postings[term][doc_id] = tf
+            length = sum(terms.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def search(self, query: Any, top_k: int = 10) -> List[Tuple[str, float]]:
+        query_terms = set(tokenize(as_text(query)))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = defaultdict(float)
+            for term in query_terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] += idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+
+    def sync(self, collection, field: str, min_interval: float = 5.0, overlap_seconds: float = 60.0) -> int:
+        """Index documents ingested since the last sync (text only, embeddings are not pulled)."""
+        now = time.monotonic()
+        if now - self._last_sync < min_interval:
+            return 0
+        self._last_sync = now
+
+        query: Dict[str, Any] = {field: {"$exists": True}}
+        if self.watermark is not None:
+            query["ingested_at"] = {"$gte": self.watermark - timedelta(seconds=overlap_seconds)}
+        added = 0
+        for doc in collection.find(query, projection={"_id": 1, "text": 1, "ingested_at": 1}):
+            if doc["_id"] not in self:
+                self.add(doc["_id"], doc["text"])
+                added += 1
+            ingested_at = doc.get("ingested_at")
+            if ingested_at is not None and (self.watermark is None or ingested_at > self.watermark):
+                self.watermark = ingested_at
+        return added
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> Dict[str, float]:
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return scores
+
+
+def _min_max(scores: Dict[str, float]) -> Dict[str, float]:
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    span = (high - low) or 1.0
+    return {doc_id: (score - low) / span for doc_id, score in scores.items()}
+
+
+def weighted_blend(dense: Dict[str, float], lexical: Dict[str, float], alpha: float = 0.5) -> Dict[str, float]:
+    """alpha * dense + (1 - alpha) * lexical, both min-max normalised."""
+    dense, lexical = _min_max(dense), _min_max(lexical)
+    return {
+        doc_id: alpha * dense.get(doc_id, 0.0) + (1 - alpha) * lexical.get(doc_id, 0.0)
+        for doc_id in set(dense) | set(lexical)
+    }
+
+
+def fuse_results(
+    dense_results: List[Dict[str, Any]],
+    lexical_hits: List[Tuple[str, float]],
+    top_k: int,
+    method: str = "rrf",
+    alpha: float = 0.5,
+) -> List[Dict[str, Any]]:
+    """
+    Merge dense results (dicts with id/score) with lexical hits, keeping the dense result shape.
+    Results are ordered by `fused_score`; `score` stays the cosine similarity, which callers
+    compare against similarity thresholds (an RRF value is only meaningful as a rank).
+    """
+    rows = {r["id"]: r for r in dense_results}
+    dense_scores = {r["id"]: r["score"] for r in dense_results}
+    lexical_scores = dict(lexical_hits)
+
+    if method == "weighted":
+        fused = weighted_blend(dense_scores, lexical_scores, alpha)
+    else:
+        dense_ranking = [r["id"] for r in sorted(dense_results, key=lambda r: r["score"], reverse=True)]
+        fused = reciprocal_rank_fusion([dense_ranking, [doc_id for doc_id, _ in lexical_hits]])
+
+    results = []
+    for doc_id, score in sorted(fused.items(), key=lambda x: x[1], reverse=True):
+        if doc_id not in rows:
+            # lexical-only hit without an embedding in the active version
+            continue
+        results.append({
+            **rows[doc_id],
+            "fused_score": score,
+            "lexical_score": lexical_scores.get(doc_id, 0.0),
+        })
+        if len(results) == top_k:
+            break
+    return results
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_lexical_index(name: str) -> LexicalIndex:
+    with _indexes_lock:
+        if name not in _indexes:
+            _indexes[name] = LexicalIndex()
+        return _indexes[name]
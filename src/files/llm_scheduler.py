@@ -0,0 +1,212 @@
+import os
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import Future
+from typing import Callable, Any, Dict, List, Optional
+
+from files.metrics import metrics
+from files.cancellation import current_token, RequestCancelled, CANCEL_POLL_S
+
+#! process-wide scheduler between callers and CustomLLM
+#! - priority classes: interactive (brain, gmp generation) is always served before bulk (ingest, batch)
+#! - requests-per-minute and tokens-per-minute token buckets
+#! - max in-flight cap
+#! enabled with LLM_SCHEDULER=1
+LLM_SCHEDULER = os.getenv("LLM_SCHEDULER", "0") == "1"
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", 8))
+LLM_RPM = float(os.getenv("LLM_RPM", 0))  # 0 = unlimited
+LLM_TPM = float(os.getenv("LLM_TPM", 0))  # 0 = unlimited
+#! completion size is unknown before the call, the bucket is corrected with the real usage afterwards
+LLM_EST_COMPLETION_TOKENS = int(os.getenv("LLM_EST_COMPLETION_TOKENS", 512))
+
+PRIORITIES = {"interactive": 0, "bulk": 1}
+
+_priority = contextvars.ContextVar("llm_priority", default="interactive")
+
+
+@contextmanager
+def llm_priority(name: str):
+    """Run the enclosed LLM calls under a priority class ("interactive" or "bulk")."""
+    if name not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {name}")
+    token = _priority.set(name)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+def estimate_tokens(messages: List[Dict[str, str]]) -> int:
+    # ~4 characters per token is close enough for admission control
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + LLM_EST_COMPLETION_TOKENS
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be taken (0 when it can be taken now)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float):
+        # positive refunds over-estimates, negative charges under-estimates (may go below zero)
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class LLMScheduler:
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, rpm: float = LLM_RPM, tpm: float = LLM_TPM):
+        self.max_in_flight = max_in_flight
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+        self.in_flight = 0
+        self._queue: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _admission_wait(self, estimated_tokens: int) -> Optional[float]:
+        """None when the head request can start now, otherwise how long to sleep before re-checking."""
+        if self.in_flight >= self.max_in_flight:
+            return 1.0  # woken up by release()
+        waits = []
+        if self.requests is not None:
+            waits.append(self.requests.wait_time(1))
+        if self.tokens is not None:
+            waits.append(self.tokens.wait_time(estimated_tokens))
+        wait = max(waits, default=0.0)
+        return wait if wait > 0 else None
+
+    def _publish_depth(self):
+        for name, level in PRIORITIES.items():
+            metrics.set_gauge(f"llm_queue_depth.{name}", sum(1 for t in self._queue if t[0] == level))
+        metrics.set_gauge("llm_in_flight", self.in_flight)
+
+    def _abandon(self, ticket: tuple):
+        # a cancelled request leaves the queue without taking a slot
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._publish_depth()
+        self._cond.notify_all()
+
+    def acquire(self, estimated_tokens: int, priority: Optional[str] = None) -> str:
+        priority = priority or current_priority()
+        ticket = (PRIORITIES[priority], next(self._seq), estimated_tokens)
+        token = current_token()
+        start = time.monotonic()
+        with self._cond:
+            heapq.heappush(self._queue, ticket)
+            self._publish_depth()
+            while True:
+                if token is not None and token.cancelled:
+                    self._abandon(ticket)
+                    metrics.inc("llm_cancelled_before_start")
+                    raise RequestCancelled(token.reason)
+                if self._queue[0] is ticket:
+                    wait = self._admission_wait(estimated_tokens)
+                    if wait is None:
+                        break
+                    self._cond.wait(timeout=wait if token is None else min(wait, CANCEL_POLL_S))
+                else:
+                    self._cond.wait(timeout=None if token is None else CANCEL_POLL_S)
+            heapq.heappop(self._queue)
+            if self.requests is not None:
+                self.requests.take(1)
+            if self.tokens is not None:
+                self.tokens.take(estimated_tokens)
+            self.in_flight += 1
+            self._publish_depth()
+            # the next ticket may be admissible as well
+            self._cond.notify_all()
+        metrics.observe(f"llm_wait_ms.{priority}", (time.monotonic() - start) * 1000)
+        return priority
+
+    def release(self, estimated_tokens: int, actual_tokens: Optional[int] = None):
+        with self._cond:
+            self.in_flight -= 1
+            if self.tokens is not None and actual_tokens:
+                self.tokens.adjust(estimated_tokens - actual_tokens)
+            self._publish_depth()
+            self._cond.notify_all()
+
+    def _settle(self, future: Future, estimated_tokens: int, usage_of: Optional[Callable[[Any], Optional[int]]]):
+        actual = None
+        if usage_of is not None and not future.cancelled() and future.exception() is None:
+            actual = usage_of(future.result())
+        self.release(estimated_tokens, actual)
+
+    def run(self, fn: Callable[[], Any], estimated_tokens: int, priority: Optional[str] = None,
+            usage_of: Optional[Callable[[Any], Optional[int]]] = None) -> Any:
+        """Run `fn` once admitted; `usage_of(result)` returns the real token count to settle the bucket."""
+        priority = self.acquire(estimated_tokens, priority)
+        start = time.monotonic()
+        actual = None
+        deferred = False
+        try:
+            result = fn()
+            if usage_of is not None:
+                actual = usage_of(result)
+            return result
+        except RequestCancelled as e:
+            if e.pending is not None:
+                # the caller gave up but the HTTP call is still running against the provider:
+                # it keeps its slot and is settled with its real usage once it completes
+                deferred = True
+                e.pending.add_done_callback(lambda f: self._settle(f, estimated_tokens, usage_of))
+            raise
+        finally:
+            if not deferred:
+                self.release(estimated_tokens, actual)
+            metrics.observe(f"llm_call_ms.{priority}", (time.monotonic() - start) * 1000)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth = {name: sum(1 for t in self._queue if t[0] == level) for name, level in PRIORITIES.items()}
+            in_flight = self.in_flight
+        return {
+            "enabled": True,
+            "in_flight": in_flight,
+            "max_in_flight": self.max_in_flight,
+            "queue_depth": depth,
+            "wait_ms": {name: metrics.summary(f"llm_wait_ms.{name}") for name in PRIORITIES},
+        }
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """The shared scheduler, or None when LLM_SCHEDULER is off."""
+    global _scheduler
+    if not LLM_SCHEDULER:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,58 @@
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Any
+
+#! process-wide counters, gauges and latency samples, exposed on GET /metrics
+
+
+def _percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Metrics:
+    def __init__(self, window: int = 2048):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._gauges: Dict[str, float] = {}
+        self._samples: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value: float):
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record one sample (latencies in ms); summaries cover the most recent `window` samples."""
+        with self._lock:
+            self._samples[name].append(value)
+
+    def summary(self, name: str) -> Dict[str, float]:
+        with self._lock:
+            values = sorted(self._samples.get(name, ()))
+        return {
+            "count": len(values),
+            "p50": round(_percentile(values, 0.50), 2),
+            "p95": round(_percentile(values, 0.95), 2),
+            "p99": round(_percentile(values, 0.99), 2),
+            "max": round(values[-1], 2) if values else 0.0,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            names = list(self._samples)
+        return {
+            "counters": counters,
+            "gauges": gauges,
+            "summaries": {name: self.summary(name) for name in names},
+        }
+
+
+metrics = Metrics()
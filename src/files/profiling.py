@@ -0,0 +1,277 @@
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import shutil
+import sysconfig
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from files.metrics import metrics
+
+#! opt-in request profiling for /brainstorming and /gmpgeneration
+#! PROFILING=1 enables it; a request is then profiled when it sends "X-Profile: 1" or falls in the
+#! PROFILE_SAMPLE_RATE fraction of traffic. The whole brain / deviation_generation call is sampled
+#! (wall and CPU time per stack) and written to PROFILE_DIR/<profile id>/, see GET /admin/profiles
+#! PROFILE_ENGINE: "auto" (pyinstrument when installed, else the built-in sampler), "pyinstrument" or "sampler"
+PROFILING = os.getenv("PROFILING", "0") == "1"
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_ENGINE = os.getenv("PROFILE_ENGINE", "auto").lower()
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 50))
+PROFILE_INTERVAL_S = float(os.getenv("PROFILE_INTERVAL_S", 0.005))
+#! the admin endpoints need ADMIN_TOKEN (files/admin.py) and answer 404 while PROFILING is off
+
+PROFILE_HEADER = "x-profile"
+REQUEST_ID_HEADER = "x-request-id"
+METADATA_FILE = "profile.json"
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,127}$")
+_write_lock = threading.Lock()
+_STDLIB = sysconfig.get_paths()["stdlib"] + os.sep
+
+
+def profile_id_for(headers: Mapping[str, str]) -> Optional[str]:
+    """Profile id when this request should be profiled (the caller's X-Request-Id if usable), else None."""
+    if not PROFILING:
+        return None
+    requested = headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes")
+    if not requested and not (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        return None
+    request_id = headers.get(REQUEST_ID_HEADER, "")
+    if not _SAFE_ID.match(request_id) or os.path.exists(os.path.join(PROFILE_DIR, request_id)):
+        request_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    return request_id
+
+
+def _frame_label(code) -> str:
+    path = code.co_filename
+    marker = "site-packages" + os.sep
+    if marker in path:
+        path = path.split(marker, 1)[1]
+    elif path.startswith(_STDLIB):
+        path = path[len(_STDLIB):]
+    else:
+        path = os.path.basename(path)
+    return f"{path}:{code.co_name}"
+
+
+def _package(label: str) -> str:
+    path = label.split(":", 1)[0]
+    head = path.split(os.sep, 1)[0] if os.sep in path else path
+    return head[:-3] if head.endswith(".py") else head
+
+
+class StackSampler:
+    """
+    Samples one thread's stack every `interval` seconds from a helper thread (stdlib only).
+    Every sample is weighted with the wall time since the previous one and, where the
+    platform exposes per-thread CPU clocks, the CPU time the thread used in between.
+    """
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL_S):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.wall: Dict[str, float] = defaultdict(float)
+        self.cpu: Dict[str, float] = defaultdict(float)
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        try:
+            self._clock = time.pthread_getcpuclockid(thread_id)
+        except (AttributeError, OSError):
+            self._clock = None
+
+    def _cpu_time(self) -> Optional[float]:
+        if self._clock is None:
+            return None
+        try:
+            return time.clock_gettime(self._clock)
+        except OSError:
+            return None
+
+    def _run(self):
+        last_wall, last_cpu = time.perf_counter(), self._cpu_time()
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            now_wall, now_cpu = time.perf_counter(), self._cpu_time()
+            self.wall[key] += now_wall - last_wall
+            if now_cpu is not None and last_cpu is not None:
+                self.cpu[key] += now_cpu - last_cpu
+            last_wall, last_cpu = now_wall, now_cpu
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    @staticmethod
+    def _folded(weights: Dict[str, float]) -> str:
+        # flamegraph.pl / speedscope "collapsed" format, weights in microseconds
+        return "".join(f"{stack} {int(w * 1e6)}\n" for stack, w in sorted(weights.items()) if w > 0)
+
+    @staticmethod
+    def _top(weights: Dict[str, float], n: int = 25) -> List[Dict[str, Any]]:
+        own, total = defaultdict(float), defaultdict(float)
+        for stack, w in weights.items():
+            frames = stack.split(";")
+            own[frames[-1]] += w
+            for label in set(frames):
+                total[label] += w
+        ranked = sorted(total.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [{"frame": label, "total_s": round(t, 4), "self_s": round(own.get(label, 0.0), 4)}
+                for label, t in ranked]
+
+    @staticmethod
+    def _by_package(weights: Dict[str, float]) -> Dict[str, float]:
+        # inclusive time per top-level package: openpyxl / pandas, crewai / litellm, json, requests / urllib3 ...
+        packages = defaultdict(float)
+        for stack, w in weights.items():
+            for package in {_package(label) for label in stack.split(";")}:
+                packages[package] += w
+        return {p: round(t, 4) for p, t in sorted(packages.items(), key=lambda item: item[1], reverse=True)}
+
+    def write(self, directory: str) -> Dict[str, Any]:
+        artifacts = {"wall.folded": self.wall}
+        if self.cpu:
+            artifacts["cpu.folded"] = self.cpu
+        for name, weights in artifacts.items():
+            with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+                f.write(self._folded(weights))
+        return {
+            "samples": self.samples,
+            "interval_s": self.interval,
+            "top_wall": self._top(self.wall),
+            "top_cpu": self._top(self.cpu) if self.cpu else [],
+            "wall_by_package_s": self._by_package(self.wall),
+            "cpu_by_package_s": self._by_package(self.cpu) if self.cpu else {},
+        }
+
+
+class PyinstrumentEngine:
+    def __init__(self, interval: float = PROFILE_INTERVAL_S):
+        from pyinstrument import Profiler
+
+        self.profiler = Profiler(interval=interval, async_mode="disabled")
+
+    def start(self):
+        self.profiler.start()
+
+    def stop(self):
+        self.profiler.stop()
+
+    def write(self, directory: str) -> Dict[str, Any]:
+        with open(os.path.join(directory, "profile.html"), "w", encoding="utf-8") as f:
+            f.write(self.profiler.output_html())
+        with open(os.path.join(directory, "profile.txt"), "w", encoding="utf-8") as f:
+            f.write(self.profiler.output_text(unicode=True, color=False))
+        return {"engine_output": ["profile.html", "profile.txt"]}
+
+
+def _engine():
+    if PROFILE_ENGINE in ("auto", "pyinstrument"):
+        try:
+            return "pyinstrument", PyinstrumentEngine()
+        except ImportError:
+            if PROFILE_ENGINE == "pyinstrument":
+                raise
+    return "sampler", StackSampler(threading.get_ident())
+
+
+def _prune():
+    entries = list_profiles(limit=None)
+    for entry in entries[PROFILE_KEEP:]:
+        shutil.rmtree(os.path.join(PROFILE_DIR, entry["id"]), ignore_errors=True)
+
+
+def profiled(fn: Callable[..., Any], profile_id: Optional[str], label: str) -> Callable[..., Any]:
+    """
+    Wrap `fn` so the call is profiled in the thread that runs it; returns `fn` itself when
+    `profile_id` is None. The profile is written even when the call raises or is cancelled.
+    """
+    if profile_id is None:
+        return fn
+
+    def run(*args, **kwargs):
+        name, engine = _engine()
+        status = "ok"
+        started_at = time.time()
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        engine.start()
+        try:
+            return fn(*args, **kwargs)
+        except BaseException as e:
+            status = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            engine.stop()
+            wall_s, cpu_s = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+            try:
+                directory = os.path.join(PROFILE_DIR, profile_id)
+                os.makedirs(directory, exist_ok=True)
+                details = engine.write(directory)
+                metadata = {
+                    "id": profile_id,
+                    "endpoint": label,
+                    "engine": name,
+                    "started_at": started_at,
+                    "wall_s": round(wall_s, 4),
+                    # CPU time of the request thread only; LLM HTTP calls may run on a pool thread
+                    "cpu_s": round(cpu_s, 4),
+                    "status": status,
+                    "artifacts": sorted(os.listdir(directory)) + [METADATA_FILE],
+                    **details,
+                }
+                with open(os.path.join(directory, METADATA_FILE), "w", encoding="utf-8") as f:
+                    json.dump(metadata, f, indent=2)
+                metrics.inc("profiles_written")
+                with _write_lock:
+                    _prune()
+            except Exception as e:
+                # a failed profile must not fail the request
+                print(f"Could not write profile {profile_id}: {e}")
+                metrics.inc("profile_errors")
+
+    return run
+
+
+def list_profiles(limit: Optional[int] = 20) -> List[Dict[str, Any]]:
+    """Most recent profiles first (id, endpoint, timings), without the stack details."""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name, METADATA_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        entries.append({key: metadata.get(key) for key in
+                        ("id", "endpoint", "engine", "started_at", "wall_s", "cpu_s", "status", "artifacts")})
+    entries.sort(key=lambda entry: entry["started_at"] or 0, reverse=True)
+    return entries if limit is None else entries[:limit]
+
+
+def profile_artifact(profile_id: str, artifact: str = METADATA_FILE) -> Optional[str]:
+    """Path of one stored artifact, or None for unknown ids / names (no path traversal)."""
+    if not _SAFE_ID.match(profile_id) or not _SAFE_ID.match(artifact):
+        return None
+    path = os.path.join(PROFILE_DIR, profile_id, artifact)
+    return path if os.path.isfile(path) else None
@@ -1,47 +1,275 @@
 import os
-from upstash_redis import Redis
-import redis
+import copy
 import json
+import base64
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+from files.near_cache import TTLCache
+from files.metrics import metrics
+
+#! record encoding: orjson when installed, zstd for payloads above REDIS_ZSTD_MIN_BYTES when REDIS_ZSTD=1
+#! compressed values are stored as "z1:" + base64 so they stay valid strings for the Upstash REST API;
+#! anything else is plain JSON, which keeps records written by older code readable
+REDIS_ZSTD = os.getenv("REDIS_ZSTD", "0") == "1"
+REDIS_ZSTD_MIN_BYTES = int(os.getenv("REDIS_ZSTD_MIN_BYTES", 1024))
+#! "string": one JSON value per deviation, "hash": one hash field per record field (HGET root_cause only)
+REDIS_RECORD_LAYOUT = os.getenv("REDIS_RECORD_LAYOUT", "string").lower()
+#! in-process near-cache in front of the repository (0 disables)
+REDIS_NEAR_CACHE_SIZE = int(os.getenv("REDIS_NEAR_CACHE_SIZE", 1024))
+REDIS_NEAR_CACHE_TTL = float(os.getenv("REDIS_NEAR_CACHE_TTL", 300))
+
+ZSTD_PREFIX = "z1:"
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def encode_value(value: Any) -> str:
+    raw = _dumps(value)
+    if REDIS_ZSTD and len(raw) >= REDIS_ZSTD_MIN_BYTES:
+        import zstandard
+
+        compressed = zstandard.ZstdCompressor(level=3).compress(raw)
+        return ZSTD_PREFIX + base64.b64encode(compressed).decode("ascii")
+    return raw.decode("utf-8")
+
+
+def decode_value(value: str) -> Any:
+    if isinstance(value, bytes):
+        value = value.decode("utf-8")
+    if value.startswith(ZSTD_PREFIX):
+        import zstandard
+
+        raw = zstandard.ZstdDecompressor().decompress(base64.b64decode(value[len(ZSTD_PREFIX):]))
+        return _loads(raw)
+    return _loads(value)
+
+
+_near_caches: Dict[str, TTLCache] = {}
+
+
+class _DeviationRecordRepository(ABC):
+    """Shared read/write logic; subclasses provide `self.client` and the client's hset signature."""
+
+    layout = REDIS_RECORD_LAYOUT
+
+    def _init_cache(self):
+        # repositories are built per request, the near-cache lives for the whole process
+        name = type(self).__name__
+        if name not in _near_caches:
+            _near_caches[name] = TTLCache(REDIS_NEAR_CACHE_SIZE, REDIS_NEAR_CACHE_TTL)
+        self.near_cache = _near_caches[name]
+
+    @staticmethod
+    def _key(deviation_id: str) -> str:
+        return f"deviation:{deviation_id}"
+
+    @abstractmethod
+    def _hset(self, key: str, mapping: Dict[str, str]):
+        pass
+
+    @abstractmethod
+    def _async_client(self):
+        pass
+
+    @abstractmethod
+    async def _ahset(self, key: str, mapping: Dict[str, str]):
+        pass
+
+    # the near-cache holds its own copy and hands out copies, a caller mutating a record cannot corrupt it
+    def _cache_get(self, key: str) -> Optional[dict]:
+        cached = self.near_cache.get(key)
+        return copy.deepcopy(cached) if cached is not None else None
+
+    def _cache_set(self, key: str, data: dict):
+        self.near_cache.set(key, copy.deepcopy(data))
+
+    def save_deviation(self, deviation_id: str, data: dict):
+        key = self._key(deviation_id)
+        self.near_cache.invalidate(key)
+        if self.layout == "hash":
+            encoded = {field: encode_value(value) for field, value in data.items()}
+            # a key written with the string layout would make HSET fail with WRONGTYPE
+            self.client.delete(key)
+            self._hset(key, encoded)
+            payload_bytes = sum(len(v) for v in encoded.values())
+        else:
+            encoded = encode_value(data)
+            self.client.set(key, encoded)
+            payload_bytes = len(encoded)
+        metrics.observe("redis_record_bytes", payload_bytes)
+        self._cache_set(key, data)
+
+    async def asave_deviation(self, deviation_id: str, data: dict):
+        key = self._key(deviation_id)
+        client = self._async_client()
+        self.near_cache.invalidate(key)
+        if self.layout == "hash":
+            encoded = {field: encode_value(value) for field, value in data.items()}
+            await client.delete(key)
+            await self._ahset(key, encoded)
+            payload_bytes = sum(len(v) for v in encoded.values())
+        else:
+            encoded = encode_value(data)
+            await client.set(key, encoded)
+            payload_bytes = len(encoded)
+        metrics.observe("redis_record_bytes", payload_bytes)
+        self._cache_set(key, data)
+
+    async def aget_deviation(self, deviation_id: str) -> dict | None:
+        key = self._key(deviation_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            metrics.inc("redis_near_cache_hits")
+            return cached
+        metrics.inc("redis_near_cache_misses")
+
+        client = self._async_client()
+        data = None
+        if self.layout == "hash":
+            try:
+                fields = await client.hgetall(key)
+            except Exception:
+                fields = None
+            if fields:
+                data = {field: decode_value(value) for field, value in fields.items()}
+        if data is None:
+            value = await client.get(key)
+            if value is None:
+                return None
+            data = decode_value(value)
+        self._cache_set(key, data)
+        return data
+
+    async def aget_field(self, deviation_id: str, field: str) -> Optional[Any]:
+        key = self._key(deviation_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            metrics.inc("redis_near_cache_hits")
+            return cached.get(field)
+        if self.layout == "hash":
+            try:
+                value = await self._async_client().hget(key, field)
+            except Exception:
+                value = None
+            if value is not None:
+                return decode_value(value)
+        data = await self.aget_deviation(deviation_id)
+        return data.get(field) if data else None
+
+    def get_deviation(self, deviation_id: str) -> dict | None:
+        key = self._key(deviation_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            metrics.inc("redis_near_cache_hits")
+            return cached
+        metrics.inc("redis_near_cache_misses")
+
+        data = None
+        if self.layout == "hash":
+            try:
+                fields = self.client.hgetall(key)
+            except Exception:
+                fields = None  # still a string-layout record
+            if fields:
+                data = {field: decode_value(value) for field, value in fields.items()}
+        if data is None:
+            value = self.client.get(key)
+            if value is None:
+                return None
+            data = decode_value(value)
+        self._cache_set(key, data)
+        return data
+
+    def get_field(self, deviation_id: str, field: str) -> Optional[Any]:
+        """One field of a record (e.g. root_cause); with the hash layout only that field is transferred."""
+        key = self._key(deviation_id)
+        cached = self._cache_get(key)
+        if cached is not None:
+            metrics.inc("redis_near_cache_hits")
+            return cached.get(field)
+        if self.layout == "hash":
+            try:
+                value = self.client.hget(key, field)
+            except Exception:
+                value = None
+            if value is not None:
+                return decode_value(value)
+        data = self.get_deviation(deviation_id)
+        return data.get(field) if data else None
+
+    def invalidate(self, deviation_id: str):
+        self.near_cache.invalidate(self._key(deviation_id))
+
+
 #! Redis repository for storing and retrieving deviation data
-class DeviationRedisRepository:
+class DeviationRedisRepository(_DeviationRecordRepository):
     def __init__(self, host="localhost", port=6379, db=0):
+        import redis
+
         self.client = redis.Redis(
             host=host,
             port=port,
             db=db,
             decode_responses=True
         )
+        self._connection = {"host": host, "port": port, "db": db}
+        self.aclient = None
+        self._init_cache()
 
-    def save_deviation(self, deviation_id: str, data: dict):
-        key = f"deviation:{deviation_id}"
-        self.client.set(key, json.dumps(data))
+    def _hset(self, key: str, mapping: Dict[str, str]):
+        self.client.hset(key, mapping=mapping)
 
-    def get_deviation(self, deviation_id: str) -> dict | None:
-        key = f"deviation:{deviation_id}"
-        value = self.client.get(key)
-        return json.loads(value) if value else None
+    def _async_client(self):
+        if self.aclient is None:
+            import redis.asyncio
 
+            self.aclient = redis.asyncio.Redis(**self._connection, decode_responses=True)
+        return self.aclient
 
+    async def _ahset(self, key: str, mapping: Dict[str, str]):
+        await self._async_client().hset(key, mapping=mapping)
 
-class DeviationUpstashRedisRepository:
+
+
+class DeviationUpstashRedisRepository(_DeviationRecordRepository):
     def __init__(self):
+        from upstash_redis import Redis
+
         self.client = Redis(
             url=os.getenv("UPSTASH_REDIS_URL"),
             token=os.getenv("UPSTASH_REDIS_TOKEN"),
         )
+        self.aclient = None
+        self._init_cache()
 
-    def save_deviation(self, deviation_id: str, data: dict):
-        key = f"deviation:{deviation_id}"
-        # Upstash Redis accepts strings → serialize explicitly
-        self.client.set(key, json.dumps(data))
+    def _hset(self, key: str, mapping: Dict[str, str]):
+        # Upstash Redis accepts strings → values are serialized explicitly
+        self.client.hset(key, values=mapping)
 
-    def get_deviation(self, deviation_id: str) -> dict | None:
-        key = f"deviation:{deviation_id}"
-        value = self.client.get(key)
+    def _async_client(self):
+        if self.aclient is None:
+            from upstash_redis.asyncio import Redis
 
-        if value is None:
-            return None
+            self.aclient = Redis(
+                url=os.getenv("UPSTASH_REDIS_URL"),
+                token=os.getenv("UPSTASH_REDIS_TOKEN"),
+            )
+        return self.aclient
 
-        # Upstash returns str → deserialize
-        return json.loads(value)
-    
\ No newline at end of file
+    async def _ahset(self, key: str, mapping: Dict[str, str]):
+        await self._async_client().hset(key, values=mapping)
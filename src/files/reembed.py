@@ -0,0 +1,207 @@
+import os
+import time
+import argparse
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional
+from dotenv import load_dotenv
+
+from files.embedding import SentenceTransformerEmbedder
+from files.vectorstores import MONGO_URI, MONGO_DB, MONGO_COLLECTION, EMBEDDING_VERSION, embedding_field
+load_dotenv()
+
+#! re-embedding backfill: writes a new embedding version next to the active one
+#! queries keep reading EMBEDDING_VERSION until it is switched after the backfill completes
+#!   python -m files.reembed --target-version v2 --model text-embedding-3-large --dimensions 1024
+#! progress is checkpointed in the reembed_jobs collection, rerunning the same command resumes
+#! documents ingested between the end of the backfill and the switch only get the old version;
+#! after switching, rerun the same command (target = the now active version) as a catch-up pass
+
+JOBS_COLLECTION = "reembed_jobs"
+
+
+class RateLimiter:
+    """Spaces calls so that at most `per_minute` happen in any minute (0 disables)."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if now < self._next:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+
+class ReembedJob:
+    def __init__(
+        self,
+        target_version: str,
+        embedder: SentenceTransformerEmbedder,
+        batch_size: int = 256,
+        max_requests_per_minute: float = 0,
+        max_retries: int = 5,
+    ):
+        from pymongo import MongoClient
+
+        self.client = MongoClient(MONGO_URI)
+        self.collection = self.client[MONGO_DB][MONGO_COLLECTION]
+        self.jobs = self.client[MONGO_DB][JOBS_COLLECTION]
+        # one version is one model: a resumed or catch-up run must embed with what the backfill used
+        job = self.jobs.find_one({"_id": target_version})
+        if job is not None and (job.get("model"), job.get("dimensions")) != (embedder.model, embedder.dimensions):
+            raise ValueError(
+                f"{target_version} was embedded with {job.get('model')} (dimensions {job.get('dimensions')}), "
+                f"not {embedder.model} (dimensions {embedder.dimensions})"
+            )
+        self.catch_up = target_version == EMBEDDING_VERSION
+        self.target_version = target_version
+        self.field = embedding_field(target_version)
+        self.embedder = embedder
+        self.batch_size = batch_size
+        self.limiter = RateLimiter(max_requests_per_minute)
+        self.max_retries = max_retries
+
+    # ----------------------------
+    # Checkpoint
+    # ----------------------------
+    def _load_checkpoint(self) -> Optional[str]:
+        job = self.jobs.find_one({"_id": self.target_version})
+        return job.get("last_id") if job else None
+
+    def _save_checkpoint(self, last_id: Optional[str], processed: int, done: bool = False):
+        self.jobs.update_one(
+            {"_id": self.target_version},
+            {
+                "$set": {
+                    "last_id": last_id,
+                    "model": self.embedder.model,
+                    "dimensions": self.embedder.dimensions,
+                    "done": done,
+                    "updated_at": datetime.now(timezone.utc),
+                },
+                "$inc": {"processed": processed},
+            },
+            upsert=True,
+        )
+
+    # ----------------------------
+    # Backfill
+    # ----------------------------
+    def _next_batch(self, after_id: Optional[str]) -> List[Dict[str, Any]]:
+        # cursor pagination on _id, only the text is pulled over the network
+        query: Dict[str, Any] = {self.field: {"$exists": False}}
+        if after_id is not None:
+            query["_id"] = {"$gt": after_id}
+        cursor = (
+            self.collection.find(query, projection={"_id": 1, "text": 1})
+            .sort("_id", 1)
+            .limit(self.batch_size)
+        )
+        return list(cursor)
+
+    def _embed(self, texts: List[Any]) -> List[list]:
+        for attempt in range(self.max_retries):
+            self.limiter.wait()
+            try:
+                return self.embedder.embed(texts)
+            except Exception as e:
+                if attempt == self.max_retries - 1:
+                    raise
+                delay = 2 ** attempt
+                print(f"Embedding batch failed ({e}), retrying in {delay}s")
+                time.sleep(delay)
+
+    def _write(self, docs: List[Dict[str, Any]], embeddings: List[list]):
+        from pymongo import UpdateOne
+
+        # embedded_at lets the vector snapshot catch-up (files/vector_snapshot.py) find old documents
+        # that only now carry the version
+        embedded_at = datetime.now(timezone.utc)
+        self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": doc["_id"]},
+                    {
+                        "$set": {self.field: embedding, "embedded_at": embedded_at},
+                        "$addToSet": {"embedding_versions": self.target_version},
+                    },
+                )
+                for doc, embedding in zip(docs, embeddings)
+            ],
+            ordered=False,
+        )
+
+    def run(self) -> int:
+        last_id = self._load_checkpoint()
+        if self.catch_up:
+            # only documents still missing the active version are selected, finished ones are skipped
+            print(f"{self.target_version} is the active version, catching up documents without it")
+        if last_id is not None:
+            print(f"Resuming {self.target_version} backfill after _id {last_id}")
+
+        total = 0
+        start = time.perf_counter()
+        while True:
+            docs = self._next_batch(last_id)
+            if not docs:
+                if last_id is None:
+                    break
+                # documents inserted during the run can sort before the cursor,
+                # sweep again from the start until nothing is missing
+                last_id = None
+                continue
+
+            embeddings = self._embed([doc["text"] for doc in docs])
+            self._write(docs, embeddings)
+            last_id = docs[-1]["_id"]
+            total += len(docs)
+            self._save_checkpoint(last_id, len(docs))
+
+            rate = total / max(time.perf_counter() - start, 1e-9)
+            print(f"Re-embedded {total} documents ({rate:.1f} docs/s), last _id {last_id}")
+
+        self._save_checkpoint(None, 0, done=True)
+        print(f"Backfill of {self.target_version} complete: {total} documents")
+        return total
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "target_version": self.target_version,
+            "embedded": self.collection.count_documents({self.field: {"$exists": True}}),
+            "remaining": self.collection.count_documents({self.field: {"$exists": False}}),
+            "job": self.jobs.find_one({"_id": self.target_version}),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill a new embedding version for the deviation collection")
+    parser.add_argument("--target-version", required=True, help="Version name to write, e.g. v2")
+    parser.add_argument("--model", required=True, help="Embedding model for the new version")
+    parser.add_argument("--dimensions", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--max-rpm", type=float, default=float(os.getenv("REEMBED_MAX_RPM", 0)),
+                        help="Max embedding requests per minute (0 = unlimited)")
+    parser.add_argument("--status", action="store_true", help="Only print backfill progress")
+    args = parser.parse_args()
+
+    job = ReembedJob(
+        target_version=args.target_version,
+        embedder=SentenceTransformerEmbedder(model=args.model, dimensions=args.dimensions),
+        batch_size=args.batch_size,
+        max_requests_per_minute=args.max_rpm,
+    )
+    if args.status:
+        print(job.status())
+        return
+    job.run()
+    if job.catch_up:
+        return
+    print(f"Switch queries over with EMBEDDING_VERSION={args.target_version} "
+          f"EMBEDDING_MODEL={args.model}" + (f" EMBEDDING_DIMENSIONS={args.dimensions}" if args.dimensions else ""))
+
+
+if __name__ == "__main__":
+    main()
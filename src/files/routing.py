@@ -0,0 +1,65 @@
+import os
+from typing import Any, Dict, Optional
+
+from files.metrics import metrics
+
+#! per-task LLM routes: each pipeline step can run on its own model / endpoint / sampling settings
+#!   summary  - summary_qa (brain, gmp generation)
+#!   analysis - the 10-question analysis (process_description, fused brain analysis, ingest)
+#!   section  - GMP section writing (deviation_generation)
+#!   rca      - root cause brainstorming in brain()
+#!   capa     - CAPA and effectiveness-check answers in brain()
+#! LLM_ROUTE_<TASK>_{MODEL,BASE_URL,API_KEY,TEMPERATURE,TIMEOUT,MAX_TOKENS}, unset settings fall back to LLM_*
+ROUTES = ("summary", "analysis", "section", "rca", "capa")
+
+_CASTS = {
+    "model": str,
+    "base_url": str,
+    "api_key": str,
+    "temperature": float,
+    "timeout": float,
+    "max_tokens": int,
+}
+
+
+def default_config() -> Dict[str, Any]:
+    return {
+        "model": os.getenv("LLM_MODEL"),
+        "base_url": os.getenv("LLM_BASE_URL"),
+        "api_key": os.getenv("LLM_API_KEY"),
+        "temperature": float(os.getenv("LLM_TEMPERATURE", 0.7)),
+        "timeout": float(os.getenv("LLM_TIMEOUT", 60)),
+        "max_tokens": int(os.getenv("LLM_MAX_TOKENS", 0)) or None,
+    }
+
+
+def route_config(task: Optional[str]) -> Dict[str, Any]:
+    """CustomLLM settings for a task (None is the default LLM_* model)."""
+    config = default_config()
+    if task is None:
+        return config
+    if task not in ROUTES:
+        raise ValueError(f"Unknown LLM route: {task} (expected one of {', '.join(ROUTES)})")
+    prefix = f"LLM_ROUTE_{task.upper()}_"
+    for key, cast in _CASTS.items():
+        value = os.getenv(prefix + key.upper())
+        if value:
+            config[key] = cast(value)
+    if config["max_tokens"] == 0:
+        config["max_tokens"] = None
+    return config
+
+
+def route_stats() -> Dict[str, Any]:
+    """Model and call latency per route, for tuning the mapping (GET /metrics)."""
+    snapshot = metrics.snapshot()["counters"]
+    stats = {}
+    for task in ROUTES:
+        config = route_config(task)
+        stats[task] = {
+            "model": config["model"],
+            "max_tokens": config["max_tokens"],
+            "latency_ms": metrics.summary(f"llm_route_ms.{task}"),
+            "errors": int(snapshot.get(f"llm_route_errors.{task}", 0)),
+        }
+    return stats
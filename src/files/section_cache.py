@@ -0,0 +1,103 @@
+import os
+import json
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Optional
+
+#! memo for incremental GMP report regeneration
+#! GMP_SECTION_CACHE: "memory" (default, per process), "redis" (Upstash, shared by workers) or "off"
+GMP_SECTION_CACHE = os.getenv("GMP_SECTION_CACHE", "memory").lower()
+GMP_SECTION_CACHE_SIZE = int(os.getenv("GMP_SECTION_CACHE_SIZE", 2048))
+GMP_SECTION_CACHE_TTL = int(os.getenv("GMP_SECTION_CACHE_TTL", 7 * 24 * 3600))
+
+
+def hash_payload(payload: Any) -> str:
+    if isinstance(payload, str):
+        raw = payload
+    else:
+        raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def summary_key(section_input: Any, model: str) -> str:
+    return f"gmp:summary:{hash_payload(section_input)}:{model}"
+
+
+def subsection_key(summary: str, prompt_row: Any, model: str) -> str:
+    return f"gmp:subsection:{hash_payload(summary)}:{hash_payload(prompt_row)}:{model}"
+
+
+class SectionCache(ABC):
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: str):
+        pass
+
+
+class NullSectionCache(SectionCache):
+    def get(self, key: str) -> Optional[str]:
+        return None
+
+    def set(self, key: str, value: str):
+        pass
+
+
+class InMemorySectionCache(SectionCache):
+    def __init__(self, max_entries: int = GMP_SECTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class UpstashSectionCache(SectionCache):
+    def __init__(self, ttl: int = GMP_SECTION_CACHE_TTL):
+        from upstash_redis import Redis
+
+        self.client = Redis(
+            url=os.getenv("UPSTASH_REDIS_URL"),
+            token=os.getenv("UPSTASH_REDIS_TOKEN"),
+        )
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[str]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: str):
+        self.client.set(key, value, ex=self.ttl)
+
+
+_cache: Optional[SectionCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_section_cache() -> SectionCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            if GMP_SECTION_CACHE == "redis":
+                _cache = UpstashSectionCache()
+            elif GMP_SECTION_CACHE == "off":
+                _cache = NullSectionCache()
+            else:
+                _cache = InMemorySectionCache()
+        return _cache
@@ -0,0 +1,145 @@
+import os
+import json
+import hashlib
+import threading
+import itertools
+from typing import Any, Dict, List, Optional
+
+from files.near_cache import TTLCache
+from files.metrics import metrics
+
+#! similarity-search result cache, invalidated by a corpus generation counter
+#! every ingest (DeviationRepository.save_answers) bumps the generation, cached top-k lists stamped
+#! with an older generation are misses, so results are reused exactly while the corpus is unchanged
+#! SIMILARITY_CACHE: "off" (default), "local" or "redis"
+#!   local - generation counted in this process: single-process deployments only, ingests from other
+#!           uvicorn workers or batch_runner are not seen, so entries also expire after SIMILARITY_CACHE_TTL
+#!   redis - generation in Upstash, shared by every API worker and batch/CLI ingest
+SIMILARITY_CACHE = os.getenv("SIMILARITY_CACHE", "off").lower()
+SIMILARITY_CACHE_SIZE = int(os.getenv("SIMILARITY_CACHE_SIZE", 1024))
+#! seconds a local-mode result is served at most (bounds staleness from other processes, 0 = no expiry)
+SIMILARITY_CACHE_TTL = float(os.getenv("SIMILARITY_CACHE_TTL", 300))
+#! query text -> embedding memo in front of the embedder (entries, 0 disables)
+SIMILARITY_EMBEDDING_CACHE_SIZE = int(os.getenv("SIMILARITY_EMBEDDING_CACHE_SIZE", 1024))
+
+GENERATION_KEY = "similarity:corpus_generation"
+
+
+class LocalGeneration:
+    def __init__(self):
+        self._counter = itertools.count(1)
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        return self._value
+
+    def bump(self) -> int:
+        with self._lock:
+            self._value = next(self._counter)
+            return self._value
+
+
+class UpstashGeneration:
+    def __init__(self):
+        from upstash_redis import Redis
+
+        self.client = Redis(
+            url=os.getenv("UPSTASH_REDIS_URL"),
+            token=os.getenv("UPSTASH_REDIS_TOKEN"),
+        )
+
+    def current(self) -> int:
+        value = self.client.get(GENERATION_KEY)
+        return int(value) if value is not None else 0
+
+    def bump(self) -> int:
+        return int(self.client.incr(GENERATION_KEY))
+
+
+def _hash(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+def embedding_hash(vector) -> str:
+    # rounded so the same embedding returned as float64 or float32 maps to one key
+    return _hash(json.dumps([round(float(x), 6) for x in vector], separators=(",", ":")).encode("utf-8"))
+
+
+class SimilarityCache:
+    def __init__(self, generation, max_entries: int = SIMILARITY_CACHE_SIZE,
+                 embedding_entries: int = SIMILARITY_EMBEDDING_CACHE_SIZE, ttl: float = 0):
+        self.generation = generation
+        self.results = TTLCache(max_entries, ttl)
+        self.embeddings = TTLCache(embedding_entries)
+
+    @staticmethod
+    def key(vector, top_k: int, filters: Optional[Dict[str, Any]] = None) -> str:
+        filters_hash = _hash(json.dumps(filters or {}, sort_keys=True, default=str).encode("utf-8"))
+        return f"{embedding_hash(vector)}:{top_k}:{filters_hash}"
+
+    def embed(self, embedder, text: Any) -> list:
+        """Query embedding, memoised on (embedder model, text); `text` is embedded exactly as the store would."""
+        model = f"{getattr(embedder, 'model', type(embedder).__name__)}:{getattr(embedder, 'dimensions', None)}"
+        key = _hash(f"{model}\n{json.dumps(text, ensure_ascii=False, default=str)}".encode("utf-8"))
+        vector = self.embeddings.get(key)
+        if vector is None:
+            vector = embedder.embed([text])[0]
+            self.embeddings.set(key, vector)
+        else:
+            metrics.inc("similarity_embedding_cache_hits")
+        return vector
+
+    def get(self, key: str, generation: int) -> Optional[List[Dict[str, Any]]]:
+        entry = self.results.get(key)
+        if entry is None:
+            metrics.inc("similarity_cache_misses")
+            return None
+        stamped, hits = entry
+        if stamped != generation:
+            # corpus changed since this list was computed
+            self.results.invalidate(key)
+            metrics.inc("similarity_cache_stale")
+            return None
+        metrics.inc("similarity_cache_hits")
+        return [dict(hit) for hit in hits]
+
+    def set(self, key: str, generation: int, hits: List[Dict[str, Any]]):
+        self.results.set(key, (generation, [dict(hit) for hit in hits]))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": SIMILARITY_CACHE,
+            "generation": self.generation.current(),
+            "ttl_s": self.results.ttl,
+            "results": self.results.stats(),
+            "embeddings": self.embeddings.stats(),
+        }
+
+
+_cache: Optional[SimilarityCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_similarity_cache() -> Optional[SimilarityCache]:
+    """The process-wide cache, or None when SIMILARITY_CACHE is off."""
+    global _cache
+    if SIMILARITY_CACHE == "off":
+        return None
+    with _cache_lock:
+        if _cache is None:
+            if SIMILARITY_CACHE == "redis":
+                _cache = SimilarityCache(UpstashGeneration())
+            else:
+                if int(os.getenv("WEB_CONCURRENCY", 1)) > 1:
+                    print("SIMILARITY_CACHE=local with several workers: other workers' ingests only show up "
+                          f"after SIMILARITY_CACHE_TTL ({SIMILARITY_CACHE_TTL}s), use SIMILARITY_CACHE=redis")
+                _cache = SimilarityCache(LocalGeneration(), ttl=SIMILARITY_CACHE_TTL)
+        return _cache
+
+
+def bump_corpus_generation():
+    """Called after every ingest; invalidates all cached similarity results."""
+    cache = get_similarity_cache()
+    if cache is not None:
+        cache.generation.bump()
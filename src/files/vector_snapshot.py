@@ -0,0 +1,302 @@
+import os
+import json
+import time
+import shutil
+import threading
+from datetime import datetime, timezone, timedelta
+from typing import List, Dict, Any, Iterable, Optional
+
+#! on-disk snapshot of the vector index
+#! <dir>/CURRENT           -> name of the live snapshot directory
+#! <dir>/snap-<ts>/vectors.f32  float32 matrix (rows x dim), L2-normalised, opened with np.memmap
+#! <dir>/snap-<ts>/rows.json    id/offset table (row i of the matrix is rows[i]) + watermark
+#! every worker on the host maps the same file read-only so they share one page-cache copy,
+#! only documents ingested (or given this embedding version by files/reembed.py, embedded_at)
+#! after the watermark are pulled from Mongo on startup
+
+VECTOR_SNAPSHOT_FLUSH_ROWS = int(os.getenv("VECTOR_SNAPSHOT_FLUSH_ROWS", 256))
+VECTOR_SNAPSHOT_CATCHUP_SECONDS = float(os.getenv("VECTOR_SNAPSHOT_CATCHUP_SECONDS", 5))
+#! documents written by other workers can commit slightly out of timestamp order,
+#! so catch-up re-reads this many seconds before the watermark (known ids are skipped)
+VECTOR_SNAPSHOT_CATCHUP_OVERLAP = float(os.getenv("VECTOR_SNAPSHOT_CATCHUP_OVERLAP", 60))
+VECTOR_SNAPSHOT_KEEP = 2
+
+
+def get_field(doc: Dict[str, Any], path: str):
+    for part in path.split("."):
+        doc = doc[part]
+    return doc
+
+
+def _normalise(matrix):
+    import numpy as np
+
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class VectorSnapshotIndex:
+    """In-process cosine index over the Mongo collection, persisted as a memory-mapped snapshot."""
+
+    def __init__(self, directory: str, field: str = "embedding", lexical: bool = False):
+        self.directory = os.path.abspath(directory)
+        self.field = field
+        self.with_lexical = lexical
+        self.lexical = None
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self._save_lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.watermark: Optional[datetime] = None
+        self._base = None
+        self._base_rows: List[Dict[str, Any]] = []
+        self._delta_vectors = []
+        self._delta_rows: List[Dict[str, Any]] = []
+        self._offsets: Dict[str, int] = {}
+        self._last_catch_up = 0.0
+        self._reset_lexical([])
+
+    # ----------------------------
+    # Snapshot files
+    # ----------------------------
+    def _current_dir(self) -> Optional[str]:
+        pointer = os.path.join(self.directory, "CURRENT")
+        if not os.path.exists(pointer):
+            return None
+        with open(pointer, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+        path = os.path.join(self.directory, name)
+        return path if os.path.isdir(path) else None
+
+    @staticmethod
+    def _map(snap_dir: str):
+        import numpy as np
+
+        with open(os.path.join(snap_dir, "rows.json"), "r", encoding="utf-8") as f:
+            table = json.load(f)
+        base = None
+        if table["rows"]:
+            base = np.memmap(
+                os.path.join(snap_dir, "vectors.f32"),
+                dtype=np.float32,
+                mode="r",
+                shape=(len(table["rows"]), table["dim"]),
+            )
+        watermark = datetime.fromisoformat(table["watermark"]) if table["watermark"] else None
+        return table["dim"], watermark, table["rows"], base
+
+    def _reset_lexical(self, rows: List[Dict[str, Any]]):
+        if not self.with_lexical:
+            return
+        from files.lexical import LexicalIndex
+
+        lexical = LexicalIndex()
+        for row in rows:
+            lexical.add(row["id"], row["text"])
+        self.lexical = lexical
+
+    def load(self) -> bool:
+        snap_dir = self._current_dir()
+        if snap_dir is None:
+            return False
+        dim, watermark, rows, base = self._map(snap_dir)
+        with self._lock:
+            self.dim, self.watermark = dim, watermark
+            self._base, self._base_rows = base, rows
+            self._delta_vectors, self._delta_rows = [], []
+            self._offsets = {row["id"]: i for i, row in enumerate(rows)}
+            self._reset_lexical(rows)
+        return True
+
+    def save(self):
+        with self._save_lock:
+            self._save()
+
+    def _save(self):
+        import fcntl
+        import numpy as np
+
+        with self._lock:
+            rows = self._base_rows + self._delta_rows
+            parts = []
+            if self._base is not None:
+                parts.append(np.asarray(self._base))
+            if self._delta_vectors:
+                parts.append(np.vstack(self._delta_vectors))
+            watermark = self.watermark
+            dim = self.dim
+            flushed = len(self._delta_rows)
+
+        name = f"snap-{time.time_ns()}"
+        tmp_dir = os.path.join(self.directory, f".{name}.tmp")
+        os.makedirs(tmp_dir)
+        if parts:
+            np.vstack(parts).astype(np.float32).tofile(os.path.join(tmp_dir, "vectors.f32"))
+        with open(os.path.join(tmp_dir, "rows.json"), "w", encoding="utf-8") as f:
+            json.dump({
+                "dim": dim,
+                "watermark": watermark.isoformat() if watermark else None,
+                "rows": rows,
+            }, f, ensure_ascii=False, default=str)
+
+        # several workers may flush at once, the lock keeps CURRENT and the pruning consistent
+        with open(os.path.join(self.directory, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            os.replace(tmp_dir, os.path.join(self.directory, name))
+            pointer_tmp = os.path.join(self.directory, "CURRENT.tmp")
+            with open(pointer_tmp, "w", encoding="utf-8") as f:
+                f.write(name)
+            os.replace(pointer_tmp, os.path.join(self.directory, "CURRENT"))
+            self._prune(keep=name)
+
+        # re-map the file we just wrote so the delta moves back into the shared page cache,
+        # rows added while we were writing stay in the delta (row order, and so offsets, is unchanged)
+        _, _, rows, base = self._map(os.path.join(self.directory, name))
+        with self._lock:
+            self._base, self._base_rows = base, rows
+            self._delta_vectors = self._delta_vectors[flushed:]
+            self._delta_rows = self._delta_rows[flushed:]
+
+    def _prune(self, keep: str):
+        snapshots = sorted(d for d in os.listdir(self.directory) if d.startswith("snap-"))
+        for name in snapshots[:-VECTOR_SNAPSHOT_KEEP]:
+            if name != keep:
+                # already mapped files stay valid for readers after unlink
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # ----------------------------
+    # Ingest
+    # ----------------------------
+    def add(self, ids: List[str], embeddings: List[list], texts: List[Any], metadatas: List[Dict]):
+        """Add rows to the in-memory delta, the watermark is only moved by catch-up."""
+        if not ids:
+            return
+        vectors = _normalise(embeddings)
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            for i, doc_id in enumerate(ids):
+                if doc_id in self._offsets:
+                    continue
+                self._offsets[doc_id] = len(self._base_rows) + len(self._delta_rows)
+                self._delta_vectors.append(vectors[i:i + 1])
+                self._delta_rows.append({"id": doc_id, "text": texts[i], "metadata": metadatas[i]})
+                if self.lexical is not None:
+                    self.lexical.add(doc_id, texts[i])
+            should_flush = len(self._delta_rows) >= VECTOR_SNAPSHOT_FLUSH_ROWS
+        if should_flush:
+            self.save()
+
+    @staticmethod
+    def _changed_at(doc: Dict[str, Any]) -> Optional[datetime]:
+        stamps = [doc.get(key) for key in ("ingested_at", "embedded_at")]
+        stamps = [s.replace(tzinfo=timezone.utc) if s.tzinfo is None else s for s in stamps if s is not None]
+        return max(stamps, default=None)
+
+    def catch_up(self, collection, force: bool = False) -> int:
+        """Pull documents ingested or re-embedded after the watermark (all documents when there is no snapshot)."""
+        now = time.monotonic()
+        if not force and now - self._last_catch_up < VECTOR_SNAPSHOT_CATCHUP_SECONDS:
+            return 0
+        self._last_catch_up = now
+
+        # only documents that already carry this index's embedding version
+        query = {self.field: {"$exists": True}}
+        if self.watermark:
+            # reembed adds the version to old documents, they keep their ingested_at but get embedded_at
+            since = {"$gte": self.watermark - timedelta(seconds=VECTOR_SNAPSHOT_CATCHUP_OVERLAP)}
+            query["$or"] = [{"ingested_at": since}, {"embedded_at": since}]
+        cursor = collection.find(
+            query,
+            projection={"_id": 1, "text": 1, self.field: 1, "metadata": 1, "ingested_at": 1, "embedded_at": 1},
+        )
+
+        added = 0
+        watermark = self.watermark
+        for doc in cursor:
+            changed_at = self._changed_at(doc)
+            if changed_at is not None and (watermark is None or changed_at > watermark):
+                watermark = changed_at
+            if doc["_id"] not in self._offsets:
+                added += 1
+            self.add([doc["_id"]], [get_field(doc, self.field)], [doc["text"]], [doc["metadata"]])
+        # moved once the whole pass is loaded, a flush in between must not persist a watermark
+        # ahead of documents that are not in the snapshot yet
+        with self._lock:
+            self.watermark = watermark
+        return added
+
+    # ----------------------------
+    # Search
+    # ----------------------------
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._base_rows) + len(self._delta_rows)
+
+    def search(self, query_vector: list, top_k: int = 5, candidate_ids: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Top-k cosine matches, optionally scoring only `candidate_ids` (e.g. a lexical pre-filter)."""
+        import numpy as np
+
+        with self._lock:
+            base, base_rows = self._base, self._base_rows
+            delta_vectors, delta_rows = list(self._delta_vectors), list(self._delta_rows)
+            offsets = None
+            if candidate_ids is not None:
+                offsets = sorted(self._offsets[i] for i in candidate_ids if i in self._offsets)
+
+        rows = base_rows + delta_rows
+        if not rows or offsets == []:
+            return []
+        query = _normalise([query_vector])[0]
+        n_base = len(base_rows)
+        scores = []
+        if offsets is None:
+            if base is not None:
+                scores.append(base @ query)
+            if delta_vectors:
+                scores.append(np.vstack(delta_vectors) @ query)
+            offsets = np.arange(len(rows))
+        else:
+            # fancy indexing on the memmap only touches the candidate rows
+            base_idx = [i for i in offsets if i < n_base]
+            delta_idx = [i - n_base for i in offsets if i >= n_base]
+            if base_idx:
+                scores.append(base[base_idx] @ query)
+            if delta_idx:
+                scores.append(np.vstack([delta_vectors[i] for i in delta_idx]) @ query)
+            offsets = np.asarray(offsets)
+        scores = np.concatenate(scores)
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {
+                "id": rows[offsets[i]]["id"],
+                "text": rows[offsets[i]]["text"],
+                "metadata": rows[offsets[i]]["metadata"],
+                "score": float(scores[i]),
+            }
+            for i in top
+        ]
+
+
+_indexes: Dict[str, VectorSnapshotIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_snapshot_index(directory: str, collection, field: str = "embedding", lexical: bool = False) -> VectorSnapshotIndex:
+    """Process-wide index per snapshot directory: mmap the snapshot, then catch up from Mongo."""
+    with _indexes_lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = VectorSnapshotIndex(directory, field=field, lexical=lexical)
+            index.load()
+            collection.create_index("ingested_at")
+            collection.create_index("embedded_at", sparse=True)
+            if index.catch_up(collection, force=True):
+                index.save()
+            _indexes[directory] = index
+        return index
@@ -1,15 +1,16 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable
 # from qdrant_client import QdrantClient
 # from qdrant_client.models import Distance, VectorParams
 # import chromadb
 # from chromadb.config import Settings
-from pymongo import MongoClient
 from typing import List, Dict
-import numpy as np
+from datetime import datetime, timezone
+import asyncio
+import threading
 
 
-from files.embedding import SentenceTransformerEmbedder
+from files.embedding import Embedder, SentenceTransformerEmbedder
 import os
 from dotenv import load_dotenv
 load_dotenv()
@@ -19,6 +20,22 @@ MONGO_URI = os.getenv("MONGO_URI")
 MONGO_DB = os.getenv("MONGO_DB")
 MONGO_COLLECTION = os.getenv("MONGO_COLLECTION")
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", 0)) or None
+#! embeddings are versioned so a model/dimension change can be backfilled (files/reembed.py)
+#! while queries keep reading the active version; v1 is the original top-level "embedding" field
+EMBEDDING_VERSION = os.getenv("EMBEDDING_VERSION", "v1")
+LEGACY_EMBEDDING_VERSION = "v1"
+#! when set, queries run against an in-process index persisted as an mmap snapshot in this directory
+VECTOR_SNAPSHOT_DIR = os.getenv("VECTOR_SNAPSHOT_DIR")
+#! retrieval: "vector" (dense only) or "hybrid" (BM25 over answers + keywords, fused with dense scores)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector").lower()
+HYBRID_FUSION = os.getenv("HYBRID_FUSION", "rrf").lower()  # rrf | weighted
+HYBRID_ALPHA = float(os.getenv("HYBRID_ALPHA", 0.5))  # dense weight for the weighted blend
+HYBRID_DEPTH = int(os.getenv("HYBRID_DEPTH", 50))  # candidates taken from each retriever before fusion
+#! >0: dense scoring only runs on the top-N lexical candidates
+LEXICAL_PREFILTER = int(os.getenv("LEXICAL_PREFILTER", 0))
+#! backend behind get_vector_store(): "mongo", "memory" or "chroma" (files/chroma.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "mongo").lower()
 
 class VectorStore(ABC):
 
@@ -30,6 +47,17 @@ class VectorStore(ABC):
     def query(self, text: str, top_k: int):
         pass
 
+    def query_vector(self, text: str, query_vector: list, top_k: int = 5):
+        """Query with an embedding computed by the caller; stores that cannot use it embed `text` again."""
+        return self.query(text, top_k)
+
+    # async counterparts; stores without a native async driver run the sync call in a thread
+    async def aadd(self, texts: List[str], metadatas: List[Dict], ids: List[str]):
+        return await asyncio.to_thread(self.add, texts, metadatas, ids)
+
+    async def aquery(self, text: str, top_k: int = 5):
+        return await asyncio.to_thread(self.query, text, top_k)
+
 
 
 
@@ -58,73 +86,317 @@ class VectorStore(ABC):
 #             limit=top_k
 #         )
 
-# # your interface
-
+def default_embedder() -> Embedder:
+    return SentenceTransformerEmbedder(
+        model=EMBEDDING_MODEL or "text-embedding-3-small",
+        dimensions=EMBEDDING_DIMENSIONS
+    )
 
-# class ChromaStore(VectorStore):
-#     def __init__(self, collection_name: str):
-#         self.client = chromadb.PersistentClient(
-#             path="./chroma_data"
-#         )
-
-        
 
-#         self.collection = self.client.get_or_create_collection(
-#             name=collection_name
-#         )
+def embedding_field(version: str) -> str:
+    if version == LEGACY_EMBEDDING_VERSION:
+        return "embedding"
+    return f"embeddings.{version}"
 
-#     def add(self, texts, metadatas, ids):
-#         self.collection.add(
-#             documents=texts,
-#             metadatas=metadatas,
-#             ids=ids
-#         )
 
-#     def query(self, text, top_k=5):
-#         return self.collection.query(
-#             query_texts=[text],
-#             n_results=top_k
-#         )
-    
 def cosine_similarity(a, b):
+    import numpy as np
     return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
 
 
 class MongoVectorStore(VectorStore):
     def __init__(
-        self
+        self,
+        version: str = EMBEDDING_VERSION,
+        embedder: Embedder | None = None,
+        collection_name: str | None = None
     ):
+        from pymongo import MongoClient
+
         self.client = MongoClient(MONGO_URI)
-        self.collection = self.client[MONGO_DB][MONGO_COLLECTION]
-        self.embedder = SentenceTransformerEmbedder()
+        self.collection_name = collection_name or MONGO_COLLECTION
+        self.collection = self.client[MONGO_DB][self.collection_name]
+        self.embedder = embedder or default_embedder()
+        self.version = version
+        self.field = embedding_field(version)
+        self._aclient = None
+        self._acollection = None
+        self.index = None
+        if VECTOR_SNAPSHOT_DIR:
+            from files.vector_snapshot import get_snapshot_index
+            self.index = get_snapshot_index(
+                os.path.join(VECTOR_SNAPSHOT_DIR, version), self.collection, field=self.field,
+                lexical=RETRIEVAL_MODE == "hybrid"
+            )
 
-    def add(self, texts: List[str], metadatas: List[Dict], ids: List[str]):
-        embeddings = self.embedder.embed(texts)
+    def _async_collection(self):
+        # async driver is created on first async use, it binds to the running event loop
+        if self._acollection is None:
+            from pymongo import AsyncMongoClient
+
+            self._aclient = AsyncMongoClient(MONGO_URI)
+            self._acollection = self._aclient[MONGO_DB][self.collection_name]
+        return self._acollection
+
+    def _build_docs(self, texts: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[list]):
+        ingested_at = datetime.now(timezone.utc)
 
         docs = []
         for i in range(len(texts)):
-            docs.append({
+            doc = {
                 "_id": ids[i],
                 "text": texts[i],
-                "embedding": embeddings[i],
-                "metadata": metadatas[i]
-            })
+                "metadata": metadatas[i],
+                "ingested_at": ingested_at,
+                "embedding_versions": [self.version]
+            }
+            if self.version == LEGACY_EMBEDDING_VERSION:
+                doc["embedding"] = embeddings[i]
+            else:
+                doc["embeddings"] = {self.version: embeddings[i]}
+            docs.append(doc)
+        return docs
+
+    def _after_add(self, texts: List[str], metadatas: List[Dict], ids: List[str], embeddings: List[list]):
+        if self.index is not None:
+            self.index.add(ids, embeddings, texts, metadatas)
+        elif RETRIEVAL_MODE == "hybrid":
+            lexical = self._lexical_index()
+            for doc_id, text in zip(ids, texts):
+                lexical.add(doc_id, text)
+
+    @staticmethod
+    def _ignore_existing(error):
+        # ids are deterministic (<summary_id>_<n>), a duplicate key means a retried ingest already wrote the doc
+        if any(e.get("code") != 11000 for e in error.details.get("writeErrors", [])) or error.details.get("writeConcernErrors"):
+            raise error
+
+    def add(self, texts: List[str], metadatas: List[Dict], ids: List[str]):
+        from pymongo.errors import BulkWriteError
+
+        embeddings = self.embedder.embed(texts)
+        try:
+            self.collection.insert_many(self._build_docs(texts, metadatas, ids, embeddings), ordered=False)
+        except BulkWriteError as e:
+            self._ignore_existing(e)
+        self._after_add(texts, metadatas, ids, embeddings)
 
-        self.collection.insert_many(docs)
+    async def aadd(self, texts: List[str], metadatas: List[Dict], ids: List[str]):
+        from pymongo.errors import BulkWriteError
+
+        embeddings = await self.embedder.aembed(texts)
+        try:
+            await self._async_collection().insert_many(self._build_docs(texts, metadatas, ids, embeddings), ordered=False)
+        except BulkWriteError as e:
+            self._ignore_existing(e)
+        await asyncio.to_thread(self._after_add, texts, metadatas, ids, embeddings)
 
     def query(self, text: str, top_k: int = 5):
         query_vector = self.embedder.embed([text])[0]
+        return self._query_vector(text, query_vector, top_k)
+
+    def query_vector(self, text: str, query_vector: list, top_k: int = 5):
+        return self._query_vector(text, query_vector, top_k)
+
+    async def aquery(self, text: str, top_k: int = 5):
+        query_vector = (await self.embedder.aembed([text]))[0]
+        if RETRIEVAL_MODE == "hybrid" or self.index is not None:
+            # in-process index and fusion are CPU work plus an occasional catch-up read
+            return await asyncio.to_thread(self._query_vector, text, query_vector, top_k)
+
+        results = []
+        cursor = self._async_collection().find(
+            {self.field: {"$exists": True}},
+            projection={"text": 1, "metadata": 1, self.field: 1}
+        )
+        async for doc in cursor:
+            results.append(self._scored(doc, query_vector))
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results[:top_k]
+
+    def _query_vector(self, text: str, query_vector: list, top_k: int):
+        if RETRIEVAL_MODE == "hybrid":
+            return self._hybrid_query(text, query_vector, top_k)
+        return self._dense_query(query_vector, top_k)
+
+    def _scored(self, doc: Dict, query_vector: list) -> Dict:
+        embedding = doc["embedding"] if self.field == "embedding" else doc["embeddings"][self.version]
+        return {
+            "id": doc["_id"],
+            "text": doc["text"],
+            "metadata": doc["metadata"],
+            "score": cosine_similarity(query_vector, embedding)
+        }
+
+    def _lexical_index(self):
+        if self.index is not None:
+            return self.index.lexical
+        from files.lexical import get_lexical_index
+
+        lexical = get_lexical_index(f"{MONGO_DB}.{self.collection_name}.{self.version}")
+        lexical.sync(self.collection, self.field)
+        return lexical
+
+    def _hybrid_query(self, text: str, query_vector: list, top_k: int):
+        from files.lexical import fuse_results
+
+        if self.index is not None:
+            self.index.catch_up(self.collection)
+        lexical = self._lexical_index()
+
+        if LEXICAL_PREFILTER:
+            candidates = lexical.search(text, LEXICAL_PREFILTER)
+            if len(candidates) >= top_k:
+                # cheap pre-filter: dense scoring only on documents sharing terms with the query
+                candidate_ids = [doc_id for doc_id, _ in candidates]
+                dense = self._dense_query(query_vector, len(candidate_ids), candidate_ids)
+                return fuse_results(dense, candidates[:HYBRID_DEPTH], top_k, HYBRID_FUSION, HYBRID_ALPHA)
+
+        lexical_hits = lexical.search(text, HYBRID_DEPTH)
+        dense = self._dense_query(query_vector, HYBRID_DEPTH)
+        # lexical hits outside the dense top-N still need a dense score to be fused
+        missing = {doc_id for doc_id, _ in lexical_hits} - {r["id"] for r in dense}
+        if missing:
+            dense += self._dense_query(query_vector, len(missing), missing)
+        return fuse_results(dense, lexical_hits, top_k, HYBRID_FUSION, HYBRID_ALPHA)
+
+    def _dense_query(self, query_vector: list, top_k: int, candidate_ids=None):
+        if self.index is not None:
+            self.index.catch_up(self.collection)
+            return self.index.search(query_vector, top_k, candidate_ids)
 
         results = []
-        for doc in self.collection.find():
-            score = cosine_similarity(query_vector, doc["embedding"])
-            results.append({
-                "id": doc["_id"],
-                "text": doc["text"],
-                "metadata": doc["metadata"],
-                "score": score
-            })
+        #! only documents embedded with the active version are comparable with the query
+        filters = {self.field: {"$exists": True}}
+        if candidate_ids is not None:
+            filters["_id"] = {"$in": list(candidate_ids)}
+        cursor = self.collection.find(
+            filters,
+            projection={"text": 1, "metadata": 1, self.field: 1}
+        )
+        for doc in cursor:
+            results.append(self._scored(doc, query_vector))
 
         results.sort(key=lambda x: x["score"], reverse=True)
         return results[:top_k]
 
+
+class InMemoryVectorStore(VectorStore):
+    """Documents and unit-normalised vectors held in process; for tests, load tests and small corpora."""
+
+    def __init__(self, embedder: Embedder | None = None):
+        self.embedder = embedder or default_embedder()
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self._positions: Dict[str, int] = {}
+        self._matrix = None
+        self._pending: List[list] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, texts: List[str], metadatas: List[Dict], ids: List[str]):
+        import numpy as np
+
+        vectors = np.asarray(self.embedder.embed(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1, norms)
+        with self._lock:
+            self._flush()
+            for doc_id, text, meta, vector in zip(ids, texts, metadatas, vectors):
+                position = self._positions.get(doc_id)
+                if position is not None:
+                    # same id again replaces the document, like a Mongo upsert would
+                    self.texts[position], self.metadatas[position] = text, meta
+                    flushed = 0 if self._matrix is None else len(self._matrix)
+                    if position < flushed:
+                        self._matrix[position] = vector
+                    else:
+                        self._pending[position - flushed] = vector
+                    continue
+                self._positions[doc_id] = len(self.ids)
+                self.ids.append(doc_id)
+                self.texts.append(text)
+                self.metadatas.append(meta)
+                self._pending.append(vector)
+
+    def _flush(self):
+        # appended vectors are stacked once per read instead of once per add
+        if not self._pending:
+            return
+        import numpy as np
+
+        pending = np.vstack(self._pending)
+        self._matrix = pending if self._matrix is None else np.vstack([self._matrix, pending])
+        self._pending = []
+
+    def query(self, text: str, top_k: int = 5):
+        return self.query_vector(text, self.embedder.embed([text])[0], top_k)
+
+    def query_vector(self, text: str, query_vector: list, top_k: int = 5):
+        import numpy as np
+
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+        with self._lock:
+            self._flush()
+            if self._matrix is None or top_k <= 0:
+                return []
+            scores = self._matrix @ query_vector
+            k = min(top_k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {
+                    "id": self.ids[i],
+                    "text": self.texts[i],
+                    "metadata": self.metadatas[i],
+                    "score": float(scores[i])
+                }
+                for i in top
+            ]
+
+
+def _chroma_store(embedder: Embedder | None = None) -> VectorStore:
+    from files.chroma import ChromaDBManager
+
+    return ChromaDBManager(
+        collection_name=os.getenv("CHROMA_COLLECTION", "deviation_vectors"),
+        persist_dir=os.getenv("CHROMA_PERSIST_DIR", "./chromadb_data"),
+        embedder=embedder or default_embedder()
+    )
+
+
+VECTOR_BACKENDS: Dict[str, Callable[..., VectorStore]] = {
+    "mongo": lambda embedder=None: MongoVectorStore(embedder=embedder),
+    "memory": InMemoryVectorStore,
+    "chroma": _chroma_store,
+}
+#! in-process backends hold their data (or an open database) in the instance, one per process
+SHARED_BACKENDS = {"memory", "chroma"}
+
+_shared_stores: Dict[str, VectorStore] = {}
+_shared_lock = threading.Lock()
+
+
+def register_vector_backend(name: str, factory: Callable[..., VectorStore], shared: bool = False):
+    VECTOR_BACKENDS[name] = factory
+    if shared:
+        SHARED_BACKENDS.add(name)
+
+
+def get_vector_store(backend: str | None = None, embedder: Embedder | None = None) -> VectorStore:
+    """The configured VectorStore (VECTOR_BACKEND unless `backend` is given)."""
+    backend = (backend or VECTOR_BACKEND).lower()
+    if backend not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector backend: {backend} (expected one of {', '.join(VECTOR_BACKENDS)})")
+    if backend not in SHARED_BACKENDS or embedder is not None:
+        return VECTOR_BACKENDS[backend](embedder=embedder)
+    with _shared_lock:
+        if backend not in _shared_stores:
+            _shared_stores[backend] = VECTOR_BACKENDS[backend]()
+        return _shared_stores[backend]
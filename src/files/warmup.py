@@ -0,0 +1,99 @@
+import os
+import time
+import threading
+import importlib
+from typing import Dict, Any, List, Callable, Tuple
+
+#! startup modes
+#! lazy  -> nothing heavy is imported at startup, first request pays the cost
+#! eager -> everything is imported and built before the app accepts traffic
+#! with STARTUP_PREWARM=1 a lazy app warms itself up in a background thread
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+STARTUP_PREWARM = os.getenv("STARTUP_PREWARM", "0") == "1"
+
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "pymongo",
+    "redis",
+    "upstash_redis",
+    "openai",
+    "litellm",
+    "crewai",
+]
+
+
+def _build_agents():
+    from files.agents import get_llm, get_summarizer_agent, get_instruction_agent
+
+    get_llm()
+    get_summarizer_agent()
+    get_instruction_agent()
+
+
+class WarmupState:
+    """Tracks which heavy dependencies have been loaded and how long each took."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.status = "cold"
+        self.started_at = None
+        self.finished_at = None
+        self.steps: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    def _steps(self) -> List[Tuple[str, Callable[[], Any]]]:
+        steps = [(name, lambda name=name: importlib.import_module(name)) for name in HEAVY_MODULES]
+        steps.append(("agents", _build_agents))
+        return steps
+
+    def warm_up(self) -> Dict[str, Any]:
+        with self._lock:
+            if self.status in ("warming", "ready"):
+                return self.snapshot()
+            self.status = "warming"
+            self.started_at = time.time()
+
+        for name, step in self._steps():
+            start = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.errors[name] = str(e)
+            self.steps[name] = round((time.perf_counter() - start) * 1000, 1)
+
+        with self._lock:
+            self.finished_at = time.time()
+            self.status = "failed" if self.errors else "ready"
+        return self.snapshot()
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.warm_up, name="prewarm", daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self) -> bool:
+        # a cold lazy app can still serve requests, only an unfinished or failed warm-up is not ready
+        return self.status in ("cold", "ready")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "mode": STARTUP_MODE,
+            "prewarm": STARTUP_PREWARM,
+            "status": self.status,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "steps_ms": dict(self.steps),
+            "errors": dict(self.errors),
+        }
+
+
+warmup_state = WarmupState()
+
+
+def on_startup():
+    if STARTUP_MODE == "eager":
+        warmup_state.warm_up()
+    elif STARTUP_PREWARM:
+        warmup_state.start_background()
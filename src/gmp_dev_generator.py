@@ -1,25 +1,24 @@
 
 ### * importing * ###
 import os
+import re
 import json
 from files.helperfunc import import_data, load_active_prompts, processing_content,process_description
-from files.agents import llm, summarizerAgent, instructionAnsweringAgent
+from files.agents import get_llm
 from files.brainstorminghelper import summary_qa
+from files.section_cache import get_section_cache, summary_key, subsection_key
+from files.metrics import metrics
+from files.cancellation import check_cancelled
 from dotenv import load_dotenv
 #! brainstorming function
 load_dotenv()
-def deviation_generation(input_data: dict):
+#! 1: subsections of the same section are generated in one call (falls back per subsection)
+GMP_BATCH_SUBSECTIONS = os.getenv("GMP_BATCH_SUBSECTIONS", "0") == "1"
+GMP_BATCH_MAX_SUBSECTIONS = int(os.getenv("GMP_BATCH_MAX_SUBSECTIONS", 4))
 
-    prompts=load_active_prompts("prompts/Prompts Output 1 1.xlsx") 
-    print("!")
-    summary={}
-    for key, value in input_data.items():
-        summary[key]=summary_qa(value)
-    print("summary done")
-    results = {}
-    for prompte in prompts:
-        section, subsection, prompt = prompte
-        query=f"""You are a highly experienced Pharmaceutical GMP document writer and technical editor.
+
+def subsection_query(subsection: str, context: str, prompt: str) -> str:
+    return f"""You are a highly experienced Pharmaceutical GMP document writer and technical editor.
 
         You have strong knowledge of GMP regulations, pharmaceutical quality systems, deviation management, CAPA, root cause analysis, and proper GMP terminology.
 
@@ -28,7 +27,7 @@ def deviation_generation(input_data: dict):
         {subsection}
 
         CONTEXT (PAST KNOWLEDGE):
-        {summary[section]}
+        {context}
 
         INSTRUCTIONS (MUST BE FOLLOWED STRICTLY):
         {prompt}
@@ -44,12 +43,178 @@ def deviation_generation(input_data: dict):
         OUTPUT:
         Return only the written **{subsection}** in Markdown. No explanations or extra text.
     """
-        llm_response=llm.call(query)
+
+
+def group_by_section(pending: list, max_size: int) -> list:
+    """Split pending (prompt row, cache key) pairs into per-section groups of at most max_size."""
+    groups = {}
+    for item in pending:
+        groups.setdefault(item[0][0], []).append(item)
+    return [
+        rows[i:i + max_size]
+        for rows in groups.values()
+        for i in range(0, len(rows), max(1, max_size))
+    ]
+
+
+def batch_query(context: str, rows: list) -> str:
+    tasks = "\n".join(
+        f"""
+        ### SECTION {n}: {subsection}
+        INSTRUCTIONS (MUST BE FOLLOWED STRICTLY):
+        {prompt}
+"""
+        for n, (_, subsection, prompt) in enumerate(rows, 1)
+    )
+    return f"""You are a highly experienced Pharmaceutical GMP document writer and technical editor.
+
+        You have strong knowledge of GMP regulations, pharmaceutical quality systems, deviation management, CAPA, root cause analysis, and proper GMP terminology.
+
+        TASK:
+        Write the following {len(rows)} GMP document sections. They share the same context.
+
+        CONTEXT (PAST KNOWLEDGE):
+        {context}
+
+        REQUIREMENTS (APPLY TO EVERY SECTION):
+        - Output must be in **Markdown**
+        - Use **professional, regulatory-compliant GMP language**
+        - Do **not add or assume facts** beyond the given context
+        - Maintain a **formal, audit-ready tone**
+        - Use clear headings and bullet points where appropriate
+        - Produce only the completed section content
+{tasks}
+        OUTPUT:
+        Write every section between its markers, in the order given, exactly like this:
+        <<<BEGIN 1>>>
+        (section 1 in Markdown)
+        <<<END 1>>>
+        <<<BEGIN 2>>>
+        (section 2 in Markdown)
+        <<<END 2>>>
+        Nothing before, between or after the marked sections.
+    """
+
+
+_BEGIN_MARKER = re.compile(r"<<<\s*BEGIN\s+(\d+)\s*>>>", re.IGNORECASE)
+_END_MARKER = re.compile(r"<<<\s*END\s+\d+\s*>>>", re.IGNORECASE)
+
+
+def parse_batch(response: str, count: int) -> dict:
+    """{position: text} for the sections found in a batched response (0-based positions)."""
+    outputs = {}
+    markers = list(_BEGIN_MARKER.finditer(response))
+    for marker, following in zip(markers, markers[1:] + [None]):
+        number = int(marker.group(1))
+        body = response[marker.end():following.start() if following else len(response)]
+        end = _END_MARKER.search(body)
+        if end is not None:
+            body = body[:end.start()]
+        body = body.strip()
+        # first occurrence wins; out-of-range numbers are ignored
+        if body and 1 <= number <= count and number - 1 not in outputs:
+            outputs[number - 1] = body
+    return outputs
+
+
+def generate_batch(context: str, rows: list) -> dict:
+    response = get_llm("section").call(batch_query(context, rows))
+    if response.startswith("[LLM ERROR]"):
+        metrics.inc("gmp_batch_fallback", len(rows))
+        return {}
+    outputs = parse_batch(response, len(rows))
+    metrics.inc("gmp_batch_calls")
+    metrics.inc("gmp_batch_fallback", len(rows) - len(outputs))
+    return outputs
+
+
+def deviation_generation(input_data: dict, with_report: bool = False):
+
+    prompts=load_active_prompts("prompts/Prompts Output 1 1.xlsx") 
+    print("!")
+    cache = get_section_cache()
+    model = get_llm("section").model
+    summary_model = get_llm("summary").model
+    summary={}
+    regenerated_sections = set()
+    for key, value in input_data.items():
+        check_cancelled()
+        #! summaries are memoised on (section input, summary model), unchanged sections are not re-summarised
+        cache_key = summary_key(value, summary_model)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            summary[key] = cached
+            continue
+        summary[key]=summary_qa(value)
+        regenerated_sections.add(key)
+        if not summary[key].startswith("[LLM ERROR]"):
+            cache.set(cache_key, summary[key])
+    print("summary done")
+    results = {}
+    reused_subsections, regenerated_subsections, batched_subsections = [], [], []
+    pending = []
+    for prompte in prompts:
+        section, subsection, prompt = prompte
+        #! subsection output is memoised on (summary, prompt row, model)
+        cache_key = subsection_key(summary[section], prompte, model)
+        cached = cache.get(cache_key)
+        if cached is not None:
+            results[subsection] = cached
+            reused_subsections.append(subsection)
+            continue
+        regenerated_sections.add(section)
+        pending.append((prompte, cache_key))
+
+    #! batched mode: the subsections of one section share a call, and the summary / requirements prefill
+    done = set()
+    if GMP_BATCH_SUBSECTIONS:
+        for group in group_by_section(pending, GMP_BATCH_MAX_SUBSECTIONS):
+            if len(group) < 2:
+                continue
+            check_cancelled()
+            section = group[0][0][0]
+            outputs = generate_batch(summary[section], [prompte for prompte, _ in group])
+            for position, (prompte, cache_key) in enumerate(group):
+                text = outputs.get(position)
+                if not text:
+                    continue  # generated individually below
+                subsection = prompte[1]
+                results[subsection] = text
+                regenerated_subsections.append(subsection)
+                batched_subsections.append(subsection)
+                cache.set(cache_key, text)
+                done.add(id(prompte))
+            print(f"Completed sections: {', '.join(prompte[1] for prompte, _ in group)}")
+
+    for prompte, cache_key in pending:
+        if id(prompte) in done:
+            continue
+        #! a cancelled request (client gone, deadline passed) stops before the next LLM call
+        check_cancelled()
+        section, subsection, prompt = prompte
+        query = subsection_query(subsection, summary[section], prompt)
+        llm_response=get_llm("section").call(query)
         results[subsection]=llm_response
+        regenerated_subsections.append(subsection)
+        if not llm_response.startswith("[LLM ERROR]"):
+            cache.set(cache_key, llm_response)
 
         print(f"Completed section: {subsection}")
+    # batched and individual outputs come back in prompt-sheet order
+    results = {subsection: results[subsection] for _, subsection, _ in prompts}
 
-    return results
+    if not with_report:
+        return results
+    report = {
+        "regenerated": [key for key in input_data if key in regenerated_sections],
+        "reused": [key for key in input_data if key not in regenerated_sections],
+        "subsections": {
+            "regenerated": regenerated_subsections,
+            "reused": reused_subsections,
+            "batched": batched_subsections,
+        },
+    }
+    return results, report
 
 
 
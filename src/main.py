@@ -1,16 +1,38 @@
 import os
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Dict, Any
 from gmp_dev_generator import deviation_generation
 from brainstorming import brain
-from  add_content import add_data
+from  add_content import add_data, enqueue_data, start_ingest_workers
+from files.warmup import warmup_state, on_startup
+from files.metrics import metrics
+from files.llm_scheduler import get_scheduler
+from files.routing import route_stats
+from files.similarity_cache import get_similarity_cache
+from files.ingest_queue import get_ingest_queue, queue_stats
+from files.profiling import profiled, profile_id_for, list_profiles, profile_artifact, PROFILING
+from files.admin import admin_authorized
+from files.cancellation import run_cancellable, deadline_from_headers, RequestCancelled, DEADLINE_EXCEEDED
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    on_startup()
+    ingest_workers = start_ingest_workers()
+    yield
+    if ingest_workers is not None:
+        ingest_workers.stop()
+
 
 app = FastAPI(
     title="GMP Deviation Brainstorming API",
     description="API for GMP deviation ingestion and expert brainstorming",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -37,14 +59,48 @@ def health_check():
         "status": "running",
         "message": "GMP Brainstorming API is live"
     }
+@app.get("/ready")
+def readiness_check():
+    state = warmup_state.snapshot()
+    status_code = 200 if warmup_state.is_ready() else 503
+    return JSONResponse(status_code=status_code, content=state)
+@app.get("/metrics")
+def metrics_snapshot(http_request: Request):
+    # queue depths, route models and error counts are operational detail, not public
+    check_admin(http_request)
+    scheduler = get_scheduler()
+    similarity_cache = get_similarity_cache()
+    return {
+        **metrics.snapshot(),
+        "llm_scheduler": scheduler.stats() if scheduler else {"enabled": False},
+        "llm_routes": route_stats(),
+        "similarity_cache": similarity_cache.stats() if similarity_cache else {"mode": "off"},
+        "ingest_queue": queue_stats()
+    }
+def cancelled_response(e: RequestCancelled) -> HTTPException:
+    # 504 when the deadline ran out; 499 (client closed request) is only seen in logs
+    return HTTPException(
+        status_code=504 if e.reason == DEADLINE_EXCEEDED else 499,
+        detail=f"Request cancelled: {e.reason}"
+    )
 @app.post("/brainstorming")
-def run_brainstorming(request: BrainstormingRequest):
+async def run_brainstorming(request: BrainstormingRequest, http_request: Request):
+    profile_id = profile_id_for(http_request.headers)
     try:
-        result = brain(request.data)
-        return {
+        result, report = await run_cancellable(
+            http_request, profiled(brain, profile_id, "brainstorming"), request.data, with_report=True,
+            timeout=deadline_from_headers(http_request.headers)
+        )
+        response = {
             "status": "success",
-            "result": result
+            "result": result,
+            "report": report
         }
+        if profile_id:
+            response["profile_id"] = profile_id
+        return response
+    except RequestCancelled as e:
+        raise cancelled_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -53,6 +109,13 @@ def run_brainstorming(request: BrainstormingRequest):
 @app.post("/adddata")
 def ingest_deviation(request: AddDataRequest):
     try:
+        if get_ingest_queue() is not None:
+            # write-behind: the id is returned now, the workers do the analysis and the writes
+            return {
+                "status": "success",
+                "response": enqueue_data(request.data),
+                "queued": True
+            }
         response = add_data(request.data)
         return {
             "status": "success",
@@ -63,19 +126,52 @@ def ingest_deviation(request: AddDataRequest):
             status_code=500,
             detail=str(e)
         )
+@app.get("/ingest/dead-letters")
+def ingest_dead_letters(http_request: Request, limit: int = 100):
+    # dead letters carry the full Description / Root Cause and the error text
+    queue = get_ingest_queue()
+    check_admin(http_request, enabled=queue is not None)
+    return {"dead_letters": queue.dead_letters(limit)}
 @app.post("/gmpgeneration")
-def generate_gmp_deviation(request: GMPResponse):
+async def generate_gmp_deviation(request: GMPResponse, http_request: Request):
+    profile_id = profile_id_for(http_request.headers)
     try:
-        result = deviation_generation(request.data)
-        return {
+        result, report = await run_cancellable(
+            http_request, profiled(deviation_generation, profile_id, "gmpgeneration"), request.data, with_report=True,
+            timeout=deadline_from_headers(http_request.headers)
+        )
+        response = {
             "status": "success",
-            "result": result
+            "result": result,
+            "sections": report
         }
+        if profile_id:
+            response["profile_id"] = profile_id
+        return response
+    except RequestCancelled as e:
+        raise cancelled_response(e)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
+def check_admin(http_request: Request, enabled: bool = True):
+    # admin data comes from deviation requests (payloads, stack traces, errors): never served without the token
+    if not enabled:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not admin_authorized(http_request.headers):
+        raise HTTPException(status_code=403, detail="Admin token required")
+@app.get("/admin/profiles")
+def recent_profiles(http_request: Request, limit: int = 20):
+    check_admin(http_request, enabled=PROFILING)
+    return {"profiles": list_profiles(limit)}
+@app.get("/admin/profiles/{profile_id}")
+def download_profile(profile_id: str, http_request: Request, artifact: str = "profile.json"):
+    check_admin(http_request, enabled=PROFILING)
+    path = profile_artifact(profile_id, artifact)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, filename=f"{profile_id}-{artifact}")
 
 if __name__ == "__main__":
     import uvicorn
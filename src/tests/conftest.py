@@ -0,0 +1,121 @@
+import os
+import sys
+import random
+import hashlib
+
+import pytest
+
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SRC_DIR)
+
+from files.embedding import Embedder  # noqa: E402
+
+
+class HashEmbedder(Embedder):
+    """Deterministic pseudo-random vectors, no network."""
+
+    def __init__(self, dimensions: int = 16):
+        self.dimensions = dimensions
+        self.calls = 0
+
+    def embed(self, texts):
+        self.calls += 1
+        vectors = []
+        for text in texts:
+            rng = random.Random(hashlib.sha256(str(text).encode("utf-8")).digest())
+            vectors.append([rng.gauss(0, 1) for _ in range(self.dimensions)])
+        return vectors
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder()
+
+
+@pytest.fixture
+def answers():
+    # process_description output: one deviation = the list of 10 answers
+    return [f"answer {i}: tablet press punch force hardness batch B-{i}" for i in range(1, 11)]
+
+
+_MISSING = object()
+
+
+def _lookup(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, q) for q in cond):
+                return False
+            continue
+        value = _lookup(doc, key)
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            ok = {
+                "$eq": lambda: value == arg,
+                "$exists": lambda: (value is not _MISSING) == arg,
+                "$gt": lambda: value is not _MISSING and value > arg,
+                "$gte": lambda: value is not _MISSING and value >= arg,
+                "$in": lambda: value in arg,
+            }[op]()
+            if not ok:
+                return False
+    return True
+
+
+class _Cursor(list):
+    def sort(self, key, direction=1):
+        keys = key if isinstance(key, list) else [(key, direction)]
+        for field, order in reversed(keys):
+            super().sort(key=lambda doc: _lookup(doc, field), reverse=order == -1)
+        return self
+
+    def limit(self, n):
+        return _Cursor(self[:n])
+
+
+class MemoryCollection:
+    """The slice of a pymongo collection the snapshot / dedup / reembed code uses."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.docs[doc["_id"]] = dict(doc)
+
+    def find(self, query=None, projection=None):
+        return _Cursor(dict(doc) for doc in self.docs.values() if _matches(doc, query or {}))
+
+    def update_many(self, query, update):
+        for doc in self.docs.values():
+            if _matches(doc, query):
+                for path, value in update.get("$set", {}).items():
+                    *parents, leaf = path.split(".")
+                    target = doc
+                    for part in parents:
+                        target = target.setdefault(part, {})
+                    target[leaf] = value
+
+    def update_one(self, query, update, upsert=False):
+        self.update_many(query, update)
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.update_many(request._filter, request._doc)
+
+
+@pytest.fixture
+def collection():
+    return MemoryCollection()
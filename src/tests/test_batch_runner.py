@@ -0,0 +1,20 @@
+import json
+
+import add_content
+import batch_runner
+
+
+def test_add_resume_reuses_deviation_ids(tmp_path, monkeypatch):
+    stored = []
+    monkeypatch.setattr(add_content, "add_data", lambda data, deviation_id=None: stored.append(deviation_id))
+    source = tmp_path / "deviations.jsonl"
+    source.write_text("\n".join(json.dumps({"id": f"d{i}", "data": {"Description": f"text {i}"}}) for i in range(3)))
+    output, checkpoint = tmp_path / "out.jsonl", tmp_path / "out.checkpoint"
+
+    batch_runner.run_batch("add", str(source), str(output), str(checkpoint), workers=2)
+    # crash after storing but before checkpointing: the rerun stores the same items again
+    checkpoint.unlink()
+    batch_runner.run_batch("add", str(source), str(output), str(checkpoint), workers=2)
+
+    assert len(stored) == 6 and len(set(stored)) == 3
+    assert all(deviation_id.startswith("DEV-") for deviation_id in stored)
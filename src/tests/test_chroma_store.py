@@ -0,0 +1,21 @@
+import pytest
+
+pytest.importorskip("chromadb")
+
+from files.chroma import ChromaDBManager  # noqa: E402
+from files.deviation_store import DeviationRepository, DeviationSimilarityService  # noqa: E402
+
+
+def test_add_flattens_answer_lists(tmp_path, embedder, answers):
+    store = ChromaDBManager("test_vectors", persist_dir=str(tmp_path), embedder=embedder)
+    repo = DeviationRepository(store)
+
+    repo.save_answers("DEV-1", [answers])
+
+    stored = store.collection.get(ids=["DEV-1_1"], include=["documents", "metadatas"])
+    assert stored["documents"][0] == "\n".join(answers)
+    assert stored["metadatas"][0] == {"summary_id": "DEV-1", "answer": "\n".join(answers)}
+
+    hits = DeviationSimilarityService(store).find_similar([answers], top_k=1)[0]["matches"]
+    assert hits[0]["id"] == "DEV-1_1"
+    assert hits[0]["score"] == pytest.approx(1.0, abs=1e-4)
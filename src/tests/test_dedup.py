@@ -0,0 +1,44 @@
+from datetime import datetime, timezone, timedelta
+
+from files import dedup
+from files.deviation_store import DeviationRepository
+from files.vectorstores import InMemoryVectorStore
+
+OLD = "Tablet hardness below specification after the punch force was lowered on press 4, batch B-112"
+NEW = "Coating solution viscosity drifted during the spray phase, pan 2 stopped, batch C-907"
+
+
+def _answer_docs(summary_id, text, ingested_at, signature=None):
+    meta = {"summary_id": summary_id, "answer": text}
+    if signature is not None:
+        meta["minhash"] = dedup.encode_signature(signature)
+    return [{"_id": f"{summary_id}_1", "text": text, "metadata": meta, "ingested_at": ingested_at}]
+
+
+def test_backfilled_signatures_reach_other_workers(collection):
+    now = datetime.now(timezone.utc)
+    collection.insert_many(_answer_docs("new", NEW, now, dedup.minhash(NEW)))
+    collection.insert_many(_answer_docs("old", OLD, now - timedelta(days=30)))
+
+    worker = dedup.NearDuplicateIndex()
+    assert worker.sync(collection, min_interval=0) == 1
+
+    # the CLI runs in its own process, with its own index
+    counts = dedup.backfill_signatures(collection, dedup.NearDuplicateIndex())
+    assert counts["signed"] == 1
+
+    assert worker.sync(collection, min_interval=0) == 1
+    assert worker.find(dedup.minhash(OLD))[0] == "old"
+
+
+def test_merge_falls_back_to_flag_without_mongo(monkeypatch, embedder, answers):
+    monkeypatch.setattr(dedup, "DEDUP_POLICY", "merge")
+    store = InMemoryVectorStore(embedder=embedder)
+    repo = DeviationRepository(store, duplicates=dedup.NearDuplicateIndex())
+
+    assert repo.save_answers("first", answers, OLD)["action"] == "added"
+    decision = repo.save_answers("second", answers, OLD)
+
+    assert decision["action"] == "flagged" and decision["duplicate_of"] == "first"
+    stored = [meta for meta in store.metadatas if meta["summary_id"] == "second"]
+    assert len(stored) == len(answers) and stored[0]["duplicate_of"] == "first"
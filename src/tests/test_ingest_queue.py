@@ -0,0 +1,139 @@
+import time
+
+import pytest
+
+import add_content
+from files import ingest_queue
+from files.ingest_queue import IngestRecord, IngestWorker, SqliteIngestQueue
+from files.vectorstores import InMemoryVectorStore
+
+
+class FailingLLM:
+    """CustomLLM during a provider outage: call() returns the error text instead of raising."""
+
+    model = "failing"
+
+    def __init__(self):
+        self.calls = 0
+
+    def call(self, prompt):
+        self.calls += 1
+        return "[LLM ERROR] 503 Server Error: Service Unavailable"
+
+
+class AnsweringLLM:
+    model = "answering"
+
+    def call(self, prompt):
+        return "".join(f"# Ans{i}\nanswer {i}\n" for i in range(1, 11))
+
+
+class MemoryRecords:
+    records = {}
+
+    def save_deviation(self, deviation_id, data):
+        self.records[deviation_id] = data
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch, embedder):
+    store = InMemoryVectorStore(embedder=embedder)
+    MemoryRecords.records = {}
+    monkeypatch.setattr(add_content, "get_vector_store", lambda: store)
+    monkeypatch.setattr(add_content, "DeviationUpstashRedisRepository", MemoryRecords)
+    monkeypatch.setattr(ingest_queue, "INGEST_RETRY_BACKOFF_S", 0)
+    monkeypatch.setattr(ingest_queue, "INGEST_MAX_ATTEMPTS", 3)
+    queue = SqliteIngestQueue(str(tmp_path / "queue.db"))
+    monkeypatch.setattr(ingest_queue, "get_ingest_queue", lambda: queue)
+    return queue, store
+
+
+def test_llm_outage_is_retried_then_dead_lettered(pipeline, monkeypatch):
+    queue, store = pipeline
+    llm = FailingLLM()
+    monkeypatch.setattr(add_content, "get_llm", lambda task=None: llm)
+    deviation_id = add_content.enqueue_data({"Description": "tablet press tripped", "Root Cause": "punch wear"})
+
+    worker = IngestWorker(queue, add_content.ingest_batch)
+    for _ in range(5):
+        worker.run_once()
+
+    assert llm.calls == 3  # every attempt re-ran the analysis, nothing empty was kept on the record
+    assert store.texts == []
+    assert deviation_id not in MemoryRecords.records
+    dead = queue.dead_letters()
+    assert [d["id"] for d in dead] == [deviation_id]
+    assert dead[0]["attempts"] == 3
+    assert "answers" not in dead[0]["state"]
+    assert "AnalysisFailed" in dead[0]["error"]
+
+
+def test_outage_recovers_on_retry(pipeline, monkeypatch):
+    queue, store = pipeline
+    monkeypatch.setattr(add_content, "get_llm", lambda task=None: FailingLLM())
+    deviation_id = add_content.enqueue_data({"Description": "tablet press tripped", "Root Cause": "punch wear"})
+    worker = IngestWorker(queue, add_content.ingest_batch)
+    worker.run_once()
+
+    monkeypatch.setattr(add_content, "get_llm", lambda task=None: AnsweringLLM())
+    worker.run_once()
+
+    assert MemoryRecords.records[deviation_id]["root_cause"] == "punch wear"
+    assert queue.stats()["pending"] == queue.stats()["dead"] == 0
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "INGEST_RETRY_BACKOFF_S", 0)
+    monkeypatch.setattr(ingest_queue, "INGEST_MAX_ATTEMPTS", 3)
+    queue = SqliteIngestQueue(str(tmp_path / "queue.db"))
+    for n in range(3):
+        queue.enqueue(IngestRecord(f"DEV-{n}", {"Description": f"deviation {n}"}, time.time() - (3 - n) * 1e-3))
+    return queue
+
+
+def test_worker_retries_only_the_failed_record_and_keeps_its_state(queue):
+    seen = []
+
+    def process_batch(records):
+        seen.append([r.id for r in records])
+        for record in records:
+            record.state.setdefault("answers", [f"analysis of {record.id}"])
+        return {"DEV-1": RuntimeError("Mongo unavailable")} if len(seen) == 1 else {}
+
+    worker = IngestWorker(queue, process_batch)
+    assert worker.run_once() == 3
+    retried = queue.claim(10)
+    assert [r.id for r in retried] == ["DEV-1"]
+    assert retried[0].attempts == 1 and retried[0].state["answers"] == ["analysis of DEV-1"]
+
+
+def test_retry_waits_for_its_backoff(queue, monkeypatch):
+    monkeypatch.setattr(ingest_queue, "INGEST_RETRY_BACKOFF_S", 60)
+    worker = IngestWorker(queue, lambda records: {"DEV-0": ValueError("bad record")})
+    worker.run_once()
+    assert queue.claim(10) == []
+    assert queue.stats()["pending"] == 1
+
+
+def test_crashed_batch_is_dead_lettered_after_max_attempts(queue):
+    def process_batch(records):
+        raise ConnectionError("redis down")
+
+    worker = IngestWorker(queue, process_batch)
+    for _ in range(3):
+        assert worker.run_once() == 3
+    assert worker.run_once() == 0
+
+    dead = queue.dead_letters()
+    assert sorted(d["id"] for d in dead) == ["DEV-0", "DEV-1", "DEV-2"]
+    assert all(d["attempts"] == 3 and d["error"] == "ConnectionError: redis down" for d in dead)
+    assert queue.stats() == {"pending": 0, "processing": 0, "dead": 3, "oldest_age_s": 0.0}
+
+
+def test_unacked_claim_is_reclaimed_after_the_visibility_timeout(queue, monkeypatch):
+    # a worker that died mid-batch never acks; its records come back once the lease expires
+    assert len(queue.claim(10)) == 3
+    assert queue.claim(10) == []
+    monkeypatch.setattr(ingest_queue, "INGEST_VISIBILITY_S", 0)
+    assert sorted(r.id for r in queue.claim(10)) == ["DEV-0", "DEV-1", "DEV-2"]
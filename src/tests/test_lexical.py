@@ -0,0 +1,31 @@
+import pytest
+
+from files.lexical import fuse_results
+
+DENSE = [
+    {"id": "a_1", "text": "punch force", "metadata": {}, "score": 0.91},
+    {"id": "b_1", "text": "coating", "metadata": {}, "score": 0.52},
+    {"id": "c_1", "text": "granulation", "metadata": {}, "score": 0.40},
+]
+LEXICAL = [("b_1", 7.5), ("c_1", 3.0), ("lexical_only", 2.0)]
+
+
+@pytest.mark.parametrize("method", ["rrf", "weighted"])
+def test_fusion_keeps_the_cosine_score(method):
+    results = fuse_results(DENSE, LEXICAL, top_k=3, method=method)
+
+    cosine = {r["id"]: r["score"] for r in DENSE}
+    assert [r["score"] for r in results] == [cosine[r["id"]] for r in results]
+    fused = [r["fused_score"] for r in results]
+    assert fused == sorted(fused, reverse=True)
+    assert {r["id"] for r in results} == set(cosine)
+
+
+def test_rrf_ranks_by_both_retrievers():
+    results = fuse_results(DENSE, LEXICAL, top_k=3, method="rrf")
+
+    # found by both retrievers beats the best cosine match found by one only
+    assert [r["id"] for r in results] == ["b_1", "c_1", "a_1"]
+    assert [r["lexical_score"] for r in results] == [7.5, 3.0, 0.0]
+    # RRF values are ~1/60, far below any similarity threshold; score is still the cosine
+    assert results[0]["fused_score"] < 0.05 and results[0]["score"] == 0.52
@@ -0,0 +1,67 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from files.cancellation import CancelToken, RequestCancelled, cancel_scope
+from files.llm_scheduler import LLMScheduler
+
+
+def usage_of(data):
+    return data["usage"]["total_tokens"]
+
+
+@pytest.fixture
+def pool():
+    pool = ThreadPoolExecutor(max_workers=2)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def test_abandoned_call_keeps_its_slot_until_it_completes(pool):
+    scheduler = LLMScheduler(max_in_flight=1, tpm=600)
+    provider_done = threading.Event()
+    future = pool.submit(lambda: provider_done.wait(5) and {"usage": {"total_tokens": 300}})
+
+    def abandon():
+        # what CustomLLM.chat does when the token is cancelled mid-request
+        raise RequestCancelled("client disconnected", pending=future)
+
+    with pytest.raises(RequestCancelled):
+        scheduler.run(abandon, estimated_tokens=100, usage_of=usage_of)
+    assert scheduler.in_flight == 1
+
+    provider_done.set()
+    future.result(timeout=5)
+    assert scheduler.in_flight == 0
+    # charged the real 300 tokens, not the 100 estimate
+    assert scheduler.tokens.tokens < 350
+
+
+def test_cancel_without_a_running_call_releases_at_once():
+    scheduler = LLMScheduler(max_in_flight=1)
+
+    def cancelled():
+        raise RequestCancelled("deadline exceeded")
+
+    with pytest.raises(RequestCancelled):
+        scheduler.run(cancelled, estimated_tokens=100)
+    assert scheduler.in_flight == 0
+
+
+def test_cancelled_waiter_leaves_the_queue(pool):
+    scheduler = LLMScheduler(max_in_flight=1)
+    scheduler.acquire(10)
+    token = CancelToken()
+
+    def wait_for_slot():
+        with cancel_scope(token):
+            return scheduler.run(lambda: "never", estimated_tokens=10)
+
+    waiter = pool.submit(wait_for_slot)
+    token.cancel()
+    with pytest.raises(RequestCancelled):
+        waiter.result(timeout=5)
+    assert scheduler.stats()["queue_depth"] == {"interactive": 0, "bulk": 0}
+    scheduler.release(10)
+    assert scheduler.in_flight == 0
@@ -0,0 +1,59 @@
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+pytest.importorskip("numpy")
+
+from files.reembed import ReembedJob  # noqa: E402
+from files.vector_snapshot import VectorSnapshotIndex  # noqa: E402
+
+FIELD = "embeddings.v2"
+
+
+def _doc(doc_id, text, ingested_at, embedder, versioned=True):
+    doc = {"_id": doc_id, "text": text, "metadata": {"summary_id": doc_id}, "ingested_at": ingested_at,
+           "embedding": embedder.embed([text])[0]}
+    if versioned:
+        doc["embeddings"] = {"v2": embedder.embed([text])[0]}
+    return doc
+
+
+def _reembed(collection, docs, embedder):
+    job = ReembedJob.__new__(ReembedJob)
+    job.collection, job.field, job.target_version = collection, FIELD, "v2"
+    job._write(docs, embedder.embed([doc["text"] for doc in docs]))
+
+
+def test_catch_up_loads_new_documents_once(tmp_path, collection, embedder):
+    now = datetime.now(timezone.utc)
+    collection.insert_many([_doc("a_1", "punch force", now, embedder), _doc("b_1", "coating defect", now, embedder)])
+
+    index = VectorSnapshotIndex(str(tmp_path), field=FIELD)
+    assert index.catch_up(collection, force=True) == 2
+    assert index.catch_up(collection, force=True) == 0
+    assert index.watermark == now
+    index.save()
+
+    restarted = VectorSnapshotIndex(str(tmp_path), field=FIELD)
+    assert restarted.load()
+    assert len(restarted) == 2 and restarted.catch_up(collection, force=True) == 0
+
+
+def test_catch_up_sees_documents_reembedded_after_the_snapshot(tmp_path, collection, embedder):
+    now = datetime.now(timezone.utc)
+    old = _doc("old_1", "granulation moisture out of spec", now - timedelta(days=30), embedder, versioned=False)
+    collection.insert_many([_doc("a_1", "punch force", now, embedder), old])
+
+    index = VectorSnapshotIndex(str(tmp_path), field=FIELD)
+    assert index.catch_up(collection, force=True) == 1
+    index.save()
+
+    # the backfill gives the month-old document the version after the snapshot was written
+    _reembed(collection, [old], embedder)
+
+    restarted = VectorSnapshotIndex(str(tmp_path), field=FIELD)
+    restarted.load()
+    assert restarted.catch_up(collection, force=True) == 1
+    assert restarted.watermark == collection.docs["old_1"]["embedded_at"]
+    hits = restarted.search(embedder.embed([old["text"]])[0], top_k=1)
+    assert hits[0]["id"] == "old_1" and hits[0]["score"] == pytest.approx(1.0, abs=1e-5)